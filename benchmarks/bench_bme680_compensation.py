@@ -0,0 +1,130 @@
+"""
+Float against integer compensation of the BME680 driver.
+
+Runs micropython_sensor/bme680i2c.py against FakeBME680I2C
+(tests/fake_bme680.py) and, for every raw ADC vector of RAW_VECTORS:
+    - checks that read_all_fixed() agrees with read_all() within the
+      resolution of the integer results (see TOLERANCES)
+    - measures the time and the memory allocated per compensation of the four
+      values, from the raw data registers (no I2C traffic), for the float path
+      (read_all) and the integer path (read_all_fixed)
+It exits with 1 if a value is out of tolerance.
+
+On the micropython unix port the integer path runs with the native and viper
+code emitters, and the allocations are measured with gc.mem_alloc(). On
+CPython every int is an object: the allocations of the integer path are only
+representative on micropython, where its intermediate values stay within the
+small int range (see tests/test_bme680_compensation.py).
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_bme680_compensation.py -n 20000
+    MICROPYPATH=.:micropython_sensor micropython benchmarks/bench_bme680_compensation.py 2000
+"""
+
+import sys
+import time
+import gc
+
+from tests.fake_bme680 import FakeBME680I2C, RAW_VECTORS
+import bme680i2c
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+#   largest difference between the float value and the integer one, in the float units:
+#   temperature C, humidity RH %, pressure hPa, gas resistance ohms (relative)
+TOLERANCES = (0.02, 0.05, 0.1, 0.001)
+NAMES = ("temperature", "humidity", "pressure", "gas")
+
+
+def fixed_to_float(values: tuple) -> tuple:
+    return values[0] / 100, values[1] / 1000, values[2] / 100, values[3]
+
+
+def check(bme, i2c: FakeBME680I2C) -> bool:
+    ok = True
+    print(f"{'vector':<7} {'':<12} {'float':>14} {'fixed':>14} {'diff':>10}")
+    for n, raw in enumerate(RAW_VECTORS):
+        i2c.set_raw(*raw)
+        float_values = bme.read_all()
+        fixed_values = fixed_to_float(bme.read_all_fixed())
+        for i in range(4):
+            diff = abs(float_values[i] - fixed_values[i])
+            tolerance = TOLERANCES[i] * (float_values[i] if i == 3 else 1)
+            failed = diff > tolerance
+            ok = ok and not failed
+            print(f"{n:<7} {NAMES[i]:<12} {float_values[i]:>14.3f} {fixed_values[i]:>14.3f} "
+                  f"{diff:>10.4f}{'  FAILED' if failed else ''}")
+    return ok
+
+
+def compensate_float(bme, data):
+    bme._parse_reading(data, False)
+    return bme._temperature(), bme._humidity(), bme._pressure(), bme._gas()
+
+
+def compensate_fixed(bme, data):
+    bme._parse_reading(data, True)
+    return bme._compensate_fixed()
+
+
+def allocated(function, bme, data) -> int:
+    """ Bytes allocated by a call of function. """
+    function(bme, data)     #   warm up
+    if tracemalloc is not None:
+        tracemalloc.start()
+        function(bme, data)
+        size = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    function(bme, data)
+    size = gc.mem_alloc() - before
+    gc.enable()
+    return size
+
+
+def elapsed_us(function, bme, data, count: int) -> float:
+    if hasattr(time, 'ticks_us'):
+        start = time.ticks_us()
+        for i in range(count):
+            function(bme, data)
+        return time.ticks_diff(time.ticks_us(), start) / count
+    start = time.perf_counter_ns()
+    for i in range(count):
+        function(bme, data)
+    return (time.perf_counter_ns() - start) / 1000 / count
+
+
+def main():
+    count = 20000
+    if len(sys.argv) > 2 and sys.argv[1] == "-n":
+        count = int(sys.argv[2])
+    elif len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    i2c = FakeBME680I2C()
+    bme = bme680i2c.BME680_I2C(i2c, refresh_rate=1000)
+    ok = check(bme, i2c)
+
+    i2c.set_raw(*RAW_VECTORS[0])
+    bme.read_all()
+    data = bytes(bme._read(0x1D, 15))
+
+    print(f"compensations: {count}")
+    print(f"{'path':<8} {'us/reading':>10} {'bytes allocated':>16}")
+    for name, function in (("float", compensate_float), ("fixed", compensate_fixed)):
+        print(f"{name:<8} {elapsed_us(function, bme, data, count):>10.2f} "
+              f"{allocated(function, bme, data):>16}")
+
+    print("ok" if ok else "FAILED")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+I2C traffic of the BME680 driver, on a fake I2C bus.
+
+Runs micropython_sensor/bme680i2c.py on the host against FakeBME680I2C
+(tests/fake_bme680.py) and reports the I2C transactions and bytes of:
+    - init: soft reset, chip id, calibration and heater set up
+    - first: the first read_all(), that writes the configuration registers
+    - read_all: the following read_all(), where only CTRL_MEAS is written
+    - properties: the four properties read one after the other
+    - changed: a read_all() after a change of the filter size
+and the same for per-register writes (one writeto_mem per register, as the
+driver did before the burst writes). It checks that the configuration
+registers are not rewritten while unchanged and that the read buffers are
+reused, and exits with 1 if they are not.
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_bme680_i2c.py
+"""
+
+import sys
+
+from tests.fake_bme680 import FakeBME680I2C
+import bme680i2c
+
+#   configuration registers: CTRL_GAS, CTRL_HUM and CONFIG
+CONFIG_REGISTERS = (0x71, 0x72, 0x75)
+
+
+class PerRegisterBME680(bme680i2c.BME680_I2C):
+    """ One writeto_mem per register written. """
+
+    def _write_pairs(self, pairs):
+        bme680i2c.Adafruit_BME680._write_pairs(self, pairs)
+
+
+def traffic(i2c: FakeBME680I2C, action) -> tuple:
+    i2c.reset_counters()
+    action()
+    return i2c.transactions, i2c.bytes, i2c.measurements
+
+
+def run(name: str, driver_class) -> bool:
+    i2c = FakeBME680I2C()
+    ok = True
+
+    #   refresh_rate high enough for the refresh time not to be slept
+    bme = [None]
+    def init():
+        bme[0] = driver_class(i2c, refresh_rate=1000)
+    rows = [("init",) + traffic(i2c, init)]
+    bme = bme[0]
+
+    rows.append(("first",) + traffic(i2c, bme.read_all))
+    rows.append(("read_all",) + traffic(i2c, bme.read_all))
+    if any(register in i2c.writes for register in CONFIG_REGISTERS):
+        ok = False
+    buffers = dict(bme._buffers)
+
+    rows.append(("properties",) + traffic(i2c, lambda: (bme.temperature, bme.humidity,
+                                                         bme.pressure, bme.gas)))
+    if any(register in i2c.writes for register in CONFIG_REGISTERS):
+        ok = False
+    if any(bme._buffers[length] is not buf for length, buf in buffers.items()):
+        ok = False
+
+    def change_filter():
+        bme._filter = 0b011
+        bme.read_all()
+    rows.append(("changed",) + traffic(i2c, change_filter))
+    if i2c.writes.get(0x75) != 1 or 0x71 in i2c.writes or 0x72 in i2c.writes:
+        ok = False
+
+    print(name)
+    print(f"  {'':<12} {'transactions':>12} {'bytes':>6} {'measurements':>12}")
+    for row in rows:
+        print(f"  {row[0]:<12} {row[1]:>12} {row[2]:>6} {row[3]:>12}")
+    return ok
+
+
+def main():
+    ok = run("burst writes", bme680i2c.BME680_I2C)
+    ok = run("per-register writes", PerRegisterBME680) and ok
+    print("ok" if ok else "FAILED")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
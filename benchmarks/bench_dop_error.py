@@ -0,0 +1,122 @@
+"""
+Allocations made for the results of a published message.
+
+A message published by dvco_sensor.py gets a result at three levels: the
+output write, the publish callback and the pub stack dopify. The benchmark
+compares, per message:
+    - legacy: a new DopError as it was before __slots__ (instance dict and
+      LogSeverity lookup) at every level
+    - slots:  a new DopError at every level
+    - shared: the shared DOP_OK result, i.e. the current success path
+and counts the DopError objects actually created per message by the pub stack
+stub, in direct and in queue mode, with a publish callback that returns DOP_OK.
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_dop_error.py -n 200000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from common.python.error import DopError, DOP_OK, LogSeverity
+from dvco_stub.pub_stack_stub import PubStackStub
+
+
+class LegacyDopError:
+    """ DopError before __slots__, for comparison. """
+
+    def __init__(self, code: int=0, msg: str=""):
+        self._code: int = code
+        self._msg: str = msg
+        self._recoverable: bool = True
+        self._logSeverity: LogSeverity = LogSeverity.DEBUG
+        self._perr = None
+
+    def isError(self) -> bool:
+        return (self._code != 0)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="DopError allocations per published message.")
+    parser.add_argument("-n", "--messages", type=int, default=200000,
+        help="Number of messages per run.")
+    return parser.parse_args()
+
+
+def bytes_per_object(factory) -> float:
+    count = 10000
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    objects = [factory() for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    #   the list holding the objects is not part of the cost
+    return (size - 8 * len(objects)) / count
+
+
+def publish_chain(factory, messages: int) -> float:
+    """ ns per message of the write -> publish -> dopify result chain. """
+
+    def write(payload):
+        return factory()
+
+    def publish(payload):
+        err = write(payload)
+        return err if err.isError() else factory()
+
+    def dopify(payload):
+        publish(payload)
+        return factory(), payload
+
+    payload = b'x' * 200
+    start = time.perf_counter_ns()
+    for i in range(messages):
+        dopify(payload)
+    return (time.perf_counter_ns() - start) / messages
+
+
+def stub_objects_per_message(messages: int, queue: bool) -> float:
+    created = [0]
+    init = DopError.__init__
+
+    def counting_init(self, *args):
+        created[0] += 1
+        init(self, *args)
+
+    pub_stack = PubStackStub()
+    pub_stack.init({'queue': 1, 'queue_size': 0} if queue else {})
+    pub_stack.set_pub_callback(lambda payload, userdata: DOP_OK)
+
+    payload = b'x' * 200
+    DopError.__init__ = counting_init
+    try:
+        for i in range(messages):
+            pub_stack.dopify(payload)
+            if queue and i % 32 == 31:
+                pub_stack.pump()
+        pub_stack.pump()
+    finally:
+        DopError.__init__ = init
+    return created[0] / messages
+
+
+def main():
+    args = get_args()
+    shared = lambda: DOP_OK
+
+    print(f"messages: {args.messages}")
+    print(f"{'result':<8} {'objects/msg':>12} {'bytes/object':>13} {'ns/msg':>8}")
+    for name, factory, objects in (("legacy", LegacyDopError, 3),
+                                   ("slots", DopError, 3),
+                                   ("shared", shared, 0)):
+        size = bytes_per_object(factory) if objects > 0 else 0
+        print(f"{name:<8} {objects:>12} {size:>13.0f} {publish_chain(factory, args.messages):>8.0f}")
+
+    print(f"pub stack stub, DopError created per message: "
+          f"direct {stub_objects_per_message(args.messages, False):.2f}, "
+          f"queue {stub_objects_per_message(args.messages, True):.2f}")
+
+
+if __name__ == "__main__":
+    main()
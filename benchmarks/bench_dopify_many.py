@@ -0,0 +1,82 @@
+"""
+Throughput of per-message dopify() against batched dopify_many() on the
+pub stack stub.
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_dopify_many.py -n 100000 -b 64 -c 20
+
+-c simulates a fixed cost, in microseconds, paid once per callback invocation
+(e.g. a network round trip or the set up of an encryption context).
+"""
+
+import argparse
+import time
+
+from common.python.error import DopError
+from dvco_stub.pub_stack_stub import PubStackStub
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="dopify vs dopify_many throughput.")
+    parser.add_argument("-n", "--messages", type=int, default=100000,
+        help="Number of messages per run.")
+    parser.add_argument("-b", "--batch", type=int, default=64,
+        help="Batch size for dopify_many.")
+    parser.add_argument("-s", "--size", type=int, default=200,
+        help="Payload size in bytes.")
+    parser.add_argument("-c", "--call-cost", type=float, default=0,
+        help="Simulated cost of a callback invocation, in microseconds.")
+    return parser.parse_args()
+
+
+def busy_wait(us: float):
+    if us <= 0:
+        return
+    end = time.perf_counter() + us / 1000000
+    while time.perf_counter() < end:
+        pass
+
+
+def run(args, batched: bool) -> float:
+    call_cost: float = args.call_cost
+
+    def callback(payload, userdata) -> DopError:
+        busy_wait(call_cost)
+        return DopError()
+
+    def batch_callback(payloads: list, userdata) -> list:
+        busy_wait(call_cost)
+        return [DopError()] * len(payloads)
+
+    pub_stack = PubStackStub()
+    pub_stack.init({})
+    pub_stack.set_pub_callback(callback)
+    if batched:
+        pub_stack.set_pub_batch_callback(batch_callback)
+
+    payload: bytes = b'x' * args.size
+    messages: list = [payload] * args.batch
+
+    start = time.perf_counter()
+    if batched:
+        for i in range(args.messages // args.batch):
+            pub_stack.dopify_many(messages)
+        sent = (args.messages // args.batch) * args.batch
+    else:
+        for i in range(args.messages):
+            pub_stack.dopify(payload)
+        sent = args.messages
+    return sent / (time.perf_counter() - start)
+
+
+def main():
+    args = get_args()
+    single = run(args, False)
+    batched = run(args, True)
+    print(f"messages: {args.messages}  payload: {args.size} B  call cost: {args.call_cost} us")
+    print(f"dopify            : {single:12.0f} msg/s")
+    print(f"dopify_many ({args.batch:4d}): {batched:12.0f} msg/s  ({batched / single:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
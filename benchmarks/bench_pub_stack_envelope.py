@@ -0,0 +1,77 @@
+"""
+Cost of envelope encryption (PubStackEnvelope) against the pass-through stub:
+messages per second, bytes of overhead per message and cost of a session key
+derivation.
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_pub_stack_envelope.py -n 20000 -s 64 200 1024
+"""
+
+import argparse
+import time
+
+from common.python.error import DopError
+from dvco_stub.pub_stack_stub import PubStackStub
+from dvco_stub.pub_stack_envelope import PubStackEnvelope, ENVELOPE_OVERHEAD, _SessionKey
+
+
+PRODUCT_CONF = {"loop_interval": 5000, "product_id": "bench", "product_key": "bench-product-key",
+                "key_rotation": 3600}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Envelope encryption cost.")
+    parser.add_argument("-n", "--messages", type=int, default=20000,
+        help="Number of messages per run.")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[64, 200, 1024],
+        help="Payload sizes in bytes.")
+    return parser.parse_args()
+
+
+def throughput(pub_stack, payload: bytes, messages: int) -> tuple:
+    sizes: list = []
+
+    def callback(mess, userdata) -> DopError:
+        sizes.append(len(mess))
+        return DopError()
+
+    pub_stack.set_pub_callback(callback)
+    start = time.perf_counter()
+    for i in range(messages):
+        pub_stack.dopify(payload)
+    elapsed = time.perf_counter() - start
+    return messages / elapsed, sizes[-1] - len(payload)
+
+
+def main():
+    args = get_args()
+
+    stub = PubStackStub()
+    stub.init(PRODUCT_CONF)
+    envelope = PubStackEnvelope()
+    err = envelope.init(PRODUCT_CONF)
+    if err.isError():
+        print(err)
+        return
+
+    #   round trip check
+    err, clear = envelope.unseal(envelope.seal(b"round trip"))
+    assert not err.isError() and clear == b"round trip", err
+
+    print(f"envelope overhead: {ENVELOPE_OVERHEAD} B")
+    print(f"{'size':>6} {'stub msg/s':>12} {'envelope msg/s':>15} {'MB/s':>8} {'overhead':>9}")
+    for size in args.sizes:
+        payload = bytes(i & 0xFF for i in range(size))
+        stub_rate, ignored = throughput(stub, payload, args.messages)
+        env_rate, overhead = throughput(envelope, payload, args.messages)
+        print(f"{size:>6} {stub_rate:>12.0f} {env_rate:>15.0f} {env_rate * size / 1e6:>8.2f} {overhead:>7} B")
+
+    rounds = 1000
+    start = time.perf_counter()
+    for epoch in range(rounds):
+        _SessionKey(envelope._product_key, envelope._product_id, epoch)
+    print(f"session key derivation: {(time.perf_counter() - start) / rounds * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Timed wait of the DopStopEvent implementations.
+
+Reports the timings of wait(timeout) on every implementation available on
+the platform (the threading based one and the micropython one on CPython,
+the micropython one on micropython); their behaviour is checked by
+tests/test_stop_event.py. Measured:
+    - timeout: time actually slept by wait(timeout), and its result (False)
+    - wake-up: delay between stop() in another thread and the return of wait
+    - stopped: time taken by wait on an event that is already stopped
+    - cpu: share of a CPU used during a wait (CPython only)
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_stop_event.py
+    MICROPYPATH=.:~/.micropython/lib micropython benchmarks/bench_stop_event.py
+"""
+
+import sys
+import time
+import _thread
+
+from common.python.clock import ticks_us, ticks_diff
+import common.python.dop_stop_event_mpy as dop_stop_event_mpy
+
+
+def sleep_s(s: float):
+    if hasattr(time, 'sleep_ms'):
+        time.sleep_ms(int(s * 1000))
+    else:
+        time.sleep(s)
+
+
+def cpu_time() -> float:
+    return time.process_time() if hasattr(time, 'process_time') else -1
+
+
+def report(name: str, event_class, timeout: float):
+    #   timeout expires
+    event = event_class()
+    cpu = cpu_time()
+    start = ticks_us()
+    res = event.wait(timeout)
+    slept_ms = ticks_diff(ticks_us(), start) / 1000
+    cpu = (cpu_time() - cpu) / timeout if cpu >= 0 else -1
+
+    #   stop from another thread
+    event = event_class()
+    stopped_at = [0]
+
+    def stopper():
+        sleep_s(timeout / 2)
+        stopped_at[0] = ticks_us()
+        event.stop()
+
+    _thread.start_new_thread(stopper, ())
+    res_stop = event.wait(timeout * 4)
+    wake_ms = ticks_diff(ticks_us(), stopped_at[0]) / 1000
+
+    #   already stopped
+    start = ticks_us()
+    res_stopped = event.wait(timeout)
+    stopped_ms = ticks_diff(ticks_us(), start) / 1000
+
+    print("%-10s timeout %7.1f ms (%s)  wake-up %6.2f ms (%s)  stopped %6.3f ms (%s)  cpu %s" % (
+        name, slept_ms, res, wake_ms, res_stop, stopped_ms, res_stopped,
+        "n/a" if cpu < 0 else "%4.1f%%" % (cpu * 100)))
+
+
+def main():
+    timeout = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    implementations = [("mpy", dop_stop_event_mpy.DopStopEvent)]
+    try:
+        import common.python.dop_stop_event as dop_stop_event
+        implementations.insert(0, ("threading", dop_stop_event.DopStopEvent))
+    except ImportError:
+        pass
+
+    for name, event_class in implementations:
+        report(name, event_class, timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+RAM and time spent per sample by the micropython sensor programs.
+
+Runs the BME680 driver on the fake I2C bus of tests/fake_bme680.py and a
+fake MQTT session, and reports:
+    - per sample, for the payload built as the programs used to (a dict of
+      formatted strings, json.dumps, encode, gc.collect() at every sample)
+      and as they do now (SamplePayload filled in place, copied in the
+      preallocated outbox of MqttLink, threshold GC): the bytes allocated and
+      the time taken, the sensor read excluded; the sensor read is reported
+      on its own
+    - the runtime: the sampling and mqtt tasks of sens_runtime.py run for a
+      few seconds with a short sample interval; the lateness of the samples
+      against their schedule and the heap in use (lowest and highest)
+
+The figures are meant for the micropython unix port. The benchmark also runs
+on CPython, with the host fallbacks of the modules (the ticks of
+common/python/clock.py, the uasyncio functions on top of asyncio): there the
+allocations are those traced by tracemalloc, i.e. the memory still held by
+live objects, not the bytes allocated, and they do not compare with the
+micropython ones.
+
+usage (from the repository root):
+    MICROPYPATH=.:micropython_sensor micropython benchmarks/bench_upy_sample_loop.py [samples] [seconds]
+    PYTHONPATH=.:micropython_sensor python benchmarks/bench_upy_sample_loop.py [samples] [seconds]
+"""
+
+import gc
+import json
+import sys
+
+try:
+    import utime
+except ImportError:
+    from common.python import clock as utime
+
+from tests.fake_bme680 import FakeBME680I2C
+import bme680i2c
+from sens_payload import SamplePayload
+from sens_mqtt import PUBACK
+from sens_runtime import asyncio, set_gc_threshold, Liveness, MqttLink, sampling_task
+
+try:
+    mem_alloc = gc.mem_alloc
+    mem_free = gc.mem_free
+except AttributeError:
+    #   CPython: the memory held by the objects traced since the start, no free heap figure
+    import tracemalloc
+    tracemalloc.start()
+
+    def mem_alloc() -> int:
+        return tracemalloc.get_traced_memory()[0]
+
+    def mem_free() -> int:
+        return 0
+
+
+class FakeSession:
+    """ MqttSession that acknowledges every QoS 1 message at once. """
+
+    keepalive = 60
+    published = 0
+
+    def __init__(self):
+        self.connected = False
+        self.acked_pid = 0
+        self._acks = []
+
+    def connect(self):
+        self.connected = True
+        return False
+
+    def close(self, disconnect=False):
+        self.connected = False
+
+    def publish(self, topic, payload, qos, pid, dup=False):
+        FakeSession.published += 1
+        if qos > 0:
+            self._acks.append(pid)
+
+    def ping(self):
+        pass
+
+    def read_packet(self):
+        if not self._acks:
+            return 0
+        self.acked_pid = self._acks.pop(0)
+        return PUBACK
+
+
+class FakeNic:
+
+    def isconnected(self):
+        return True
+
+
+def legacy_payload(counter: int, values, outbox: list, collect: bool):
+    #   the payload of the programs before SamplePayload, floats included, as the baseline
+    payload = {
+        "payload_number": str(counter),
+        "mem": str(mem_free())
+        }
+    r_temperature, r_humidity, r_pressure, r_gas = values
+    payload["temp"] = f"{str(r_temperature / 100)} C"
+    payload["hum"] = f"{str(round(r_humidity / 1000, 2))} %"
+    payload["press"] = f"{str(r_pressure / 100)} hPa"
+    payload["voc"] = f"{str(round(r_gas/1000, 2))} KOhms"
+    payload["err"] = "0"
+    outbox.append(json.dumps(payload).encode("UTF-8"))
+    outbox.pop(0)
+    if collect:
+        gc.collect()
+
+
+def measure(name: str, step, samples: int):
+    """ step(counter, collect): collect is False while the allocations are measured. """
+    #   allocations, with the collector disabled so that they are not reclaimed,
+    #   over a number of samples that fits in the heap
+    allocation_samples = min(samples, 100)
+    step(0, False)
+    gc.collect()
+    gc.disable()
+    before = mem_alloc()
+    for i in range(allocation_samples):
+        step(i, False)
+    allocated = mem_alloc() - before
+    gc.enable()
+
+    gc.collect()
+    start = utime.ticks_us()
+    for i in range(samples):
+        step(i, True)
+    elapsed = utime.ticks_diff(utime.ticks_us(), start)
+    print(f"{name:<10} {allocated // allocation_samples:>12} {elapsed / samples:>10.1f}")
+
+
+async def run_runtime(bme, seconds: int, interval_ms: int):
+    liveness = Liveness()
+    liveness.register("sampling", 10000)
+    liveness.register("mqtt", 10000)
+    link = MqttLink(FakeSession(), b"sens/bench", 1)
+    payload = SamplePayload()
+
+    lateness = [0, 0, 0]        #   total ms, max ms, samples
+    heap = [mem_alloc(), mem_alloc()]
+
+    def on_sample(counter: int, values):
+        late = utime.ticks_diff(utime.ticks_ms(), start) - counter * interval_ms - bme_ms
+        lateness[0] += late
+        lateness[1] = max(lateness[1], late)
+        lateness[2] += 1
+        link.publish(payload.fill(counter, mem_free(), values))
+        used = mem_alloc()
+        heap[0] = min(heap[0], used)
+        heap[1] = max(heap[1], used)
+
+    bme_ms = bme._measurement_ms()
+    start = utime.ticks_ms()
+    asyncio.create_task(link.run(FakeNic(), liveness))
+    sampler = asyncio.create_task(sampling_task(bme, interval_ms, on_sample, liveness))
+    await asyncio.sleep_ms(seconds * 1000)
+    sampler.cancel()
+
+    samples = max(1, lateness[2])
+    print(f"runtime: {lateness[2]} samples every {interval_ms} ms, {FakeSession.published} published, "
+          f"{link.dropped} dropped")
+    print(f"  lateness: mean {lateness[0] / samples:.1f} ms, max {lateness[1]} ms")
+    print(f"  heap in use: {heap[0]} .. {heap[1]} bytes")
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    i2c = FakeBME680I2C()
+    bme = bme680i2c.BME680_I2C(i2c, refresh_rate=1000)
+    values = bme.read_all_fixed()
+
+    print(f"samples: {samples}")
+    print(f"{'payload':<10} {'bytes/sample':>12} {'us/sample':>10}")
+    outbox = [b""]
+    measure("legacy", lambda counter, collect: legacy_payload(counter, values, outbox, collect), samples)
+    set_gc_threshold()
+    link = MqttLink(FakeSession(), b"sens/bench", 1)
+    payload = SamplePayload()
+
+    def in_place(counter: int, collect: bool):
+        link.publish(payload.fill(counter, mem_free(), values))
+        #   what the mqtt task does once the payload is acknowledged
+        link._pop()
+
+    measure("in place", in_place, samples)
+    measure("sensor", lambda counter, collect: bme.read_all_fixed(), samples)
+
+    asyncio.run(run_runtime(bme, seconds, 250))
+
+
+if __name__ == "__main__":
+    main()
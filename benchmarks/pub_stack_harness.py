@@ -0,0 +1,141 @@
+"""
+Shared benchmark harness for the registered pub stacks.
+
+Every stack runs the same workload in a fresh interpreter, so that startup
+time (module import + init) and memory are measured cold and independently:
+    - startup: time to load the implementation and run init, in ms
+    - throughput: messages per second from the first dopify to the last delivery
+    - latency: dopify-to-callback delivery time, p50 and p99, in us
+    - memory: allocations retained after init and peak during the workload, in KB
+All the figures are taken with tracemalloc active: they are meant to compare
+the stacks with each other.
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/pub_stack_harness.py -n 20000 -s 200
+    PYTHONPATH=. python benchmarks/pub_stack_harness.py --stacks stub envelope --queue
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+PRODUCT_CONF = {"loop_interval": 5000, "product_id": "bench", "product_key": "bench-product-key",
+                "key_rotation": 3600}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Pub stack comparative benchmark.")
+    parser.add_argument("--stacks", nargs="+", default=None,
+        help="Names of the stacks to run (default: all the registered ones).")
+    parser.add_argument("-n", "--messages", type=int, default=20000,
+        help="Number of messages of the workload.")
+    parser.add_argument("-s", "--size", type=int, default=200,
+        help="Payload size in bytes.")
+    parser.add_argument("-b", "--batch", type=int, default=0,
+        help="Use dopify_many with batches of this size (0: dopify).")
+    parser.add_argument("--queue", action="store_true",
+        help="Run the stacks in queue mode, drained by pump() after every batch.")
+    parser.add_argument("--run", default=None,
+        help=argparse.SUPPRESS)     #   internal: run a single stack and print its results
+    return parser.parse_args()
+
+
+def percentile(values: list, p: float) -> float:
+    if len(values) == 0:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_stack(name: str, args) -> dict:
+    from common.python.error import DopError
+
+    conf = dict(PRODUCT_CONF)
+    conf['pub_stack'] = name
+    if args.queue:
+        conf.update({'queue': 1, 'queue_size': 0})
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    from dvco_stub.registry import create_pub_stack
+    err, pub_stack = create_pub_stack(conf)
+    startup = time.perf_counter() - start
+    if err.isError():
+        return {'stack': name, 'error': err.msg}
+    startup_mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+
+    delivered: list = []
+
+    def callback(mess, userdata) -> DopError:
+        delivered.append(time.perf_counter())
+        return DopError()
+
+    pub_stack.set_pub_callback(callback)
+
+    payload: bytes = bytes(i & 0xFF for i in range(args.size))
+    batch: int = args.batch if args.batch > 0 else 64
+    sent: list = []
+
+    start = time.perf_counter()
+    for first in range(0, args.messages, batch):
+        count = min(batch, args.messages - first)
+        if args.batch > 0:
+            sent.extend([time.perf_counter()] * count)
+            pub_stack.dopify_many([payload] * count)
+        else:
+            for i in range(count):
+                sent.append(time.perf_counter())
+                pub_stack.dopify(payload)
+        if args.queue:
+            pub_stack.pump()
+    elapsed = time.perf_counter() - start
+
+    peak_mem = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = [(delivered[i] - sent[i]) * 1e6 for i in range(min(len(sent), len(delivered)))]
+    return {'stack': name,
+            'startup_ms': round(startup * 1000, 2),
+            'msg_s': round(len(delivered) / elapsed),
+            'p50_us': round(percentile(latencies, 0.50), 1),
+            'p99_us': round(percentile(latencies, 0.99), 1),
+            'init_kb': round(startup_mem / 1024, 1),
+            'peak_kb': round(peak_mem / 1024, 1)}
+
+
+def main():
+    args = get_args()
+    if args.run is not None:
+        print(json.dumps(run_stack(args.run, args)))
+        return
+
+    from dvco_stub.registry import pub_stack_names
+    names = args.stacks if args.stacks is not None else pub_stack_names()
+
+    mode = "queue" if args.queue else "sync"
+    call = f"dopify_many({args.batch})" if args.batch > 0 else "dopify"
+    print(f"messages: {args.messages}  payload: {args.size} B  mode: {mode}  call: {call}")
+    print(f"{'stack':<12} {'startup ms':>10} {'msg/s':>10} {'p50 us':>9} {'p99 us':>9} {'init KB':>8} {'peak KB':>8}")
+
+    for name in names:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", name] + sys.argv[1:],
+                             capture_output=True, text=True, env=os.environ)
+        if out.returncode != 0:
+            print(f"{name:<12} failed: {out.stderr.strip().splitlines()[-1:]}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        if 'error' in r:
+            print(f"{name:<12} {r['error']}")
+            continue
+        print(f"{name:<12} {r['startup_ms']:>10} {r['msg_s']:>10} {r['p50_us']:>9} {r['p99_us']:>9} "
+              f"{r['init_kb']:>8} {r['peak_kb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
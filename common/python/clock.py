@@ -0,0 +1,30 @@
+"""
+Minimalistic implementation of platform's monotonic clock
+
+On micropython the ticks functions of the time module are used as they are;
+on CPython they are emulated on top of time.monotonic_ns, so that the same
+code can measure elapsed times on both platforms.
+"""
+
+import time
+
+try:
+    ticks_ms = time.ticks_ms
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+    ticks_add = time.ticks_add
+
+except AttributeError:
+
+    def ticks_ms() -> int:
+        return time.monotonic_ns() // 1000000
+
+    def ticks_us() -> int:
+        return time.monotonic_ns() // 1000
+
+    def ticks_diff(ticks1: int, ticks2: int) -> int:
+        """ Signed difference ticks1 - ticks2. """
+        return ticks1 - ticks2
+
+    def ticks_add(ticks: int, delta: int) -> int:
+        return ticks + delta
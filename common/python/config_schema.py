@@ -0,0 +1,115 @@
+"""
+Declarative schema of the k=v; configuration strings
+
+A ConfigSchema lists the fields of a configuration section, with their
+aliases, type and default value. compile() parses a configuration string in
+a single pass, and returns a frozen object whose attributes are the typed
+values of the fields: the accessors of the hot paths are plain attribute
+reads, and a malformed, unknown or invalid item is reported with its position
+in the string when the configuration is loaded. The checks of a schema relate
+several fields, e.g. a maximum not below its minimum.
+"""
+
+from collections import namedtuple
+
+from common.python.error import DopError
+
+try:
+    from typing import Tuple
+except ImportError:
+    Tuple = tuple
+
+
+def _to_bool(value: str) -> bool:
+    if value in ("1", "true", "True"):
+        return True
+    if value in ("0", "false", "False"):
+        return False
+    raise ValueError(value)
+
+
+def _to_hex(value: str) -> int:
+    return int(value, 16)
+
+
+class ConfigField:
+    """ Field of a schema: keys[0] is the canonical key, the others are its aliases. """
+
+    _converters: dict = {str: str, int: int, bool: _to_bool, 'hex': _to_hex}
+
+    def __init__(self, name: str, keys: list, kind = str, default = None, required: bool = False,
+                 min_value: int = None, max_value: int = None):
+        self.name: str = name
+        self.keys: list = keys
+        self.kind = kind
+        self.default = default
+        self.required: bool = required
+        self.min_value: int = min_value
+        self.max_value: int = max_value
+        self._convert = ConfigField._converters[kind]
+
+    def convert(self, value: str):
+        """ Return the typed value, raise ValueError if value is not valid. """
+        v = self._convert(value)
+        if self.min_value is not None and v < self.min_value:
+            raise ValueError(value)
+        if self.max_value is not None and v > self.max_value:
+            raise ValueError(value)
+        return v
+
+
+class ConfigSchema:
+    """ checks is a list of (check, message): check(config) returns False if the
+    compiled configuration is not valid, message tells why. """
+
+    def __init__(self, section: str, fields: list, checks: list = ()):
+        self._section: str = section
+        self._fields: list = fields
+        self._checks: list = list(checks)
+        self._by_key: dict = {}
+        for field in fields:
+            for key in field.keys:
+                self._by_key[key] = field
+        self._type = namedtuple(section.capitalize() + "Config", [field.name for field in fields])
+
+    @property
+    def section(self) -> str:
+        return self._section
+
+    def compile(self, connstring: str) -> Tuple[DopError, object]:
+        """ Parse connstring into the frozen configuration object of the section. """
+        values: dict = {}
+        position: int = 1       #   1-based column of the current item
+        for item in connstring.split(';'):
+            key_position = position + len(item) - len(item.lstrip())
+            position += len(item) + 1
+            if len(item.strip()) == 0:
+                continue
+
+            if '=' not in item:
+                return DopError(5, f"{self._section}: malformed item '{item.strip()}' "
+                                   f"at position {key_position}"), None
+            key, value = item.split('=', 1)
+            key = key.strip()
+            field = self._by_key.get(key)
+            if field is None:
+                return DopError(6, f"{self._section}: unknown key '{key}' at position {key_position}"), None
+            if field.name in values:
+                return DopError(6, f"{self._section}: duplicated key '{key}' at position {key_position}"), None
+            try:
+                values[field.name] = field.convert(value.strip())
+            except ValueError:
+                return DopError(7, f"{self._section}: invalid value '{value.strip()}' for '{key}' "
+                                   f"at position {key_position}"), None
+
+        for field in self._fields:
+            if field.name not in values:
+                if field.required:
+                    return DopError(10, f"Missing arg: {self._section}: {field.keys[0]}"), None
+                values[field.name] = field.default
+
+        config = self._type(**values)
+        for check, message in self._checks:
+            if not check(config):
+                return DopError(8, f"{self._section}: {message}"), None
+        return DopError(), config
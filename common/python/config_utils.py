@@ -14,10 +14,16 @@ class ConfigUtils:
 
         conf: dict = {}
         d_conn: list = connstring.split(';')
+        position: int = 1
         for d_conn_item in d_conn:
-            if len(d_conn_item) > 0:
-                d_item = d_conn_item.split('=')
+            if len(d_conn_item.strip()) > 0:
+                if '=' not in d_conn_item:
+                    return DopError(5, f"Malformed configuration item '{d_conn_item.strip()}' "\
+                                       f"at position {position}"), conf
+                #   values may contain '='
+                d_item = d_conn_item.split('=', 1)
                 conf.update({d_item[0].strip():d_item[1].strip()})
+            position += len(d_conn_item) + 1
         return DopError(), conf
 
     @staticmethod
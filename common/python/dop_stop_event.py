@@ -6,9 +6,19 @@ class DopStopEvent:
     def __init__(self):
         self.i_stop_event = Event()
         self.i_stop_event.clear()
+        self._listeners = []
 
     def stop(self):
         self.i_stop_event.set()
+        for listener in list(self._listeners):
+            listener()
+
+    def add_listener(self, listener):
+        """ listener (a callable without arguments) is called when stop is invoked,
+        e.g. to wake up a thread that is blocked waiting for work """
+        self._listeners.append(listener)
+        if self.i_stop_event.is_set():
+            listener()
         
     def wait(self, timeout) -> bool:
         return self.i_stop_event.wait(timeout)
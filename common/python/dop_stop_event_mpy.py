@@ -1,24 +1,71 @@
 from _thread import allocate_lock
 import time
 
+from common.python.clock import ticks_ms, ticks_add, ticks_diff
+
+try:
+    _sleep_ms = time.sleep_ms
+except AttributeError:
+    def _sleep_ms(ms: int):
+        time.sleep(ms / 1000)
+
+#   micropython locks have no timed acquire: a timed wait checks its waiter
+#   lock every _WAIT_SLICE_MS, sleeping in between
+_WAIT_SLICE_MS = 20
+
+
 class DopStopEvent:
     def __init__(self):
         self.i_stop_event = False
         self._lock = allocate_lock()
+        self._waiters = []          #   locks held by the waiting threads, released by stop
+        self._listeners = []
 
     def stop(self):
         with self._lock:
             self.i_stop_event = True
+            waiters = self._waiters
+            self._waiters = []
+        for waiter in waiters:
+            waiter.release()
+        for listener in list(self._listeners):
+            listener()
+
+    def add_listener(self, listener):
+        """ listener (a callable without arguments) is called when stop is invoked """
+        self._listeners.append(listener)
+        if self.is_exiting():
+            listener()
         
-    def wait(self, timeout) -> bool:
-        res = self._lock.acquire(True,timeout)
-        if res:
-            self._lock.release()
-        return res
+    def wait(self, timeout = None) -> bool:
+        """ Block until stop is invoked or timeout seconds expire (None: no
+        timeout), return True if the event is stopped - as threading.Event.wait """
+        waiter = allocate_lock()
+        waiter.acquire()
+        with self._lock:
+            if self.i_stop_event:
+                return True
+            self._waiters.append(waiter)
+
+        try:
+            if timeout is None:
+                waiter.acquire()
+                return True
+
+            deadline = ticks_add(ticks_ms(), int(timeout * 1000))
+            while not waiter.acquire(0):
+                remaining = ticks_diff(deadline, ticks_ms())
+                if remaining <= 0:
+                    return self.is_exiting()
+                _sleep_ms(min(remaining, _WAIT_SLICE_MS))
+            return True
+        finally:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
  
 
     def is_exiting(self) -> bool:
         
         with self._lock: 
             return self.i_stop_event
-        
\ No newline at end of file
@@ -30,8 +30,13 @@ except Exception:
 import json
 
 
+_DEFAULT_SEVERITY = LogSeverity.DEBUG
+
+
 class DopError:
     
+    #   no instance dict: results are created on every publish
+    __slots__ = ('_code', '_msg', '_recoverable', '_logSeverity', '_perr')
 
     def __init__(self, code: int=0, msg: str=""):
         self._code: int = code         #   error code default value 0
@@ -42,7 +47,7 @@ class DopError:
         #   in order to flag the error as non recoverable, use method "rip" (rest in peace)
         self._recoverable: bool = True 
 
-        self._logSeverity: LogSeverity = LogSeverity.DEBUG #in micropython, this print the associated int
+        self._logSeverity: LogSeverity = _DEFAULT_SEVERITY #in micropython, this print the associated int
 
         self._perr: DopError = None
                                         
@@ -83,3 +88,50 @@ class DopError:
     def __repr__(self):
         perr = '' if self._perr is None else self._perr.to_dict()
         return json.dumps({'code':self._code, 'msg':self._msg, 'per':perr})
+
+
+
+class DopConstError(DopError):
+    """
+    Immutable DopError, to be shared instead of allocating a new result for
+    every call: it cannot be flagged as non recoverable nor chained to a
+    previous error (use a new DopError for that).
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        #   the attributes are set once, by DopError.__init__ (_perr last)
+        if hasattr(self, '_perr'):
+            raise AttributeError("DopConstError is immutable")
+        super().__setattr__(name, value)
+
+    def rip(self) -> bool:
+        raise AttributeError("DopConstError is immutable")
+
+    def _get_perr(self):
+        return self._perr
+
+    def _set_perr(self, perr):
+        raise AttributeError("DopConstError is immutable")
+
+    #   micropython properties have no fget: the getter is defined here
+    perr = property(_get_perr, _set_perr)
+
+
+#   shared success result
+DOP_OK = DopConstError()
+
+#   preallocated results of the errors returned on the publish path
+_dop_errors: dict = {
+    201: DopConstError(201, "An error occurred while publishing a message."),
+    202: DopConstError(202, "An exception occurred while publishing a message."),
+    301: DopConstError(301, "Pub stack queue full: message dropped."),
+}
+
+
+def dop_error(code: int, msg: str = "") -> DopError:
+    """ Return the preallocated result of code, or a new DopError(code, msg)
+    if code has none. """
+    err = _dop_errors.get(code)
+    return err if err is not None else DopError(code, msg)
@@ -0,0 +1,151 @@
+"""
+Accounting of the DopError results
+
+Results are counted by origin (the component that returned them, e.g.
+"mqtt.publish") and by code, including the errors chained with perr; code 0
+counts the successes, so that failure ratios can be computed. Every thread
+increments its own counters without taking a lock: the counters are merged
+only by snapshot(), that also reports the counts and rates since the previous
+snapshot, and reset() restarts them from zero. Snapshots are plain dicts that
+can be serialized to JSON.
+"""
+
+from common.python.error import DopError
+
+import json
+import os
+import time
+
+upy: bool
+try:
+    from threading import Lock, local
+
+    upy = False
+
+except ImportError:
+    upy = True
+    import _thread
+
+
+class DopErrorStats:
+
+    def __init__(self):
+        self._lock = _thread.allocate_lock() if upy else Lock()
+        #   micropython has no thread local storage: its threads share one set of counters
+        self._local = None if upy else local()
+        self._shared: dict = {}
+        self._counters: list = [self._shared]   #   [origin -> {code -> count}], one per thread
+
+        self._start: float = time.time()
+        self._last_time: float = self._start
+        self._last_totals: dict = {}
+
+
+    def _thread_counters(self) -> dict:
+        if self._local is None:
+            return self._shared
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = {}
+            self._local.counters = counters
+            with self._lock:
+                self._counters.append(counters)
+        return counters
+
+
+    def count(self, err: DopError, origin: str) -> DopError:
+        """ Count err, and the errors chained to it, under origin; return err. """
+        counters = self._thread_counters()
+        by_code = counters.get(origin)
+        if by_code is None:
+            by_code = {}
+            counters[origin] = by_code
+
+        e = err
+        while e is not None:
+            code = e.code
+            by_code[code] = by_code.get(code, 0) + 1
+            e = e.perr
+        return err
+
+
+    def totals(self) -> dict:
+        """ Counts since the start, merged across the threads: origin -> {code -> count}. """
+        with self._lock:
+            thread_counters = list(self._counters)
+
+        totals: dict = {}
+        for counters in thread_counters:
+            #   the copies are taken without the owner thread being stopped
+            for origin, by_code in list(counters.items()):
+                total = totals.get(origin)
+                if total is None:
+                    total = {}
+                    totals[origin] = total
+                for code, n in list(by_code.items()):
+                    total[code] = total.get(code, 0) + n
+        return totals
+
+
+    def snapshot(self) -> dict:
+        """ Totals by origin and code, with the counts and the error rate
+        (errors per second) since the previous snapshot. """
+        totals = self.totals()
+        with self._lock:
+            now = time.time()
+            elapsed = now - self._last_time
+            last_totals = self._last_totals
+            self._last_time = now
+            self._last_totals = totals
+
+        origins: dict = {}
+        for origin, by_code in totals.items():
+            previous = last_totals.get(origin, {})
+            total = sum(by_code.values())
+            errors = total - by_code.get(0, 0)
+            interval_total = total - sum(previous.values())
+            interval_errors = errors - (sum(previous.values()) - previous.get(0, 0))
+            origins[origin] = {
+                'total': total,
+                'errors': errors,
+                'codes': {str(code): n for code, n in by_code.items()},
+                'interval_total': interval_total,
+                'interval_errors': interval_errors,
+                'error_rate': round(interval_errors / elapsed, 3) if elapsed > 0 else 0,
+                'error_ratio': round(interval_errors / interval_total, 4) if interval_total > 0 else 0
+            }
+
+        return {'ts': int(now),
+                'uptime_s': int(now - self._start),
+                'interval_s': round(elapsed, 3),
+                'origins': origins}
+
+
+    def reset(self):
+        """ Restart all the counts from zero, e.g. for a new measurement period; a count
+        made by another thread while the counters are cleared may be lost. """
+        with self._lock:
+            for counters in self._counters:
+                counters.clear()
+            self._start = time.time()
+            self._last_time = self._start
+            self._last_totals = {}
+
+
+def write_snapshot(snapshot: dict, path: str) -> DopError:
+    """ Write snapshot as JSON to path, replacing the previous one atomically. """
+    tmp_path: str = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(snapshot))
+        if hasattr(os, 'replace'):
+            os.replace(tmp_path, path)
+        else:
+            os.rename(tmp_path, path)
+    except OSError as e:
+        return DopError(4, f"Cannot write error stats to {path}: {e}")
+    return DopError()
+
+
+#   process-wide accounting, shared by the providers
+global_error_stats = DopErrorStats()
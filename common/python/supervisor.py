@@ -0,0 +1,133 @@
+"""
+Minimalistic supervision of the program's worker threads
+
+A worker is a function that runs until the stop event is set. If the function
+raises, the supervisor logs the exception and runs the function again after a
+backoff delay that doubles at every consecutive failure, up to max_backoff.
+A worker that returns without raising is considered done and is not restarted.
+"""
+
+import sys
+import time
+import traceback
+from threading import Lock, Thread
+
+from common.python.threads import DopStopEvent
+
+
+class SupervisedWorker:
+
+    def __init__(self, name: str, target, args: tuple, kwargs: dict):
+        self._name: str = name
+        self._target = target
+        self._args: tuple = args
+        self._kwargs: dict = kwargs
+        self._thread: Thread = None
+
+        self._lock = Lock()
+        self._restarts: int = 0
+        self._failures: int = 0         #   consecutive failures, drives the backoff
+        self._last_error: str = ""
+        self._last_good: float = None   #   monotonic time of the last good reading
+        self._started: float = None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def restarts(self) -> int:
+        return self._restarts
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def beat(self):
+        """ To be called by the worker every time it produces a good reading. """
+        with self._lock:
+            self._last_good = time.monotonic()
+            self._failures = 0
+
+    def since_last_good(self) -> float:
+        """ Seconds since the last good reading (or since start, if none). """
+        with self._lock:
+            ref = self._last_good if self._last_good is not None else self._started
+        if ref is None:
+            return None
+        return time.monotonic() - ref
+
+    def status(self) -> dict:
+        since = self.since_last_good()
+        return {'alive': self.is_alive(),
+                'restarts': self._restarts,
+                'since_last_good': None if since is None else round(since, 1),
+                'last_error': self._last_error}
+
+
+class DopSupervisor:
+
+    def __init__(self, stop_event: DopStopEvent, min_backoff: float = 1.0, max_backoff: float = 60.0):
+        self._stop_event: DopStopEvent = stop_event
+        self._min_backoff: float = min_backoff
+        self._max_backoff: float = max(min_backoff, max_backoff)
+        self._workers: dict = {}
+
+    def add_worker(self, name: str, target, args: tuple = (), kwargs: dict = None) -> SupervisedWorker:
+        worker = SupervisedWorker(name, target, args, kwargs or {})
+        self._workers[name] = worker
+        return worker
+
+    def worker(self, name: str) -> SupervisedWorker:
+        return self._workers.get(name)
+
+    def beat(self, name: str):
+        worker = self._workers.get(name)
+        if worker is not None:
+            worker.beat()
+
+    def start(self):
+        for worker in self._workers.values():
+            worker._started = time.monotonic()
+            worker._thread = Thread(target=self._run, args=(worker,), name=worker.name)
+            worker._thread.start()
+
+    def status(self) -> dict:
+        return {name: worker.status() for name, worker in self._workers.items()}
+
+    def join(self, report_interval: float = 0, report=None):
+        """ Wait for all the workers to end.
+
+        If report_interval is positive, report is called with the status of
+        the workers every report_interval seconds until the stop event is set.
+        """
+        if report_interval > 0 and report is not None:
+            while not self._stop_event.wait(report_interval):
+                report(self.status())
+
+        for worker in self._workers.values():
+            if worker._thread is not None:
+                worker._thread.join()
+
+    def _backoff(self, worker: SupervisedWorker) -> float:
+        delay = self._min_backoff * (2 ** (worker._failures - 1))
+        return min(delay, self._max_backoff)
+
+    def _run(self, worker: SupervisedWorker):
+        while not self._stop_event.is_exiting():
+            try:
+                worker._target(*worker._args, **worker._kwargs)
+                return
+            except Exception as e:
+                with worker._lock:
+                    worker._failures += 1
+                    worker._last_error = f"{type(e).__name__}: {e}"
+                print(f"{int(time.time())} | worker {worker.name} failed | {type(e)} | "\
+                      f"{traceback.format_exc()}", file = sys.stderr)
+                sys.stderr.flush()
+
+            delay = self._backoff(worker)
+            print(f"restarting worker {worker.name} in {delay} s")
+            if self._stop_event.wait(delay):
+                return
+            with worker._lock:
+                worker._restarts += 1
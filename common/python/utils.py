@@ -5,7 +5,12 @@
 """
 Minimalistic implementation of platform's utils
 """
+import hashlib
+import marshal
 import os
+import stat
+import sys
+import time
 import yaml
  
 from typing import Tuple, Callable
@@ -14,8 +19,23 @@ from common.python.error import DopError
 from common.python.config_utils import ConfigUtils 
 
 
+#   libyaml parser, if PyYAML was built with it
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+#   parsed configuration files are cached in this folder, private to the user
+#   (DOP_CONFIG_CACHE="" disables the cache)
+_config_cache_dir: str = os.environ.get('DOP_CONFIG_CACHE',
+                                        os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                                                     os.path.join(os.path.expanduser("~"), ".cache"),
+                                                     "dop_config_cache"))
+_CONFIG_CACHE_VERSION = 1
+
+
 class DopUtils:
 
+    #   how the last configuration file was loaded, see config_load_stats()
+    _config_load_stats: dict = {}
+
     @staticmethod
     def config_to_dict(connstring: str) -> Tuple[DopError,dict]:
         return ConfigUtils.config_to_dict(connstring)
@@ -32,17 +52,98 @@ class DopUtils:
     @staticmethod
     def parse_yaml_configuration(confile: str) -> Tuple[DopError,dict]:
         conf: dict = {}
+        start = time.perf_counter()
         #   check if file exists
-        if os.path.exists(confile) == False:
+        try:
+            st = os.stat(confile)
+        except OSError:
             return (DopError(101,'Configuration file does not exist'), conf)
 
+        #   the cache entry is valid for the same path, modification time and size
+        key = (_CONFIG_CACHE_VERSION, os.path.abspath(confile), st.st_mtime_ns, st.st_size)
+        conf = DopUtils._config_cache_get(key)
+        if conf is not None:
+            DopUtils._set_config_load_stats(confile, "cache", start)
+            return (DopError(),conf)
+
         with open(confile,'r') as stream:
             try:
-                conf = yaml.safe_load(stream)
-                return (DopError(),conf)
+                conf = yaml.load(stream, Loader=_YamlLoader)
             except yaml.YAMLError as exc:
                 if hasattr(exc, 'problem_mark'):
                     mark = exc.problem_mark
                     msg =  f"Error in parsing configuration file: position ({(mark.line+1)}:{(mark.column+1)})"
-                    return (DopError(103,msg),conf)
+                    return (DopError(103,msg),{})
                 return(DopError(3,"conf file parsing error"),{})
+
+        DopUtils._config_cache_put(key, conf)
+        DopUtils._set_config_load_stats(confile, _YamlLoader.__name__, start)
+        return (DopError(),conf)
+
+    @staticmethod
+    def config_load_stats() -> dict:
+        """ file, source (cache or the YAML loader) and time in ms of the last
+        parse_yaml_configuration() """
+        return dict(DopUtils._config_load_stats)
+
+    @staticmethod
+    def _set_config_load_stats(confile: str, source: str, start: float):
+        DopUtils._config_load_stats = {'file': confile,
+                                       'source': source,
+                                       'load_ms': round((time.perf_counter() - start) * 1000, 3)}
+
+    @staticmethod
+    def _config_cache_path(key: tuple) -> str:
+        name = hashlib.sha1(key[1].encode("UTF-8")).hexdigest()
+        #   marshal data is specific to the interpreter version
+        return os.path.join(_config_cache_dir, f"{name}.{sys.version_info[0]}{sys.version_info[1]}.marshal")
+
+    @staticmethod
+    def _private(st: os.stat_result) -> bool:
+        """ True if the file or folder st belongs to the current user, and only
+        the user can write to it. """
+        if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+            return False
+        return st.st_mode & (stat.S_IWGRP | stat.S_IWOTH) == 0
+
+    @staticmethod
+    def _config_cache_ready(create: bool) -> bool:
+        """ The cache is used only if its folder is private to the user: another user
+        could otherwise plant a configuration in it. """
+        if not _config_cache_dir:
+            return False
+        try:
+            if create:
+                os.makedirs(_config_cache_dir, mode=0o700, exist_ok=True)
+            return DopUtils._private(os.stat(_config_cache_dir))
+        except OSError:
+            return False
+
+    @staticmethod
+    def _config_cache_get(key: tuple):
+        if not DopUtils._config_cache_ready(False):
+            return None
+        try:
+            with open(DopUtils._config_cache_path(key), 'rb') as f:
+                if not DopUtils._private(os.fstat(f.fileno())):
+                    return None
+                cached_key, conf = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return conf if cached_key == key else None
+
+    @staticmethod
+    def _config_cache_put(key: tuple, conf):
+        """ The cache is best effort: conf is not cached if it cannot be
+        marshalled (e.g. YAML timestamps) or written. """
+        if not DopUtils._config_cache_ready(True):
+            return
+        path = DopUtils._config_cache_path(key)
+        try:
+            data = marshal.dumps((key, conf))
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError):
+            return
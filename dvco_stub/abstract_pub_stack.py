@@ -1,10 +1,14 @@
 
+import time
+
 from common.python.error import DopError
 from common.python.threads import DopStopEvent
+from common.python.clock import ticks_ms, ticks_diff
 
 try:
     from typing import Callable, Tuple
     from abc import ABC, abstractmethod 
+    from threading import Event
     
 except ImportError:
 
@@ -12,6 +16,7 @@ except ImportError:
     
     Callable = callable
     Tuple = tuple
+    Event = None
 
     class ABC():
         def __init__(self):
@@ -30,8 +35,15 @@ class AbstractPubStack(ABC):
 
         # Callback 
 
+        #   payloads are handed to the callbacks as bytes-like objects (bytes, bytearray or memoryview),
+        #   without any decoding or copy: the callbacks are expected to write them as they are
         self._pub_callback: Callable = None #pub_callback needs to take as parameters: payload, userdata
+        self._pub_batch_callback: Callable = None #pub_batch_callback needs to take as parameters: list of payloads, userdata
         self._pub_userdata = None
+
+        # Pump scheduling
+        self._ready_event = None if Event is None else Event()    # set when pump is due (not on micropython)
+        self._last_pump_ticks: int = ticks_ms()
     
     @abstractmethod 
     def init(self, pub_conf: dict):
@@ -46,13 +58,116 @@ class AbstractPubStack(ABC):
     @abstractmethod
     def dopify(self, mess: bytes) -> Tuple[DopError, bytes]:
         pass
+
+    @abstractmethod
+    def dopify_many(self, messages: list) -> list:
+        """ Dopify a sequence of messages, return the list of (DopError, bytes) per-item results. """
+        pass
     
 
+    def overhead(self) -> int:
+        """ Return the bytes the stack adds to a message it publishes, e.g. to size
+        the messages so that they fit in the buffers of the publisher. """
+        return 0
+
+
+    def next_pump_ms(self) -> int:
+        """ Return the milliseconds until the stack next needs pump(): 0 if pump
+        is due now, -1 if the stack has nothing scheduled.
+
+        By default the stack is pumped every loop_interval milliseconds of the
+        product configuration; implementations that know when they have
+        pending work override this method.
+        """
+        if self._pub_conf is None or 'loop_interval' not in self._pub_conf:
+            return -1
+        elapsed = ticks_diff(ticks_ms(), self._last_pump_ticks)
+        return max(0, self._pub_conf['loop_interval'] - elapsed)
+
+
+    def wait_pump(self, timeout_ms: int = -1) -> bool:
+        """ Block until pump is due, the stop event is set or timeout_ms expires
+        (-1: no timeout). Return True if pump is due. """
+        next_ms = self.next_pump_ms()
+        if next_ms == 0:
+            return True
+        if next_ms > 0 and (timeout_ms < 0 or next_ms < timeout_ms):
+            timeout_ms = next_ms
+
+        if self._ready_event is None:
+            #   micropython: no other thread can signal work, just sleep
+            if timeout_ms > 0:
+                time.sleep_ms(timeout_ms)
+        else:
+            self._ready_event.wait(None if timeout_ms < 0 else timeout_ms / 1000)
+            self._ready_event.clear()
+        return self.next_pump_ms() == 0
+
+
+    def set_ready_event(self, ready_event):
+        """ Share the ready signal with a scheduler that pumps several stacks. """
+        self._ready_event = ready_event
+
+
+    def _signal_ready(self):
+        """ To be called by implementations when pump becomes due, e.g. when a message is queued. """
+        if self._ready_event is not None:
+            self._ready_event.set()
+
+
+    def _pumped(self):
+        """ To be called by implementations at every pump. """
+        self._last_pump_ticks = ticks_ms()
+
+
+    def _on_stop(self):
+        """ Called when the attached stop event is set: wake up the waiting threads. """
+        self._signal_ready()
+
+
+    def stats(self) -> dict:
+        """ Return the metrics of the pub stack (e.g. queue depth, drain rate). """
+        return {}
+
+
+    def flush(self, timeout_ms: int) -> int:
+        """ On shutdown: hand the pending messages to the callbacks until none
+        is left or timeout_ms expires, return the number of messages handed. """
+        return 0
+
+
+    def take_pending(self) -> list:
+        """ On shutdown: remove and return the messages that are still pending
+        (e.g. to save them). """
+        return []
+
+
+    def save_state(self) -> bytes:
+        """ Before a deep sleep: return the state the stack needs to resume after
+        the wake-up (e.g. to keep it in RTC memory), b"" if it has none. """
+        return b""
+
+
+    def restore_state(self, state: bytes):
+        """ After a deep-sleep wake-up: resume from the state returned by save_state(). """
+        pass
+
+
     def set_pub_callback(self, pub_callback: Callable):    
         """ Set the callback for the publisher. """
         self._pub_callback = pub_callback
     
 
+    def set_pub_batch_callback(self, pub_batch_callback: Callable):
+        """ Set the callback for the publisher that takes a batch of messages.
+
+        The callback returns the list of per-message DopError results. If it
+        is not set, the messages of a batch are passed one by one to the
+        publisher callback.
+        """
+        self._pub_batch_callback = pub_batch_callback
+
+
     def set_pub_userdata(self, pub_userdata):
         """ Set the userdata for the publisher. """
         self._pub_userdata = pub_userdata
@@ -61,3 +176,4 @@ class AbstractPubStack(ABC):
     def attach_stop_event(self, stop_event: DopStopEvent):
         """ Attach a stop event to the pub stack, to exit loop in case of a user interrupt. """
         self._stop_event = stop_event
+        self._stop_event.add_listener(self._on_stop)
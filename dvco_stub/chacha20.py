@@ -0,0 +1,65 @@
+"""
+ChaCha20 stream cipher (RFC 8439, section 2.4), in pure python
+
+Neither CPython nor micropython ship a stream cipher in their standard
+library, so the pub stacks that encrypt on both carry this one. The key
+stream is XORed byte by byte into a buffer of the caller: a message is
+encrypted without any intermediate allocation but the 64-byte block.
+"""
+
+import struct
+
+_CONSTANTS = (0x61707865, 0x3320646E, 0x79622D32, 0x6B206574)     #   "expand 32-byte k"
+_MASK = 0xFFFFFFFF
+
+
+def _quarter_round(x: list, a: int, b: int, c: int, d: int):
+    x[a] = (x[a] + x[b]) & _MASK
+    t = x[d] ^ x[a]
+    x[d] = ((t << 16) | (t >> 16)) & _MASK
+    x[c] = (x[c] + x[d]) & _MASK
+    t = x[b] ^ x[c]
+    x[b] = ((t << 12) | (t >> 20)) & _MASK
+    x[a] = (x[a] + x[b]) & _MASK
+    t = x[d] ^ x[a]
+    x[d] = ((t << 8) | (t >> 24)) & _MASK
+    x[c] = (x[c] + x[d]) & _MASK
+    t = x[b] ^ x[c]
+    x[b] = ((t << 7) | (t >> 25)) & _MASK
+
+
+class ChaCha20:
+
+    def __init__(self, key: bytes):
+        if len(key) != 32:
+            raise ValueError("ChaCha20 key must be 32 bytes")
+        self._key: tuple = struct.unpack("<8I", key)
+
+    def block(self, nonce: bytes, counter: int, out: bytearray):
+        """ Write the 64-byte key stream block of (nonce, counter) into out. """
+        state = list(_CONSTANTS + self._key)
+        state.append(counter & _MASK)
+        state.extend(struct.unpack("<3I", nonce))
+        x = list(state)
+        for _ in range(10):
+            _quarter_round(x, 0, 4, 8, 12)
+            _quarter_round(x, 1, 5, 9, 13)
+            _quarter_round(x, 2, 6, 10, 14)
+            _quarter_round(x, 3, 7, 11, 15)
+            _quarter_round(x, 0, 5, 10, 15)
+            _quarter_round(x, 1, 6, 11, 12)
+            _quarter_round(x, 2, 7, 8, 13)
+            _quarter_round(x, 3, 4, 9, 14)
+        for i in range(16):
+            struct.pack_into("<I", out, 4 * i, (x[i] + state[i]) & _MASK)
+
+    def xor_into(self, nonce: bytes, data, out, offset: int = 0, counter: int = 0):
+        """ Encrypt (or decrypt) data with the key stream of nonce (12 bytes),
+        starting at block counter, into out[offset:offset + len(data)]. """
+        block = bytearray(64)
+        n = len(data)
+        for start in range(0, n, 64):
+            self.block(nonce, counter, block)
+            counter += 1
+            for i in range(min(64, n - start)):
+                out[offset + start + i] = data[start + i] ^ block[i]
@@ -0,0 +1,99 @@
+from common.python.clock import ticks_us, ticks_diff
+
+upy: bool
+try:
+    from threading import Lock
+
+    upy = False
+
+except ImportError:
+    upy = True
+    import _thread
+
+
+class PubQueue:
+    """ Queue of the messages waiting to be handed to the publish callback.
+
+    put() and take() are thread safe; take() removes a whole batch with a single
+    lock acquisition. The queue keeps the counters needed to report its depth,
+    the drain rate and the time spent by the messages in the queue.
+    """
+
+    def __init__(self, max_size: int = 0):
+        self._max_size: int = max_size          #   0: unbounded
+        self._items: list = []                  #   [(payload, enqueue ticks_us)]
+        self._lock = _thread.allocate_lock() if upy else Lock()
+
+        self._enqueued: int = 0
+        self._dropped: int = 0
+        self._drained: int = 0
+        self._wait_us_total: int = 0
+        self._wait_us_max: int = 0
+
+        #   drain rate is computed between two stats() calls
+        self._rate_ticks: int = ticks_us()
+        self._rate_drained: int = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, payload) -> bool:
+        """ Enqueue payload, return False if the queue is full and payload was dropped. """
+        with self._lock:
+            if self._max_size > 0 and len(self._items) >= self._max_size:
+                self._dropped += 1
+                return False
+            self._items.append((payload, ticks_us()))
+            self._enqueued += 1
+        return True
+
+    def put_many(self, payloads: list) -> int:
+        """ Enqueue payloads in order, return how many were enqueued before the queue got full. """
+        with self._lock:
+            room = len(payloads)
+            if self._max_size > 0:
+                room = min(room, max(0, self._max_size - len(self._items)))
+            now = ticks_us()
+            for i in range(room):
+                self._items.append((payloads[i], now))
+            self._enqueued += room
+            self._dropped += len(payloads) - room
+        return room
+
+    def take(self, max_items: int = 0) -> list:
+        """ Remove and return up to max_items payloads (all of them if max_items is 0). """
+        with self._lock:
+            if max_items <= 0 or max_items >= len(self._items):
+                batch = self._items
+                self._items = []
+            else:
+                batch = self._items[:max_items]
+                del self._items[:max_items]
+
+            if len(batch) > 0:
+                now = ticks_us()
+                for item in batch:
+                    wait = ticks_diff(now, item[1])
+                    self._wait_us_total += wait
+                    if wait > self._wait_us_max:
+                        self._wait_us_max = wait
+                self._drained += len(batch)
+
+        return [item[0] for item in batch]
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = ticks_us()
+            elapsed = ticks_diff(now, self._rate_ticks)
+            drained = self._drained - self._rate_drained
+            self._rate_ticks = now
+            self._rate_drained = self._drained
+
+            wait_avg = self._wait_us_total // self._drained if self._drained > 0 else 0
+            return {'depth': len(self._items),
+                    'enqueued': self._enqueued,
+                    'drained': self._drained,
+                    'dropped': self._dropped,
+                    'drain_rate': round(drained * 1000000 / elapsed, 1) if elapsed > 0 else 0,
+                    'wait_avg_ms': wait_avg / 1000,
+                    'wait_max_ms': self._wait_us_max / 1000}
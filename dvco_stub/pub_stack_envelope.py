@@ -0,0 +1,212 @@
+from dvco_stub.pub_stack_stub import PubStackStub
+from dvco_stub.chacha20 import ChaCha20
+from common.python.error import DopError
+
+import os
+import struct
+import time
+
+try:
+    import hashlib
+except ImportError:
+    import uhashlib as hashlib
+
+try:
+    from hmac import compare_digest
+except ImportError:
+    def compare_digest(a, b) -> bool:
+        """ Constant-time comparison, for the platforms without the hmac module. """
+        if len(a) != len(b):
+            return False
+        diff = 0
+        for x, y in zip(a, b):
+            diff |= x ^ y
+        return diff == 0
+
+try:
+    from typing import Tuple
+except ImportError:
+    Tuple = tuple
+
+
+ENVELOPE_VERSION = 2             #   1: SHA-256 counter-mode keystream
+_HEADER = ">BI12s"              #   version, key epoch, nonce
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_TAG_SIZE = 16
+ENVELOPE_OVERHEAD = _HEADER_SIZE + _TAG_SIZE
+_STATE = ">I4sQ"                #   key epoch, nonce prefix, message counter
+
+
+class _Hmac:
+    """ HMAC-SHA256 with the key pads hashed once (hashlib objects are copied
+    when the platform allows it, micropython's are not copyable). """
+
+    def __init__(self, key: bytes):
+        if len(key) > 64:
+            key = hashlib.sha256(key).digest()
+        key = key + bytes(64 - len(key))
+        self._ipad = bytes(b ^ 0x36 for b in key)
+        self._opad = bytes(b ^ 0x5C for b in key)
+        self._inner = hashlib.sha256(self._ipad)
+        self._outer = hashlib.sha256(self._opad)
+        self._copy = hasattr(self._inner, 'copy')
+
+    def digest(self, msg) -> bytes:
+        if self._copy:
+            inner = self._inner.copy()
+            outer = self._outer.copy()
+        else:
+            inner = hashlib.sha256(self._ipad)
+            outer = hashlib.sha256(self._opad)
+        inner.update(msg)
+        outer.update(inner.digest())
+        return outer.digest()
+
+
+class _SessionKey:
+    """ Keys of one rotation period, derived from the product key. """
+
+    def __init__(self, product_key: _Hmac, product_id: bytes, epoch: int):
+        self.epoch: int = epoch
+        session = _Hmac(product_key.digest(b"dvco-session" + product_id + struct.pack(">I", epoch)))
+        self.cipher = ChaCha20(session.digest(b"enc"))
+        self.mac = _Hmac(session.digest(b"mac"))
+
+        #   nonce: 4 random bytes per session + 8 bytes message counter
+        self.nonce_prefix: bytes = os.urandom(4)
+        self.counter: int = 0
+
+
+class PubStackEnvelope(PubStackStub):
+    """ Reference pub stack that applies envelope encryption to the messages.
+
+    It is meant to measure the cost of a real DVCO stack on the target
+    platforms: the construction (ChaCha20, encrypt-then-MAC with a truncated
+    HMAC-SHA256 tag) runs on both CPython and micropython, the cipher being
+    carried in chacha20.py.
+
+    A session key is derived from "product_key" and "product_id" of the
+    product configuration once per "key_rotation" seconds (default 3600),
+    and cached. The envelope is:
+        version (1 B) | key epoch (4 B) | nonce (12 B) | ciphertext | tag (16 B)
+    Queueing and batching are inherited from PubStackStub.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._product_key: _Hmac = None
+        self._product_id: bytes = b""
+        self._rotation: int = 3600
+        self._session: _SessionKey = None
+        self._previous: _SessionKey = None      #   kept to open late envelopes
+        self._rotations: int = 0
+        self._resume: tuple = None              #   restored (epoch, nonce prefix, counter)
+
+
+    def init(self, pub_conf: dict) -> DopError:
+        if 'product_key' not in pub_conf:
+            return DopError(12, "Missing product arg: product_key")
+
+        self._product_key = _Hmac(str(pub_conf['product_key']).encode("UTF-8"))
+        self._product_id = str(pub_conf.get('product_id', "")).encode("UTF-8")
+        self._rotation = int(pub_conf.get('key_rotation', 3600))
+        if self._rotation <= 0:
+            return DopError(13, "Invalid product arg: key_rotation")
+
+        super().init(pub_conf)
+        return DopError()
+
+
+    def overhead(self) -> int:
+        return ENVELOPE_OVERHEAD
+
+
+    def dopify(self, mess: bytes) -> Tuple[DopError, bytes]:
+        return super().dopify(self.seal(mess))
+
+
+    def dopify_many(self, messages: list) -> list:
+        session = self._session_key()
+        return super().dopify_many([self._seal(session, mess) for mess in messages])
+
+
+    def seal(self, mess) -> bytes:
+        """ Encrypt and authenticate a message with the current session key. """
+        return self._seal(self._session_key(), mess)
+
+
+    def unseal(self, envelope) -> Tuple[DopError, bytes]:
+        """ Verify and decrypt an envelope sealed by this stack (current or previous session). """
+        if len(envelope) < ENVELOPE_OVERHEAD:
+            return DopError(310, "Envelope too short."), b""
+        version, epoch, nonce = struct.unpack(_HEADER, bytes(envelope[:_HEADER_SIZE]))
+        if version != ENVELOPE_VERSION:
+            return DopError(311, "Unsupported envelope version."), b""
+
+        session = None
+        for s in (self._session, self._previous):
+            if s is not None and s.epoch == epoch:
+                session = s
+        if session is None:
+            session = _SessionKey(self._product_key, self._product_id, epoch)
+
+        body = memoryview(envelope)[:-_TAG_SIZE]
+        if not compare_digest(session.mac.digest(body)[:_TAG_SIZE], bytes(envelope[-_TAG_SIZE:])):
+            return DopError(312, "Envelope authentication failed."), b""
+        clear = bytearray(len(body) - _HEADER_SIZE)
+        session.cipher.xor_into(nonce, body[_HEADER_SIZE:], clear)
+        return DopError(), bytes(clear)
+
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats['key_epoch'] = None if self._session is None else self._session.epoch
+        stats['key_rotations'] = self._rotations
+        return stats
+
+
+    def save_state(self) -> bytes:
+        """ The key epoch and nonce of the current session, to go on with the same
+        nonce sequence after a deep-sleep wake-up. """
+        session = self._session
+        if session is None:
+            return b""
+        return struct.pack(_STATE, session.epoch, session.nonce_prefix, session.counter)
+
+
+    def restore_state(self, state: bytes):
+        if len(state) == struct.calcsize(_STATE):
+            self._resume = struct.unpack(_STATE, state)
+
+
+    def _session_key(self) -> _SessionKey:
+        epoch = int(time.time()) // self._rotation
+        session = self._session
+        if session is not None and session.epoch == epoch:
+            return session
+
+        with self._lock:
+            if self._session is None or self._session.epoch != epoch:
+                self._previous = self._session
+                self._session = _SessionKey(self._product_key, self._product_id, epoch)
+                self._rotations += 1
+                if self._resume is not None and self._resume[0] == epoch:
+                    self._session.nonce_prefix = self._resume[1]
+                    self._session.counter = self._resume[2]
+                self._resume = None
+            return self._session
+
+
+    def _seal(self, session: _SessionKey, mess) -> bytes:
+        with self._lock:
+            counter = session.counter
+            session.counter += 1
+        nonce = session.nonce_prefix + struct.pack(">Q", counter)
+
+        #   the message is encrypted in place in the envelope, then tagged
+        n = _HEADER_SIZE + len(mess)
+        envelope = bytearray(n + _TAG_SIZE)
+        struct.pack_into(_HEADER, envelope, 0, ENVELOPE_VERSION, session.epoch, nonce)
+        session.cipher.xor_into(nonce, mess, envelope, _HEADER_SIZE)
+        envelope[n:] = session.mac.digest(memoryview(envelope)[:n])[:_TAG_SIZE]
+        return bytes(envelope)
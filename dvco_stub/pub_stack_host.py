@@ -0,0 +1,197 @@
+"""
+Host of the pub stacks of several data products in one process
+
+Every product has its own pub stack (created through the registry from its
+product configuration), its own topic and its own metrics; all the products
+share one output - e.g. a pool of broker connections - and one pump scheduler.
+"""
+
+from dvco_stub.registry import create_pub_stack
+from common.python.error import DopError, DOP_OK
+from common.python.threads import DopStopEvent
+from common.python.clock import ticks_ms, ticks_add, ticks_diff
+
+import time
+
+try:
+    from typing import Callable, Tuple
+    from threading import Event
+except ImportError:
+    Callable = callable
+    Tuple = tuple
+    Event = None
+
+
+class HostedProduct:
+
+    def __init__(self, product_id: str, topic: str, pub_stack):
+        self.product_id: str = product_id
+        self.topic: str = topic                 #   None: the default topic of the output
+        self.pub_stack = pub_stack
+
+        self.published: int = 0
+        self.failed: int = 0
+        self.bytes: int = 0
+
+    def stats(self) -> dict:
+        #   the metrics of the stack (e.g. its own 'failed') are kept apart from those of the host
+        return {'topic': self.topic,
+                'published': self.published,
+                'failed': self.failed,
+                'bytes': self.bytes,
+                'stack': self.pub_stack.stats()}
+
+
+class PubStackHost:
+
+    def __init__(self):
+        self._products: dict = {}               #   product id -> HostedProduct
+        self._ready_event = None if Event is None else Event()
+        self._stop_event: DopStopEvent = None
+
+        #   output shared by all the products
+        self._output_callback: Callable = None          #   (payload, topic, userdata) -> DopError
+        self._output_batch_callback: Callable = None    #   (payloads, topic, userdata) -> list of DopError
+        self._output_userdata = None
+
+
+    def add_product(self, product_id: str, pub_conf: dict) -> DopError:
+        """ Create the pub stack of a product; its messages are published on
+        the "topic" of the product configuration, if any. """
+        if product_id in self._products:
+            return DopError(16, f"Duplicated product: {product_id}")
+
+        err, pub_stack = create_pub_stack(pub_conf)
+        if err.isError():
+            return err
+
+        product = HostedProduct(product_id, pub_conf.get('topic', None), pub_stack)
+        pub_stack.set_pub_userdata(product)
+        pub_stack.set_pub_callback(self._on_message)
+        pub_stack.set_pub_batch_callback(self._on_batch)
+        pub_stack.set_ready_event(self._ready_event)
+        if self._stop_event is not None:
+            pub_stack.attach_stop_event(self._stop_event)
+
+        self._products[product_id] = product
+        return DopError()
+
+
+    def set_output(self, output_callback: Callable, output_batch_callback: Callable = None, userdata = None):
+        """ Set the output shared by all the products. """
+        self._output_callback = output_callback
+        self._output_batch_callback = output_batch_callback
+        self._output_userdata = userdata
+
+
+    def attach_stop_event(self, stop_event: DopStopEvent):
+        self._stop_event = stop_event
+        for product in self._products.values():
+            product.pub_stack.attach_stop_event(stop_event)
+
+
+    def product_ids(self) -> list:
+        return list(self._products.keys())
+
+
+    def pub_stack(self, product_id: str):
+        product = self._products.get(product_id)
+        return None if product is None else product.pub_stack
+
+
+    def dopify(self, product_id: str, mess: bytes) -> Tuple[DopError, bytes]:
+        product = self._products.get(product_id)
+        if product is None:
+            return DopError(17, f"Unknown product: {product_id}"), mess
+        return product.pub_stack.dopify(mess)
+
+
+    def dopify_all(self, mess: bytes) -> dict:
+        """ Dopify the same message for every product, return the results by product id. """
+        return {product_id: product.pub_stack.dopify(mess)
+                for product_id, product in self._products.items()}
+
+
+    def next_pump_ms(self) -> int:
+        """ Milliseconds until the first stack needs pump(), -1 if none has anything scheduled. """
+        next_ms: int = -1
+        for product in self._products.values():
+            ms = product.pub_stack.next_pump_ms()
+            if ms >= 0 and (next_ms < 0 or ms < next_ms):
+                next_ms = ms
+        return next_ms
+
+
+    def wait_pump(self, timeout_ms: int = -1) -> bool:
+        """ Single scheduler for all the stacks: block until one of them needs
+        pump(), the stop event is set or timeout_ms expires. """
+        next_ms = self.next_pump_ms()
+        if next_ms == 0:
+            return True
+        if next_ms > 0 and (timeout_ms < 0 or next_ms < timeout_ms):
+            timeout_ms = next_ms
+
+        if self._ready_event is None:
+            if timeout_ms > 0:
+                time.sleep_ms(timeout_ms)
+        else:
+            self._ready_event.wait(None if timeout_ms < 0 else timeout_ms / 1000)
+            self._ready_event.clear()
+        return self.next_pump_ms() == 0
+
+
+    def pump(self):
+        """ Pump the stacks that are due. """
+        for product in self._products.values():
+            if product.pub_stack.next_pump_ms() == 0:
+                product.pub_stack.pump()
+
+
+    def stats(self) -> dict:
+        return {product_id: product.stats() for product_id, product in self._products.items()}
+
+
+    def flush(self, timeout_ms: int) -> int:
+        """ On shutdown: flush the stacks within timeout_ms overall, return
+        the number of messages handed to the output. """
+        deadline = ticks_add(ticks_ms(), timeout_ms)
+        flushed: int = 0
+        for product in self._products.values():
+            flushed += product.pub_stack.flush(max(0, ticks_diff(deadline, ticks_ms())))
+        return flushed
+
+
+    def take_pending(self) -> list:
+        """ Remove the messages still pending in the stacks, return them as (payload, topic). """
+        pending: list = []
+        for product in self._products.values():
+            for payload in product.pub_stack.take_pending():
+                pending.append((payload, product.topic))
+        return pending
+
+
+    def _on_message(self, payload, product: HostedProduct) -> DopError:
+        if self._output_callback is None:
+            return DOP_OK
+        err = self._output_callback(payload, product.topic, self._output_userdata)
+        self._account(product, err, len(payload))
+        return err
+
+
+    def _on_batch(self, payloads: list, product: HostedProduct) -> list:
+        if self._output_batch_callback is None:
+            return [self._on_message(payload, product) for payload in payloads]
+        errors = self._output_batch_callback(payloads, product.topic, self._output_userdata)
+        for i in range(len(payloads)):
+            self._account(product, errors[i], len(payloads[i]))
+        return errors
+
+
+    @staticmethod
+    def _account(product: HostedProduct, err: DopError, size: int):
+        #   called under the callback lock of the product stack
+        if err is not None and err.isError():
+            product.failed += 1
+        else:
+            product.published += 1
+            product.bytes += size
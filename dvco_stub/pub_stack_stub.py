@@ -1,11 +1,14 @@
 from dvco_stub.abstract_pub_stack import AbstractPubStack
-from common.python.error import DopError
+from dvco_stub.pub_queue import PubQueue
+from common.python.error import DopError, DOP_OK, dop_error
+from common.python.error_stats import global_error_stats
 from common.python.threads import DopStopEvent
+from common.python.clock import ticks_ms, ticks_add, ticks_diff
 
 upy: bool
 try:
     from typing import Callable, Tuple
-    from threading import Lock 
+    from threading import Lock, Event, Thread
 
     upy = False 
 
@@ -17,6 +20,15 @@ except ImportError:
 
 
 class PubStackStub(AbstractPubStack):
+    """ Pass-through pub stack.
+
+    With "queue": 1 in the product configuration, dopify enqueues the message
+    and returns; the queue is drained into the publish callback, in batches of
+    "batch_size" messages, by pump() or - on CPython - by "workers" threads.
+    "queue_size" bounds the queue (0: unbounded); when the queue is full, the
+    message is dropped and dopify returns an error.
+    """
+
     def __init__(self):
         super().__init__()
         if upy:
@@ -26,23 +38,152 @@ class PubStackStub(AbstractPubStack):
             self._lock = Lock()
             self._callback_lock = Lock()
 
+        self._queue: PubQueue = None
+        self._batch_size: int = 32
+        self._failed: int = 0
+        self._work_event = None
+        self._workers: list = []
+
 
     def init(self, pub_conf: dict):
         self._pub_conf = pub_conf
 
+        if pub_conf.get('queue', 0) != 1:
+            return
+
+        self._queue = PubQueue(pub_conf.get('queue_size', 1000))
+        self._batch_size = pub_conf.get('batch_size', 32)
+
+        workers: int = pub_conf.get('workers', 0)
+        if upy or workers <= 0:
+            #   the queue is drained by pump()
+            return
+
+        if self._stop_event is None:
+            self.attach_stop_event(DopStopEvent())
+        self._work_event = Event()
+        for i in range(workers):
+            worker = Thread(target=self._drain_worker, name=f"pub_stack_worker_{i}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
 
     def pump(self):
-        return     
+        self._pumped()
+        if self._queue is None or len(self._workers) > 0:
+            return
+        self._drain()
+
+
+    def next_pump_ms(self) -> int:
+        #   pump has work to do only when it drains the queue
+        if self._queue is None or len(self._workers) > 0:
+            return -1
+        return 0 if len(self._queue) > 0 else -1
     
 
     def dopify(self, mess: bytes) -> Tuple[DopError, bytes]:
-        self._on_dopified_message(mess.decode("UTF-8"))
-        return DopError(), mess
+        if self._queue is None:
+            #   callbacks are not required to return a result
+            err = self._on_dopified_message(mess)
+            return DOP_OK if err is None else err, mess
+
+        if not self._queue.put(mess):
+            return global_error_stats.count(dop_error(301), "pub_stack.queue"), mess
+        self._signal_work()
+        return global_error_stats.count(DOP_OK, "pub_stack.queue"), mess
+
+
+    def dopify_many(self, messages: list) -> list:
+        if self._queue is None:
+            errors = self._on_dopified_batch(messages)
+            return [(errors[i], messages[i]) for i in range(len(messages))]
+
+        enqueued = self._queue.put_many(messages)
+        if enqueued > 0:
+            self._signal_work()
+        full = dop_error(301)
+        results = [(DOP_OK if i < enqueued else full, messages[i]) for i in range(len(messages))]
+        count = global_error_stats.count
+        for result in results:
+            count(result[0], "pub_stack.queue")
+        return results
+
+
+    def stats(self) -> dict:
+        if self._queue is None:
+            return {}
+        stats = self._queue.stats()
+        stats['failed'] = self._failed
+        return stats
+
+
+    def _signal_work(self):
+        if self._work_event is not None:
+            self._work_event.set()
+        else:
+            self._signal_ready()
+
+
+    def _on_stop(self):
+        super()._on_stop()
+        if self._work_event is not None:
+            self._work_event.set()
+
+
+    def flush(self, timeout_ms: int) -> int:
+        if self._queue is None:
+            return 0
+        return self._drain(ticks_add(ticks_ms(), timeout_ms))
+
+
+    def take_pending(self) -> list:
+        if self._queue is None:
+            return []
+        return self._queue.take()
+
+
+    def _drain(self, deadline: int = None) -> int:
+        """ Hand the queued messages to the callback, one batch at a time,
+        until the queue is empty or the deadline (ticks_ms) is reached. """
+        drained: int = 0
+        while deadline is None or ticks_diff(deadline, ticks_ms()) > 0:
+            batch = self._queue.take(self._batch_size)
+            if len(batch) == 0:
+                break
+            errors = self._on_dopified_batch(batch)
+            for err in errors:
+                if err.isError():
+                    self._failed += 1
+            drained += len(batch)
+        return drained
+
+
+    def _drain_worker(self):
+        while not self._stop_event.is_exiting():
+            self._work_event.clear()
+            if self._drain() == 0:
+                self._work_event.wait()
+
 
     def _on_dopified_message(self, mess):
         
         if self._pub_callback is not None:
             with self._callback_lock: 
-                self._pub_callback(mess, self._pub_userdata)
+                return self._pub_callback(mess, self._pub_userdata)
+
+
+    def _on_dopified_batch(self, batch: list) -> list:
+        """ Hand a batch to the callbacks with a single lock acquisition,
+        return the per-message results. """
+        if self._pub_batch_callback is not None:
+            with self._callback_lock:
+                return self._pub_batch_callback(batch, self._pub_userdata)
+
+        if self._pub_callback is None:
+            return [DOP_OK] * len(batch)
 
-    
\ No newline at end of file
+        with self._callback_lock:
+            errors = [self._pub_callback(mess, self._pub_userdata) for mess in batch]
+        #   callbacks are not required to return a result
+        return [DOP_OK if err is None else err for err in errors]
@@ -0,0 +1,58 @@
+"""
+Registry of the pub stack implementations
+
+The implementation is selected by name with the "pub_stack" key of the product
+configuration; its module is imported only when the implementation is chosen.
+"""
+
+from common.python.error import DopError
+
+try:
+    from typing import Tuple
+except ImportError:
+    Tuple = tuple
+
+
+DEFAULT_PUB_STACK = "stub"
+
+#   name -> (module, class name)
+_pub_stacks: dict = {
+    "stub": ("dvco_stub.pub_stack_stub", "PubStackStub"),
+    "envelope": ("dvco_stub.pub_stack_envelope", "PubStackEnvelope"),
+}
+
+
+def register_pub_stack(name: str, module: str, class_name: str):
+    """ Register an AbstractPubStack implementation, without importing it. """
+    _pub_stacks[name] = (module, class_name)
+
+
+def pub_stack_names() -> list:
+    return sorted(_pub_stacks.keys())
+
+
+def load_pub_stack(name: str) -> Tuple[DopError, object]:
+    """ Import the module of the named implementation and return its class. """
+    if name not in _pub_stacks:
+        return DopError(14, f"Unknown pub stack: {name}"), None
+
+    module, class_name = _pub_stacks[name]
+    try:
+        mod = __import__(module, None, None, [class_name])
+        return DopError(), getattr(mod, class_name)
+    except (ImportError, AttributeError) as e:
+        return DopError(15, f"Cannot load pub stack {name}: {e}"), None
+
+
+def create_pub_stack(pub_conf: dict) -> Tuple[DopError, object]:
+    """ Create and initialize the pub stack selected by the product configuration. """
+    err, pub_stack_class = load_pub_stack(pub_conf.get('pub_stack', DEFAULT_PUB_STACK))
+    if err.isError():
+        return err, None
+
+    pub_stack = pub_stack_class()
+    err = pub_stack.init(pub_conf)
+    #   init of the stub returns nothing
+    if err is not None and err.isError():
+        return err, None
+    return DopError(), pub_stack
@@ -43,13 +43,45 @@ MicroPython driver from BME680 air quality sensor, based on Adafruit_bme680
 
 import time
 import math
-from micropython import const
-from ubinascii import hexlify as hex
 try:
     import struct
 except ImportError:
     import ustruct as struct
 
+try:
+    import micropython
+    from micropython import const
+except ImportError:
+    #   host (CPython), e.g. to run the driver against a fake I2C bus
+    def const(value):
+        return value
+
+    class micropython:
+        """The code emitter decorators, as no-ops"""
+        @staticmethod
+        def native(function):
+            return function
+
+        viper = native
+
+try:
+    ticks_ms = time.ticks_ms
+    ticks_add = time.ticks_add
+    ticks_diff = time.ticks_diff
+    sleep_ms = time.sleep_ms
+except AttributeError:
+    def ticks_ms():
+        return time.monotonic_ns() // 1000000
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(ticks1, ticks2):
+        return ticks1 - ticks2
+
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
 #    I2C ADDRESS/BITS/SETTINGS
 #    -----------------------------------------------------------------------
 _BME680_CHIPID = const(0x61)
@@ -77,6 +109,7 @@ _BME680_SAMPLERATES = (0, 1, 2, 4, 8, 16)
 _BME680_FILTERSIZES = (0, 1, 3, 7, 15, 31, 63, 127)
 
 _BME680_RUNGAS = const(0x10)
+_BME680_GAS_WAIT = const(0x65)
 
 _LOOKUP_TABLE_1 = (2147483647.0, 2147483647.0, 2147483647.0, 2147483647.0, 2147483647.0,
                    2126008810.0, 2147483647.0, 2130303777.0, 2147483647.0, 2147483647.0,
@@ -87,6 +120,14 @@ _LOOKUP_TABLE_2 = (4096000000.0, 2048000000.0, 1024000000.0, 512000000.0, 255744
                    64000000.0, 32258064.0, 16016016.0, 8000000.0, 4000000.0, 2000000.0, 1000000.0,
                    500000.0, 250000.0, 125000.0)
 
+# The integer gas compensation keeps its intermediate values within 30 bits, the
+# small int range of micropython: table 1 is split in its 16 bit halves, and
+# table 2 is kept as a 17 bit mantissa and an exponent (rounded, 2**-16 at most)
+_LOOKUP_TABLE_1_HI = tuple(int(x) >> 16 for x in _LOOKUP_TABLE_1)
+_LOOKUP_TABLE_1_LO = tuple(int(x) & 0xFFFF for x in _LOOKUP_TABLE_1)
+_LOOKUP_TABLE_2_EXP = tuple(max(0, len(bin(int(x))) - 19) for x in _LOOKUP_TABLE_2)
+_LOOKUP_TABLE_2_MAN = tuple(int(x / (1 << e) + 0.5) for x, e in zip(_LOOKUP_TABLE_2, _LOOKUP_TABLE_2_EXP))
+
 
 def _read24(arr):
     """Parse an unsigned 24-bit value as a floating point and return it."""
@@ -98,6 +139,101 @@ def _read24(arr):
     return ret
 
 
+# Integer compensation, after the fixed-point reference code of Bosch (BME680_driver):
+# no float is allocated. Units: temperature in 1/100 C, humidity in 1/1000 RH %,
+# pressure in Pa, gas resistance in ohms. The 32 bit intermediate values of the
+# reference code are rearranged to stay within 30 bits over the sensor range,
+# so that micropython does not allocate long ints for them.
+
+@micropython.viper
+def _t_fine_fixed(adc_temp: int, t1: int, t2: int, t3: int) -> int:
+    var1 = (adc_temp >> 3) - (t1 << 1)
+    var2 = (var1 * t2) >> 11
+    var3 = ((((var1 >> 1) * (var1 >> 1)) >> 12) * (t3 << 4)) >> 14
+    return var2 + var3
+
+
+@micropython.native
+def _pressure_fixed(adc_pres, t_fine, p):
+    # the products that exceed 30 bits are split in high and low parts: the
+    # results are those of the reference code, bit for bit
+    var1 = (t_fine >> 1) - 64000
+    # (var1 >> 2) ** 2, with (var1 >> 2) = high << 7 + low
+    high = var1 >> 2
+    if high < 0:
+        high = -high
+    low = high & 0x7F
+    high >>= 7
+    cross = ((high * low) << 8) + low * low
+    var2 = (((((high * high) << 3) + (cross >> 11)) * p[5]) >> 2)
+    var2 = var2 + ((var1 * p[4]) << 1)
+    var2 = (var2 >> 2) + (p[3] << 16)
+    # ((square >> 13) * (p3 << 5) >> 3) + ((p2 * var1) >> 1), then >> 18, with
+    # var1 = high << 8 + low
+    square = ((high * high) << 1) + (cross >> 13)
+    var1 = ((((((square * p[2]) << 3) + p[1] * (var1 & 0xFF)) >> 8) + p[1] * (var1 >> 8)) >> 11)
+    # ((32768 + var1) * p1) >> 15, without the 32768 * p1 product
+    var1 = p[0] + ((var1 * p[0]) >> 15)
+    # calc_pres * 3125 as quotient and remainder of the division by var1
+    calc_pres = (1048576 - adc_pres) - (var2 >> 12)
+    quotient = calc_pres // var1
+    rest = calc_pres - quotient * var1
+    if calc_pres >= 343598:
+        # the product reaches 0x40000000: the reference code divides before doubling
+        calc_pres = (quotient * 3125 + (rest * 3125) // var1) << 1
+    else:
+        calc_pres = quotient * 6250 + (rest * 6250) // var1
+    var1 = (p[8] * (((calc_pres >> 3) * (calc_pres >> 3)) >> 13)) >> 12
+    var2 = ((calc_pres >> 2) * p[7]) >> 13
+    # ((calc_pres >> 8) ** 3 * p10) >> 17, with the cube = high << 7 + low
+    var3 = (calc_pres >> 8) * (calc_pres >> 8) * (calc_pres >> 8)
+    var3 = (((var3 >> 7) * p[9]) + (((var3 & 0x7F) * p[9]) >> 7)) >> 10
+    return calc_pres + ((var1 + var2 + var3 + (p[6] << 7)) >> 4)
+
+
+@micropython.native
+def _humidity_fixed(adc_hum, t_fine, h):
+    # h[0] is par_h1 * 16; // rounds towards minus infinity where the reference
+    # truncates, the results differ by one unit at most below 0 C
+    temp_scaled = ((t_fine * 5) + 128) >> 8
+    var1 = (adc_hum - h[0]) - (((temp_scaled * h[2]) // 100) >> 1)
+    var2 = (h[1] * (((temp_scaled * h[3]) // 100) +
+                    (((temp_scaled * ((temp_scaled * h[4]) // 100)) >> 6) // 100) +
+                    16384)) >> 10
+    var3 = var1 * var2
+    var4 = ((h[5] << 7) + ((temp_scaled * h[6]) // 100)) >> 4
+    var5 = ((var3 >> 14) * (var3 >> 14)) >> 10
+    var6 = (var4 * var5) >> 1
+    # * 1000 >> 12 as * 125 >> 9
+    calc_hum = (((var3 + var6) >> 10) * 125) >> 9
+    if calc_hum > 100000:
+        return 100000
+    if calc_hum < 0:
+        return 0
+    return calc_hum
+
+
+@micropython.native
+def _gas_fixed(adc_gas, gas_range, sw_err):
+    var1 = 1340 + (5 * sw_err)
+    var1 = var1 * _LOOKUP_TABLE_1_HI[gas_range] + ((var1 * _LOOKUP_TABLE_1_LO[gas_range]) >> 16)
+    var2 = ((adc_gas << 15) - 16777216) + var1
+    # the reference code rounds (table 2 * var1 >> 9) / var2, a product of up to 58 bits:
+    # var1 / var2 (below 26 bits) is divided first, with 24 fractional bits, 4 at a time
+    ratio = var1 // var2
+    rest = var1 - ratio * var2
+    for _ in range(6):
+        rest <<= 4
+        digit = rest // var2
+        ratio = (ratio << 4) + digit
+        rest -= digit * var2
+    # then multiplied by the mantissa of table 2, in 12 bit halves, and scaled
+    mantissa = _LOOKUP_TABLE_2_MAN[gas_range]
+    var3 = mantissa * (ratio >> 12) + ((mantissa * (ratio & 0xFFF)) >> 12)
+    shift = 21 - _LOOKUP_TABLE_2_EXP[gas_range]
+    return (var3 + (1 << (shift - 1))) >> shift
+
+
 
 class Adafruit_BME680:
     """Driver from BME680 air quality sensor
@@ -107,8 +243,7 @@ class Adafruit_BME680:
     def __init__(self, *, refresh_rate=10):
         """Check the BME680 was found, read the coefficients and enable the sensor for continuous
            reads."""
-        self._write(_BME680_REG_SOFTRESET, [0xB6])
-        time.sleep(0.005)
+        self.soft_reset()
 
         # Check device ID.
         chip_id = self._read_byte(_BME680_REG_CHIPID)
@@ -117,10 +252,6 @@ class Adafruit_BME680:
 
         self._read_calibration()
 
-        # set up heater
-        self._write(_BME680_BME680_RES_HEAT_0, [0x73])
-        self._write(_BME680_BME680_GAS_WAIT_0, [0x65])
-
         self.sea_level_pressure = 1013.25
         """Pressure in hectoPascals at sea level. Used to calibrate ``altitude``."""
 
@@ -137,8 +268,22 @@ class Adafruit_BME680:
         self._gas_range = None
         self._t_fine = None
 
-        self._last_reading = time.ticks_ms()
+        self._last_reading = ticks_ms()
         self._min_refresh_time = 1000 // refresh_rate
+        self._poll_deadline = self._last_reading
+
+    def soft_reset(self):
+        """Reset the sensor and set up its heater again. The configuration registers
+           are back to their reset values: they are written again by the next reading"""
+        # last value written to each configuration register, see _set_registers
+        self._shadow = {}
+
+        self._write(_BME680_REG_SOFTRESET, [0xB6])
+        time.sleep(0.005)
+
+        # set up heater
+        self._write(_BME680_BME680_RES_HEAT_0, [0x73])
+        self._write(_BME680_BME680_GAS_WAIT_0, [_BME680_GAS_WAIT])
 
     @property
     def pressure_oversample(self):
@@ -192,13 +337,103 @@ class Adafruit_BME680:
     def temperature(self):
         """The compensated temperature in degrees celsius."""
         self._perform_reading()
-        calc_temp = (((self._t_fine * 5) + 128) / 256)
-        return calc_temp / 100
+        return self._temperature()
 
     @property
     def pressure(self):
         """The barometric pressure in hectoPascals"""
         self._perform_reading()
+        return self._pressure()
+
+    @property
+    def humidity(self):
+        """The relative humidity in RH %"""
+        self._perform_reading()
+        return self._humidity()
+
+    @property
+    def gas(self):
+        """The gas resistance in ohms"""
+        self._perform_reading()
+        return self._gas()
+
+    @property
+    def altitude(self):
+        """The altitude based on current ``pressure`` vs the sea level pressure
+           (``sea_level_pressure``) - which you must enter ahead of time)"""
+        pressure = self.pressure # in Si units for hPascal
+        return 44330 * (1.0 - math.pow(pressure / self.sea_level_pressure, 0.1903))
+
+    def read_all(self):
+        """Perform a single measurement and return all the compensated values
+           as (temperature in C, humidity in RH %, pressure in hPa, gas resistance in ohms)"""
+        self._perform_reading()
+        return self._compensate_float()
+
+    def start_measurement(self):
+        """Start a single measurement and return at once, with the time in ms the sensor
+           takes to convert it: poll_measurement() returns the values once it is done.
+           Unlike the blocking reads, the refresh rate is not enforced. A measurement
+           not done after twice that time is a sensor failure: OSError is raised."""
+        # filter, humidity oversample and gas measurements enabled: written only
+        # when they change; temp & pressure oversample with single shot enabled
+        # are always written, as the sensor goes back to sleep mode after a reading
+        # (CTRL_HUM takes effect with the write of CTRL_MEAS, that comes last)
+        self._set_registers(((_BME680_REG_CONFIG, self._filter << 2),
+                             (_BME680_REG_CTRL_HUM, self._humidity_oversample),
+                             (_BME680_REG_CTRL_GAS, _BME680_RUNGAS)),
+                            (_BME680_REG_CTRL_MEAS,
+                             (self._temp_oversample << 5)|(self._pressure_oversample << 2)|0x01))
+        measurement_ms = self._measurement_ms()
+        self._poll_deadline = ticks_add(ticks_ms(), 2 * measurement_ms)
+        return measurement_ms
+
+    def poll_measurement(self, fixed=False):
+        """Return None if the measurement started by start_measurement() is still in
+           progress, otherwise its values as returned by read_all(), or by read_all_fixed()
+           if fixed; raise OSError if it is not done by its deadline"""
+        if not self._poll_measurement(fixed):
+            return None
+        if fixed:
+            return self._compensate_fixed()
+        return self._compensate_float()
+
+    def read_all_fixed(self):
+        """Perform a single measurement and return all the values compensated with
+           integer arithmetic, as (temperature in 1/100 C, humidity in 1/1000 RH %,
+           pressure in Pa, gas resistance in ohms)"""
+        self._perform_reading(fixed=True)
+        return self._compensate_fixed()
+
+    def _measurement_ms(self):
+        """Duration of a measurement, after the Bosch reference code: temperature, pressure
+           and humidity conversions, then gas conversion with the heater on"""
+        cycles = (_BME680_SAMPLERATES[self._temp_oversample] +
+                  _BME680_SAMPLERATES[self._pressure_oversample] +
+                  _BME680_SAMPLERATES[self._humidity_oversample])
+        tph_us = cycles * 1963 + 477 * 4 + 477 * 5 + 500
+        # heat duration: 6 bits of ms, with a multiplication factor of 1, 4, 16 or 64
+        heat_ms = (_BME680_GAS_WAIT & 0x3F) << (2 * (_BME680_GAS_WAIT >> 6))
+        return tph_us // 1000 + 1 + heat_ms
+
+    def _compensate_float(self):
+        return self._temperature(), self._humidity(), self._pressure(), self._gas()
+
+    def _compensate_fixed(self):
+        t = self._temp_calibration_int
+        t_fine = _t_fine_fixed(self._adc_temp, t[0], t[1], t[2])
+        return ((((t_fine * 5) + 128) >> 8),
+                _humidity_fixed(self._adc_hum, t_fine, self._humidity_calibration_int),
+                _pressure_fixed(self._adc_pres, t_fine, self._pressure_calibration_int),
+                _gas_fixed(self._adc_gas, self._gas_range, self._sw_err_int))
+
+    # The compensation functions use the values of the last reading
+
+    def _temperature(self):
+        calc_temp = (((self._t_fine * 5) + 128) / 256)
+        return calc_temp / 100
+
+    def _pressure(self):
         var1 = (self._t_fine / 2) - 64000
         var2 = ((var1 / 4) * (var1 / 4)) / 2048
         var2 = (var2 * self._pressure_calibration[5]) / 4
@@ -218,10 +453,7 @@ class Adafruit_BME680:
         calc_pres += ((var1 + var2 + var3 + (self._pressure_calibration[6] * 128)) / 16)
         return calc_pres/100
 
-    @property
-    def humidity(self):
-        """The relative humidity in RH %"""
-        self._perform_reading()
+    def _humidity(self):
         temp_scaled = ((self._t_fine * 5) + 128) / 256
         var1 = ((self._adc_hum - (self._humidity_calibration[0] * 16)) -
                 ((temp_scaled * self._humidity_calibration[2]) / 200))
@@ -243,55 +475,55 @@ class Adafruit_BME680:
             calc_hum = 0
         return calc_hum
 
-    @property
-    def altitude(self):
-        """The altitude based on current ``pressure`` vs the sea level pressure
-           (``sea_level_pressure``) - which you must enter ahead of time)"""
-        pressure = self.pressure # in Si units for hPascal
-        return 44330 * (1.0 - math.pow(pressure / self.sea_level_pressure, 0.1903))
-
-    @property
-    def gas(self):
-        """The gas resistance in ohms"""
-        self._perform_reading()
+    def _gas(self):
         var1 = ((1340 + (5 * self._sw_err)) * (_LOOKUP_TABLE_1[self._gas_range])) / 65536
         var2 = ((self._adc_gas * 32768) - 16777216) + var1
         var3 = (_LOOKUP_TABLE_2[self._gas_range] * var1) / 512
         calc_gas_res = (var3 + (var2 / 2)) / var2
         return int(calc_gas_res)
 
-    def _perform_reading(self):
+    def _perform_reading(self, fixed=False):
         """Perform a single-shot reading from the sensor and fill internal data structure for
            calculations"""
-        expired = time.ticks_diff(self._last_reading, time.ticks_ms()) * time.ticks_diff(0, 1)
+        expired = ticks_diff(self._last_reading, ticks_ms()) * ticks_diff(0, 1)
         if 0 <= expired < self._min_refresh_time:
-            time.sleep_ms(self._min_refresh_time - expired)
-
-        # set filter
-        self._write(_BME680_REG_CONFIG, [self._filter << 2])
-        # turn on temp oversample & pressure oversample
-        self._write(_BME680_REG_CTRL_MEAS,
-                    [(self._temp_oversample << 5)|(self._pressure_oversample << 2)])
-        # turn on humidity oversample
-        self._write(_BME680_REG_CTRL_HUM, [self._humidity_oversample])
-        # gas measurements enabled
-        self._write(_BME680_REG_CTRL_GAS, [_BME680_RUNGAS])
-
-        ctrl = self._read_byte(_BME680_REG_CTRL_MEAS)
-        ctrl = (ctrl & 0xFC) | 0x01  # enable single shot!
-        self._write(_BME680_REG_CTRL_MEAS, [ctrl])
-        new_data = False
-        while not new_data:
-            data = self._read(_BME680_REG_MEAS_STATUS, 15)
-            new_data = data[0] & 0x80 != 0
+            sleep_ms(self._min_refresh_time - expired)
+
+        self.start_measurement()
+        while not self._poll_measurement(fixed):
             time.sleep(0.005)
-        self._last_reading = time.ticks_ms()
+
+    def _poll_measurement(self, fixed):
+        """Return True once the measurement is read, raise OSError past its deadline"""
+        if self._read_measurement(fixed):
+            return True
+        if ticks_diff(ticks_ms(), self._poll_deadline) > 0:
+            raise OSError("BME680 measurement not done in time")
+        return False
+
+    def _read_measurement(self, fixed):
+        """Read the data registers: if they hold a new measurement, store it and return True"""
+        data = self._read(_BME680_REG_MEAS_STATUS, 15)
+        if data[0] & 0x80 == 0:
+            return False
+        self._last_reading = ticks_ms()
+        self._parse_reading(data, fixed)
+        return True
+
+    def _parse_reading(self, data, fixed):
+        """Store the raw values of the data registers and, unless fixed, t_fine for the
+           float compensation"""
+        self._adc_hum = (data[8] << 8) | data[9]
+        self._adc_gas = (data[13] << 2) | (data[14] >> 6)
+        self._gas_range = data[14] & 0x0F
+        if fixed:
+            # 20 bit values, without allocating floats
+            self._adc_pres = (data[2] << 12) | (data[3] << 4) | (data[4] >> 4)
+            self._adc_temp = (data[5] << 12) | (data[6] << 4) | (data[7] >> 4)
+            return
 
         self._adc_pres = _read24(data[2:5]) / 16
         self._adc_temp = _read24(data[5:8]) / 16
-        self._adc_hum = struct.unpack('>H', bytes(data[8:10]))[0]
-        self._adc_gas = int(struct.unpack('>H', bytes(data[13:15]))[0] / 64)
-        self._gas_range = data[14] & 0x0F
 
         var1 = (self._adc_temp / 8) - (self._temp_calibration[0] * 2)
         var2 = (var1 * self._temp_calibration[1]) / 2048
@@ -302,36 +534,65 @@ class Adafruit_BME680:
 
     def _read_calibration(self):
         """Read & save the calibration coefficients"""
-        coeff = self._read(_BME680_BME680_COEFF_ADDR1, 25)
-        coeff += self._read(_BME680_BME680_COEFF_ADDR2, 16)
+        # _read returns a buffer that is reused by the next read of the same length
+        coeff = bytes(self._read(_BME680_BME680_COEFF_ADDR1, 25))
+        coeff += bytes(self._read(_BME680_BME680_COEFF_ADDR2, 16))
 
         coeff = list(struct.unpack('<hbBHhbBhhbbHhhBBBHbbbBbHhbb', bytes(coeff[1:39])))
         # print("\n\n",coeff)
+        # H1 & H2 share register 0xE2: H1 is 0xE3 << 4 | its low nibble, H2 is
+        # 0xE1 << 4 | its high nibble (coeff[17] is 0xE3 << 8 | 0xE2)
+        coeff[16], coeff[17] = ((coeff[16] << 4) | ((coeff[17] >> 4) & 0x0F),
+                                ((coeff[17] >> 8) << 4) | (coeff[17] & 0x0F))
+        # integer coefficients, with H1 * 16
+        self._temp_calibration_int = tuple(coeff[x] for x in [23, 0, 1])
+        self._pressure_calibration_int = tuple(coeff[x] for x in [3, 4, 5, 7, 8, 10, 9, 12, 13, 14])
+        self._humidity_calibration_int = (coeff[17] * 16, coeff[16], coeff[18],
+                                          coeff[19], coeff[20], coeff[21], coeff[22])
         coeff = [float(i) for i in coeff]
         self._temp_calibration = [coeff[x] for x in [23, 0, 1]]
         self._pressure_calibration = [coeff[x] for x in [3, 4, 5, 7, 8, 10, 9, 12, 13, 14]]
         self._humidity_calibration = [coeff[x] for x in [17, 16, 18, 19, 20, 21, 22]]
         self._gas_calibration = [coeff[x] for x in [25, 24, 26]]
 
-        # flip around H1 & H2
-        self._humidity_calibration[1] *= 16
-        self._humidity_calibration[1] += self._humidity_calibration[0] % 16
-        self._humidity_calibration[0] /= 16
-
         self._heat_range = (self._read_byte(0x02) & 0x30) / 16
         self._heat_val = self._read_byte(0x00)
-        self._sw_err = (self._read_byte(0x04) & 0xF0) / 16
+        # range_sw_err is the signed high nibble of register 0x04
+        self._sw_err_int = self._read_byte(0x04) >> 4
+        if self._sw_err_int > 7:
+            self._sw_err_int -= 16
+        self._sw_err = float(self._sw_err_int)
 
     def _read_byte(self, register):
         """Read a byte register value and return it"""
         return self._read(register, 1)[0]
 
+    def _set_registers(self, config, trigger=None):
+        """Write the (register, value) pairs of config whose value differs from the
+           last one written, and then the trigger pair, if any, in one burst"""
+        pairs = []
+        for register, value in config:
+            if self._shadow.get(register) != value:
+                pairs.append((register, value))
+        if trigger is not None:
+            pairs.append(trigger)
+        if len(pairs) == 0:
+            return
+        self._write_pairs(pairs)
+        for register, value in config:
+            self._shadow[register] = value
+
     def _read(self, register, length):
         raise NotImplementedError()
 
     def _write(self, register, values):
         raise NotImplementedError()
 
+    def _write_pairs(self, pairs):
+        """Write a list of (register, value) pairs"""
+        for register, value in pairs:
+            self._write(register, [value])
+
 class BME680_I2C(Adafruit_BME680):
     """Driver for I2C connected BME680.
 
@@ -345,11 +606,18 @@ class BME680_I2C(Adafruit_BME680):
         self._i2c = i2c
         self._address = address
         self._debug = debug
+        # read buffers by length, reused: a read returns the same buffer as the
+        # previous read of the same length
+        self._buffers = {}
         super().__init__(refresh_rate=refresh_rate)
 
     def _read(self, register, length):
-        """Returns an array of 'length' bytes from the 'register'"""
-        result = bytearray(length)
+        """Returns an array of 'length' bytes from the 'register', valid until
+           the next read of the same length"""
+        result = self._buffers.get(length)
+        if result is None:
+            result = bytearray(length)
+            self._buffers[length] = result
         self._i2c.readfrom_mem_into(self._address, register & 0xff, result)
         if self._debug:
             print("\t${:x} read ".format(register), " ".join(["{:02x}".format(i) for i in result]))
@@ -357,10 +625,22 @@ class BME680_I2C(Adafruit_BME680):
 
     def _write(self, register, values):
         """Writes an array of 'length' bytes to the 'register'"""
+        if len(values) == 1:
+            if self._debug:
+                print("\t${:x} write".format(register), "{:02x}".format(values[0]))
+            self._i2c.writeto_mem(self._address, register, bytes((values[0] & 0xFF,)))
+            return
+        self._write_pairs([(register + i, values[i]) for i in range(len(values))])
+
+    def _write_pairs(self, pairs):
+        """Writes (register, value) pairs in a single transaction: the BME680 does not
+           auto-increment the register on writes, a burst is a sequence of pairs"""
         if self._debug:
-            print("\t${:x} write".format(register), " ".join(["{:02x}".format(i) for i in values]))
-        for value in values:
-            self._i2c.writeto_mem(self._address, register, bytearray([value & 0xFF]))
-            register += 1
+            print("\twrite", " ".join(["${:x}={:02x}".format(r, v) for r, v in pairs]))
+        buf = bytearray(2 * len(pairs))
+        for i in range(len(pairs)):
+            buf[2 * i] = pairs[i][0] & 0xFF
+            buf[2 * i + 1] = pairs[i][1] & 0xFF
+        self._i2c.writeto(self._address, buf)
 
 
@@ -0,0 +1,173 @@
+"""
+Backlog of the samples taken while the broker cannot be reached
+
+SampleBacklog is a ring of fixed-size binary records, allocated once in RAM:
+a record holds the sample counter and the four integer values of
+read_all_fixed() in 18 bytes, against about 170 for the JSON payload. When
+the ring is full, the oldest record is dropped.
+
+With a path, the ring is mirrored to flash, so that the backlog survives a
+reboot (e.g. by the WDT). The records are appended to the current segment
+file, path.<n>, every flush_records records, not at every sample, and a
+full segment is closed for a new one, path.<n + 1>: a file is never
+rewritten, and at most segments files are kept, the oldest being removed.
+The mirror is loaded at startup and removed once the backlog is empty; the
+records uploaded from a backlog that is not empty yet stay on flash, and
+can be uploaded again after a reboot (the counter tells them apart).
+"""
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+#   counter, temperature (1/100 C), humidity (1/1000 RH %), pressure (Pa), gas resistance (ohms)
+_RECORD = "<IhIII"
+RECORD_SIZE = 18
+
+
+class SampleBacklog:
+
+    def __init__(self, capacity: int = 256, path: str = None, segments: int = 4, flush_records: int = 8):
+        self._buf = bytearray(capacity * RECORD_SIZE)
+        self._view = memoryview(self._buf)
+        self._capacity: int = capacity
+        self._head: int = 0             #   record of the oldest sample
+        self._count: int = 0            #   records in the ring
+        self._path: str = path
+        self._segments: int = segments
+        self._segment_records: int = max(1, capacity // segments)
+        self._flush_records: int = flush_records
+        self._unflushed: int = 0        #   newest records not on flash yet
+        self._segment: int = 0          #   number of the segment file being written
+        self._segment_count: int = 0    #   records in that file
+        self.dropped: int = 0
+        if path is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, counter: int, values):
+        """ Add a sample, with values as returned by read_all_fixed(). """
+        temperature, humidity, pressure, gas = values
+        self._put(counter, temperature, humidity, pressure, gas)
+        if self._path is not None:
+            self._unflushed = min(self._unflushed + 1, self._count)
+            if self._unflushed >= self._flush_records:
+                self.flush()
+
+    def get(self, n: int) -> tuple:
+        """ The n-th oldest sample, as (counter, temperature, humidity, pressure, gas). """
+        return struct.unpack_from(_RECORD, self._buf, (self._head + n) % self._capacity * RECORD_SIZE)
+
+    def records(self) -> bytearray:
+        """ The records, oldest first, e.g. to keep them in RTC memory. """
+        data = bytearray(self._count * RECORD_SIZE)
+        for n in range(self._count):
+            i = (self._head + n) % self._capacity * RECORD_SIZE
+            data[n * RECORD_SIZE:(n + 1) * RECORD_SIZE] = self._view[i:i + RECORD_SIZE]
+        return data
+
+    def extend(self, data):
+        """ Append the records of data, as returned by records(). """
+        for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+            self._put(*struct.unpack_from(_RECORD, data, offset))
+            if self._path is not None:
+                self._unflushed = min(self._unflushed + 1, self._count)
+        if self._path is not None and self._unflushed >= self._flush_records:
+            self.flush()
+
+    def drop(self, n: int):
+        """ Remove the n oldest samples, e.g. once they are uploaded. """
+        n = min(n, self._count)
+        self._head = (self._head + n) % self._capacity
+        self._count -= n
+        self._unflushed = min(self._unflushed, self._count)
+        if self._count == 0 and self._path is not None:
+            self._remove_segments()
+
+    def flush(self):
+        """ Append the records not on flash yet to the segment files. """
+        while self._unflushed > 0:
+            first = (self._head + self._count - self._unflushed) % self._capacity
+            n = min(self._unflushed, self._segment_records - self._segment_count, self._capacity - first)
+            try:
+                with open(self._segment_name(self._segment), "ab") as f:
+                    f.write(self._view[first * RECORD_SIZE:(first + n) * RECORD_SIZE])
+            except OSError as e:
+                #   the samples stay in RAM
+                print(f"Exception in backlog flush: {e}")
+                return
+            self._unflushed -= n
+            self._segment_count += n
+            if self._segment_count == self._segment_records:
+                self._segment += 1
+                self._segment_count = 0
+                self._remove(self._segment - self._segments)
+
+    def _put(self, counter: int, temperature: int, humidity: int, pressure: int, gas: int):
+        if self._count == self._capacity:
+            self._head = (self._head + 1) % self._capacity
+            self._count -= 1
+            self.dropped += 1
+        i = (self._head + self._count) % self._capacity
+        struct.pack_into(_RECORD, self._buf, i * RECORD_SIZE, counter, temperature, humidity, pressure, gas)
+        self._count += 1
+
+    def _segment_name(self, n: int) -> str:
+        return f"{self._path}.{n}"
+
+    def _remove(self, n: int):
+        if n < 0:
+            return
+        try:
+            os.remove(self._segment_name(n))
+        except OSError:
+            pass
+
+    def _remove_segments(self):
+        for n in range(self._segment - self._segments + 1, self._segment + 1):
+            self._remove(n)
+        self._segment = 0
+        self._segment_count = 0
+
+    def _load(self):
+        """ Load the records of the segment files, oldest first. """
+        slash = self._path.rfind("/")
+        directory = self._path[:slash] if slash > 0 else "/" if slash == 0 else ""
+        prefix = self._path[slash + 1:] + "."
+        try:
+            names = os.listdir(directory) if directory else os.listdir()
+        except OSError:
+            return
+        numbers = sorted(int(name[len(prefix):]) for name in names
+                         if name.startswith(prefix) and name[len(prefix):].isdigit())
+        if not numbers:
+            return
+
+        for n in numbers[:-self._segments]:
+            self._remove(n)
+        partial = False
+        for n in numbers[-self._segments:]:
+            try:
+                with open(self._segment_name(n), "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+                self._put(*struct.unpack_from(_RECORD, data, offset))
+            self._segment = n
+            self._segment_count = len(data) // RECORD_SIZE
+            partial = len(data) % RECORD_SIZE != 0
+
+        #   a segment ending with a partial record is not appended to
+        if partial or self._segment_count >= self._segment_records:
+            self._segment += 1
+            self._segment_count = 0
+            self._remove(self._segment - self._segments)
@@ -0,0 +1,217 @@
+"""
+Duty-cycled deep-sleep mode of the micropython sensor programs
+
+For battery deployments: the board wakes up, takes one sample, keeps it in
+RTC memory and deep-sleeps until the next sample; WiFi is started only
+every batch_samples samples, to publish the batch (as the batches of the
+backlog, see sens_payload.py), and if the upload fails, it is tried again
+batch_samples samples later. Whatever a wake-up needs is kept in the RTC
+memory, which survives deep sleep:
+    - the sample counter
+    - the samples not published yet, as the records of sens_backlog.py
+    - the state of the pub stack (AbstractPubStack.save_state())
+    - the budget of the cycles since the last publish
+
+Every cycle prints its time and power budget: the time spent awake by
+stage (sensor, wifi, mqtt, the rest, boot included), the time asleep, and
+the charge estimated from the current drawn in every stage (CURRENTS_MA,
+to be set for the board). Every publish also reports the average current
+since the previous one and the battery life it gives.
+"""
+
+import gc
+import machine
+import network
+import struct
+import utime
+
+from sens_backlog import SampleBacklog, RECORD_SIZE
+from sens_mqtt import PUBACK
+
+#   current drawn, in mA: awake (CPU, WiFi off), sensor (awake and BME680 heater),
+#   wifi and mqtt (awake and radio on), deep sleep (board dependent: the regulator
+#   and the USB bridge of development boards draw much more than the ESP32)
+CURRENTS_MA = (40.0, 52.0, 120.0, 120.0, 0.15)
+
+#   magic, counter, records, pub stack state length, upload retry (samples left),
+#   cycles, time (ms) and charge (mA.s) since the last publish
+_HEADER = "<HIHHHHIf"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_MAGIC = 0x5D01
+
+_SENSOR = 0
+_WIFI = 1
+_MQTT = 2
+
+
+class DutyCycle:
+
+    def __init__(self, interval_ms: int, batch_samples: int, capacity: int = 64, battery_mah: int = 0):
+        self._interval_ms: int = interval_ms
+        self._batch_samples: int = batch_samples
+        self._battery_mah: int = battery_mah
+        self.backlog = SampleBacklog(capacity)
+        self.counter: int = 0
+        self.pub_state: bytes = b""
+        self._retry: int = 0            #   samples before the next upload attempt
+        self._cycles: int = 0
+        self._period_ms: int = 0
+        self._charge: float = 0.0       #   mA.s
+        self._stages: list = [0, 0, 0]
+        self._uploaded = None           #   samples published by this cycle, None if none was due
+        self._nic = None
+        self._session = None
+        self._topic: bytes = b""
+        self._pid: int = 0
+        self._ack_timeout_ms: int = 5000
+        self._wdt = None
+        self._rtc = machine.RTC()
+        self._load()
+
+    @property
+    def due(self) -> bool:
+        """ True if the batch is to be published by this cycle. """
+        return len(self.backlog) >= self._batch_samples and self._retry == 0
+
+    def measure(self, bme):
+        """ Take the sample of this cycle, return its values (None if the sensor could not be read). """
+        start = utime.ticks_ms()
+        try:
+            values = bme.read_all_fixed()
+        except OSError as e:
+            print(f"Exception in sensor reading: {e}")
+            values = None
+        if values is not None:
+            self.backlog.append(self.counter, values)
+            self.counter += 1
+        if self._retry > 0:
+            self._retry -= 1
+        self._stages[_SENSOR] += utime.ticks_diff(utime.ticks_ms(), start)
+        return values
+
+    def wifi_up(self, ssid: str, pwd: str, timeout_ms: int, wdt=None):
+        """ Connect the station interface, return it, None if it is not connected within timeout_ms. """
+        start = utime.ticks_ms()
+        nic = network.WLAN(network.STA_IF)
+        nic.active(True)
+        self._nic = nic
+        if not nic.isconnected():
+            nic.connect(ssid, pwd)
+        while not nic.isconnected() and utime.ticks_diff(utime.ticks_ms(), start) < timeout_ms:
+            if wdt is not None:
+                wdt.feed()
+            utime.sleep_ms(100)
+        self._stages[_WIFI] += utime.ticks_diff(utime.ticks_ms(), start)
+        if not nic.isconnected():
+            print("WiFi connection failed")
+            self._retry = self._batch_samples
+            return None
+        return nic
+
+    def upload(self, session, topic: bytes, batch, publish=None, ack_timeout_ms: int = 5000,
+               wdt=None, timeout_ms: int = 0) -> bool:
+        """ Publish the samples in batches written by batch (a SamplePayload) and handed to
+        publish(payload), by default send(); the samples of a batch are removed once it is
+        handed without raising OSError. wdt, if any, is fed at every batch and while send()
+        waits for a PUBACK; with timeout_ms, no batch is started once the upload has taken
+        that long, the samples left being kept for the next attempt. Return True if every
+        sample was published. """
+        start = utime.ticks_ms()
+        self._session = session
+        self._topic = topic
+        self._ack_timeout_ms = ack_timeout_ms
+        self._wdt = wdt
+        count = len(self.backlog)
+        try:
+            session.connect()
+            while len(self.backlog) > 0:
+                if timeout_ms > 0 and utime.ticks_diff(utime.ticks_ms(), start) >= timeout_ms:
+                    raise OSError("upload not done in time")
+                if wdt is not None:
+                    wdt.feed()
+                payload, n = batch.fill_batch(self.backlog, gc.mem_free())
+                if publish is None:
+                    self.send(payload)
+                else:
+                    publish(payload)
+                self.backlog.drop(n)
+            session.close(True)
+        except OSError as e:
+            print(f"Exception in mqtt upload: {e}")
+            session.close()
+            self._retry = self._batch_samples
+        self._uploaded = count - len(self.backlog)
+        self._stages[_MQTT] += utime.ticks_diff(utime.ticks_ms(), start)
+        return len(self.backlog) == 0
+
+    def send(self, payload):
+        """ Publish payload with QoS 1 and wait for its PUBACK; raise OSError if it does not come
+        within the ack timeout. Also the publish callback of the pub stack in this mode. """
+        session = self._session
+        self._pid = self._pid % 0xFFFF + 1
+        session.publish(self._topic, payload, 1, self._pid)
+        start = utime.ticks_ms()
+        while utime.ticks_diff(utime.ticks_ms(), start) < self._ack_timeout_ms:
+            if session.read_packet() == PUBACK and session.acked_pid == self._pid:
+                return
+            if self._wdt is not None:
+                self._wdt.feed()
+            utime.sleep_ms(10)
+        raise OSError("no PUBACK from the broker")
+
+    def sleep(self):
+        """ Report the budget of the cycle, save the state in RTC memory and deep-sleep
+        until the next sample; does not return. """
+        if self._nic is not None:
+            self._nic.active(False)
+        awake_ms = utime.ticks_ms()
+        sleep_ms = max(10, self._interval_ms - awake_ms)
+        sensor_ms, wifi_ms, mqtt_ms = self._stages
+        other_ms = max(0, awake_ms - sensor_ms - wifi_ms - mqtt_ms)
+        charge = (other_ms * CURRENTS_MA[0] + sensor_ms * CURRENTS_MA[1] + wifi_ms * CURRENTS_MA[2] +
+                  mqtt_ms * CURRENTS_MA[3] + sleep_ms * CURRENTS_MA[4]) / 1000
+        self._cycles += 1
+        self._period_ms += awake_ms + sleep_ms
+        self._charge += charge
+
+        print(f"cycle {self.counter}: awake {awake_ms} ms (sensor {sensor_ms}, wifi {wifi_ms}, "
+              f"mqtt {mqtt_ms}, other {other_ms}), sleep {sleep_ms} ms, {charge / 3.6:.3f} uAh, "
+              f"{len(self.backlog)} samples kept")
+        if self._uploaded is not None:
+            #   since the last successful publish
+            average_ma = self._charge / (self._period_ms / 1000)
+            report = f"publish: {self._uploaded} samples, {self._cycles} cycles in {self._period_ms} ms, " \
+                     f"{self._charge / 3.6:.1f} uAh, average {average_ma:.3f} mA"
+            if self._battery_mah > 0:
+                report += f", battery life {self._battery_mah / average_ma / 24:.1f} days"
+            print(report)
+            if len(self.backlog) == 0:
+                self._cycles = 0
+                self._period_ms = 0
+                self._charge = 0.0
+
+        self._save()
+        machine.deepsleep(sleep_ms)
+
+    def _save(self):
+        records = self.backlog.records()
+        self._rtc.memory(struct.pack(_HEADER, _MAGIC, self.counter, len(self.backlog), len(self.pub_state),
+                                     self._retry, self._cycles, self._period_ms, self._charge) +
+                         self.pub_state + bytes(records))
+
+    def _load(self):
+        """ Resume from the RTC memory, unless it does not hold the state of a previous cycle. """
+        data = self._rtc.memory()
+        if len(data) < _HEADER_SIZE:
+            return
+        magic, counter, records, state_size, retry, cycles, period_ms, charge = \
+            struct.unpack_from(_HEADER, data)
+        if magic != _MAGIC or len(data) != _HEADER_SIZE + state_size + records * RECORD_SIZE:
+            return
+        self.counter = counter
+        self._retry = retry
+        self._cycles = cycles
+        self._period_ms = period_ms
+        self._charge = charge
+        self.pub_state = bytes(data[_HEADER_SIZE:_HEADER_SIZE + state_size])
+        self.backlog.extend(data[_HEADER_SIZE + state_size:])
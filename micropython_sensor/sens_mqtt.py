@@ -0,0 +1,202 @@
+"""
+Persistent MQTT 3.1.1 session of the micropython sensor programs
+
+MqttSession speaks the part of the protocol the sensors need: CONNECT,
+PUBLISH (QoS 0 and 1), PUBACK, PINGREQ and PINGRESP, DISCONNECT. Unlike
+umqtt.simple, it never waits for an acknowledgement: publish() writes the
+packet and returns, and read_packet() reads the packets of the broker
+without blocking, so that the caller (MqttLink, sens_runtime.py) keeps the
+QoS 1 messages in flight until their PUBACK. Every blocking operation,
+connect included, is bounded by the socket timeout, and the broker address
+is resolved once.
+
+The session is opened with CleanSession = 0: after a reconnection the broker
+keeps the session, and the unacknowledged QoS 1 messages are sent again
+with the DUP flag, as required by the protocol.
+"""
+
+try:
+    import utime
+except ImportError:
+    #   host (CPython), e.g. to run the benchmarks
+    from common.python import clock as utime
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+#   control packet types
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+
+class MqttSession:
+
+    def __init__(self, client_id: str, host: str, port: int, keepalive: int, timeout_ms: int,
+                 clean_session: bool = False, packet_size: int = 384):
+        self._client_id: bytes = client_id.encode("UTF-8")
+        self._host: str = host
+        self._port: int = port
+        self._keepalive: int = keepalive
+        self._timeout: float = timeout_ms / 1000
+        self._clean_session: bool = clean_session
+        self._address = None            #   resolved at the first connection
+        self._sock = None
+        self._tx = bytearray(packet_size)
+        self._rx = bytearray(4)
+        self._byte = bytearray(1)
+        self.last_rx: int = 0           #   ticks_ms of the last packet received
+        self.acked_pid: int = 0         #   packet id of the last PUBACK read
+
+    @property
+    def keepalive(self) -> int:
+        return self._keepalive
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def connect(self) -> bool:
+        """ Open the connection and the session, return True if the broker
+        still had the session; raise OSError on failure. """
+        self.close()
+        if self._address is None:
+            self._address = socket.getaddrinfo(self._host, self._port)[0][-1]
+
+        sock = socket.socket()
+        self._sock = sock
+        try:
+            sock.settimeout(self._timeout)
+            sock.connect(self._address)
+
+            #   variable header: protocol name and level, connect flags, keepalive
+            n = 10 + 2 + len(self._client_id)
+            tx = self._tx
+            tx[0] = 0x10
+            i = self._put_length(n)
+            for b in b"\x00\x04MQTT\x04":
+                tx[i] = b
+                i += 1
+            tx[i] = 0x02 if self._clean_session else 0x00
+            tx[i + 1] = self._keepalive >> 8
+            tx[i + 2] = self._keepalive & 0xFF
+            tx[i + 3] = len(self._client_id) >> 8
+            tx[i + 4] = len(self._client_id) & 0xFF
+            i += 5
+            tx[i:i + len(self._client_id)] = self._client_id
+            i += len(self._client_id)
+            sock.write(tx, i)
+
+            self._read_exact(4)
+            if self._rx[0] != CONNACK or self._rx[1] != 2:
+                raise OSError(f"unexpected connack {self._rx[0]:02x}")
+            if self._rx[3] != 0:
+                raise OSError(f"connection refused, return code {self._rx[3]}")
+        except OSError:
+            self.close()
+            raise
+
+        self.last_rx = utime.ticks_ms()
+        return (self._rx[2] & 0x01) != 0
+
+    def close(self, disconnect: bool = False):
+        if self._sock is None:
+            return
+        try:
+            if disconnect:
+                self._tx[0] = DISCONNECT
+                self._tx[1] = 0
+                self._sock.write(self._tx, 2)
+            self._sock.close()
+        except OSError:
+            pass
+        self._sock = None
+
+    def publish(self, topic: bytes, payload, qos: int, pid: int, dup: bool = False):
+        """ Write a PUBLISH packet; pid is used with qos 1 only. """
+        n = 2 + len(topic) + len(payload) + (2 if qos > 0 else 0)
+        tx = self._tx
+        tx[0] = PUBLISH | (qos << 1) | (0x08 if dup else 0)
+        i = self._put_length(n)
+        tx[i] = len(topic) >> 8
+        tx[i + 1] = len(topic) & 0xFF
+        i += 2
+        tx[i:i + len(topic)] = topic
+        i += len(topic)
+        if qos > 0:
+            tx[i] = pid >> 8
+            tx[i + 1] = pid & 0xFF
+            i += 2
+        if i + len(payload) <= len(tx):
+            tx[i:i + len(payload)] = payload
+            self._sock.write(tx, i + len(payload))
+        else:
+            self._sock.write(tx, i)
+            self._sock.write(payload)
+
+    def ping(self):
+        self._tx[0] = PINGREQ
+        self._tx[1] = 0
+        self._sock.write(self._tx, 2)
+
+    def read_packet(self) -> int:
+        """ Read a packet of the broker if one is available, without blocking:
+        return its type, 0 if none; the packet id of a PUBACK is in acked_pid.
+        Raise OSError if the connection was closed. """
+        sock = self._sock
+        sock.settimeout(0)
+        try:
+            n = sock.readinto(self._byte)
+        finally:
+            sock.settimeout(self._timeout)
+        if n is None:
+            return 0
+        if n == 0:
+            raise OSError("connection closed by the broker")
+
+        packet_type = self._byte[0] & 0xF0
+        length = self._read_length()
+        self.last_rx = utime.ticks_ms()
+        if packet_type == PUBACK and length == 2:
+            self._read_exact(2)
+            self.acked_pid = (self._rx[0] << 8) | self._rx[1]
+            return packet_type
+
+        #   PINGRESP has no body; the body of anything else is skipped
+        while length > 0:
+            self._read_exact(1)
+            length -= 1
+        return packet_type
+
+    def _put_length(self, n: int) -> int:
+        """ Write the remaining length n after the first byte of _tx, return the next index. """
+        i = 1
+        while True:
+            b = n & 0x7F
+            n >>= 7
+            self._tx[i] = b | (0x80 if n > 0 else 0)
+            i += 1
+            if n == 0:
+                return i
+
+    def _read_length(self) -> int:
+        n = 0
+        shift = 0
+        while True:
+            self._read_exact(1)
+            n |= (self._rx[0] & 0x7F) << shift
+            if self._rx[0] & 0x80 == 0:
+                return n
+            shift += 7
+
+    def _read_exact(self, n: int):
+        """ Read n (up to 4) bytes into _rx, waiting up to the socket timeout for each. """
+        for i in range(n):
+            if not self._sock.readinto(self._byte):
+                raise OSError("connection closed by the broker")
+            self._rx[i] = self._byte[0]
@@ -0,0 +1,132 @@
+"""
+Sample payloads written in place, into a buffer allocated once
+
+The payload of a sample has the layout of the JSON object the programs used
+to build with a dict and json.dumps, with the health fields mem (free heap)
+and backlog (samples waiting in the backlog, see sens_backlog.py):
+    {"payload_number": "12", "mem": "80128", "backlog": "0", "temp": "31.2 C",
+     "hum": "68.65 %", "press": "1041.32 hPa", "voc": "445.51 KOhms", "err": "0"}
+or, when the sensor could not be read:
+    {"payload_number": "12", "mem": "80128", "backlog": "0", "err": 1}
+SamplePayload writes it byte by byte from the integer values of
+read_all_fixed(): filling a payload allocates no string, dict or float.
+The values are written as str() writes the floats the programs used to
+compute: at most two decimals, without trailing zeros but one.
+
+The samples of the backlog are uploaded in batches, with the integer values
+of read_all_fixed() (1/100 C, 1/1000 RH %, Pa, ohms) after the counter:
+    {"batch": [[12, 3120, 68650, 104132, 445510], [13, 3121, 68640, 104130, 445700]],
+     "mem": "80128", "backlog": "35"}
+where backlog is the number of samples left after the batch.
+"""
+
+#   room for a sample of a batch, and for the fields closing the batch
+_SAMPLE_ROOM = 52
+
+
+class SamplePayload:
+
+    def __init__(self, size: int = 192):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._len: int = 0
+
+    def fill(self, counter: int, mem: int, values, backlog: int = 0) -> memoryview:
+        """ Write the payload of sample counter, with values as returned by
+        read_all_fixed() or None if the sensor could not be read; the returned
+        view is valid until the next fill(). """
+        self._len = 0
+        self._put(b'{"payload_number": "')
+        self._put_int(counter)
+        self._put(b'", "mem": "')
+        self._put_int(mem)
+        self._put(b'", "backlog": "')
+        self._put_int(backlog)
+        if values is None:
+            self._put(b'", "err": 1}')
+            return self._view[:self._len]
+
+        temperature, humidity, pressure, gas = values
+        self._put(b'", "temp": "')
+        self._put_hundredths(temperature, 1)
+        self._put(b' C", "hum": "')
+        self._put_hundredths(humidity, 10)
+        self._put(b' %", "press": "')
+        self._put_hundredths(pressure, 1)
+        self._put(b' hPa", "voc": "')
+        self._put_hundredths(gas, 10)
+        self._put(b' KOhms", "err": "0"}')
+        return self._view[:self._len]
+
+    def fill_batch(self, backlog, mem: int):
+        """ Write a batch of the oldest samples of backlog (a SampleBacklog), as many as
+        fit in the buffer; return the view, valid until the next fill, and the number
+        of samples written. """
+        self._len = 0
+        self._put(b'{"batch": [')
+        n = 0
+        while n < len(backlog) and self._len + 2 * _SAMPLE_ROOM <= len(self._buf):
+            if n > 0:
+                self._put(b', ')
+            self._buf[self._len] = 91       #   [
+            self._len += 1
+            for i, value in enumerate(backlog.get(n)):
+                if i > 0:
+                    self._put(b', ')
+                self._put_int(value)
+            self._buf[self._len] = 93       #   ]
+            self._len += 1
+            n += 1
+        self._put(b'], "mem": "')
+        self._put_int(mem)
+        self._put(b'", "backlog": "')
+        self._put_int(len(backlog) - n)
+        self._put(b'"}')
+        return self._view[:self._len], n
+
+    def _put(self, data: bytes):
+        buf = self._buf
+        i = self._len
+        for b in data:
+            buf[i] = b
+            i += 1
+        self._len = i
+
+    def _put_int(self, value: int):
+        buf = self._buf
+        if value < 0:
+            buf[self._len] = 45     #   -
+            self._len += 1
+            value = -value
+        #   digits from the last one, then reversed
+        start = self._len
+        i = start
+        while True:
+            buf[i] = 48 + value % 10
+            i += 1
+            value //= 10
+            if value == 0:
+                break
+        self._len = i
+        i -= 1
+        while start < i:
+            buf[start], buf[i] = buf[i], buf[start]
+            start += 1
+            i -= 1
+
+    def _put_hundredths(self, value: int, divisor: int):
+        """ Write value / divisor hundredths, rounded half away from zero. """
+        negative = value < 0
+        if negative:
+            value = -value
+        value = (value + divisor // 2) // divisor
+        if negative and value > 0:
+            self._buf[self._len] = 45   #   -
+            self._len += 1
+        self._put_int(value // 100)
+        self._buf[self._len] = 46       #   .
+        self._buf[self._len + 1] = 48 + value % 100 // 10
+        self._len += 2
+        if value % 10 != 0:
+            self._buf[self._len] = 48 + value % 10
+            self._len += 1
@@ -0,0 +1,402 @@
+"""
+uasyncio runtime of the micropython sensor programs
+
+The programs run as a set of tasks, each with its own period, so that a slow
+step no longer delays the others and the core sleeps between events:
+    - sampling: starts a BME680 measurement every sample interval and hands the
+      values to the program, without blocking while the sensor converts
+    - backlog: uploads in batches the samples kept while the broker could not
+      be reached
+    - pump (DVCO program): pumps the pub stack when it reports pending work
+    - mqtt: MqttLink keeps the broker session up, publishes the queued
+      payloads without waiting for their acknowledgements and pings the broker
+      when the session is idle
+    - wifi: reconnects the station interface when the access point is lost
+    - wdt: feeds the watchdog as long as every other task is alive
+A task that stops making progress (e.g. the sensor cannot be read, or the
+access point stays out of reach) stops reporting that it is alive: the WDT
+is no longer fed and it reboots the board.
+
+The payloads go from the buffer of SamplePayload (sens_payload.py) to the
+outbox of MqttLink, both allocated once, and the heap is collected when an
+allocation threshold is reached (set_gc_threshold), not at every sample.
+"""
+
+import gc
+
+try:
+    import utime
+except ImportError:
+    #   host (CPython), e.g. to run the benchmarks
+    from common.python import clock as utime
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+if not hasattr(asyncio, "sleep_ms"):
+    import asyncio as _asyncio
+
+    class asyncio:
+        """The uasyncio functions used by the runtime, on top of asyncio (CPython)"""
+        Event = _asyncio.Event
+        TimeoutError = _asyncio.TimeoutError
+        create_task = staticmethod(_asyncio.create_task)
+        run = staticmethod(_asyncio.run)
+
+        @staticmethod
+        def sleep_ms(ms: int):
+            return _asyncio.sleep(ms / 1000)
+
+        @staticmethod
+        def wait_for_ms(awaitable, timeout_ms: int):
+            return _asyncio.wait_for(awaitable, timeout_ms / 1000)
+
+from sens_mqtt import MqttSession, PUBACK, PINGRESP
+
+
+def set_gc_threshold(divisor: int = 4):
+    """ Collect the heap when 1/divisor of its free space has been allocated
+    (on CPython, the collector is left as it is). """
+    gc.collect()
+    if hasattr(gc, "threshold"):
+        gc.threshold(gc.mem_free() // divisor + gc.mem_alloc())
+
+
+class Liveness:
+    """ Last sign of life of every task, checked by the WDT feeder. """
+
+    def __init__(self):
+        self._tasks: dict = {}      #   name -> [last alive ticks, max silence ms]
+
+    def register(self, name: str, max_silence_ms: int):
+        self._tasks[name] = [utime.ticks_ms(), max_silence_ms]
+
+    def alive(self, name: str):
+        self._tasks[name][0] = utime.ticks_ms()
+
+    def stale(self):
+        """ Name of a task silent for longer than allowed, None if all are alive. """
+        now = utime.ticks_ms()
+        for name, task in self._tasks.items():
+            if utime.ticks_diff(now, task[0]) > task[1]:
+                return name
+        return None
+
+
+class MqttLink:
+    """ MQTT connection manager.
+
+    publish() copies the payload in a bounded outbox and returns; run(), the
+    mqtt task, keeps one session with the broker (MqttSession, sens_mqtt.py)
+    and reconnects it in place when it is lost, with a backoff between
+    attempts, reset once the broker answers in a session. It publishes the outbox without waiting for the acknowledgements:
+    with QoS 1, up to window messages are in flight, and a message leaves the
+    outbox when its PUBACK is read. PINGREQ is sent when nothing was sent for
+    half the keepalive. The session is considered lost when a PUBACK or the
+    PINGRESP is not read within ack_timeout_ms; the messages in flight are
+    then sent again, with the DUP flag, after the reconnection.
+
+    The outbox is a ring of outbox_size buffers of payload_size bytes,
+    allocated once: the payload passed to publish() can be reused as soon as
+    it returns.
+
+    mark() tracks the newest payload of the outbox, e.g. a batch of the
+    backlog: marked is True until it leaves the outbox, and mark_acked then
+    tells whether it was acknowledged (sent, with QoS 0) or dropped.
+    """
+
+    def __init__(self, session: MqttSession, topic: bytes, qos: int, outbox_size: int = 16,
+                 payload_size: int = 256, window: int = 4, ack_timeout_ms: int = 5000):
+        self._session: MqttSession = session
+        self._topic: bytes = topic
+        self._qos: int = qos
+        self._ping_ms: int = session.keepalive * 500
+        self._window: int = window
+        self._ack_timeout_ms: int = ack_timeout_ms
+        self._slots: list = [bytearray(payload_size) for i in range(outbox_size)]
+        self._views: list = [memoryview(slot) for slot in self._slots]
+        self._lengths: list = [0] * outbox_size
+        self._pids: list = [0] * outbox_size
+        self._head: int = 0         #   slot of the oldest payload
+        self._count: int = 0        #   payloads in the outbox
+        self._sent: int = 0         #   payloads in flight, from the oldest one
+        self._resend: int = 0       #   payloads in flight before the reconnection, sent again with DUP
+        self._pid: int = 0
+        self._work = asyncio.Event()
+        self._last_io: int = utime.ticks_ms()
+        self._last_ack: int = self._last_io
+        self._ping_sent = None      #   ticks_ms of the PINGREQ waiting for its PINGRESP
+        self._mark: int = 0         #   payloads up to the marked one, from the oldest; 0: none
+        self.mark_acked: bool = False
+        self.dropped: int = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._session.connected
+
+    @property
+    def queued(self) -> int:
+        """ Payloads in the outbox, in flight included. """
+        return self._count
+
+    @property
+    def marked(self) -> bool:
+        """ The marked payload is still in the outbox. """
+        return self._mark > 0
+
+    def mark(self) -> bool:
+        """ Mark the newest payload of the outbox; False if the outbox is empty. """
+        self._mark = self._count
+        self.mark_acked = False
+        return self._count > 0
+
+    def publish(self, payload) -> bool:
+        """ Queue a copy of payload; if the outbox is full, its oldest payload is dropped
+        and False returned, as when payload is larger than payload_size. """
+        size = len(self._slots)
+        n = len(payload)
+        if n > len(self._slots[0]):
+            self.dropped += 1
+            return False
+        full = self._count == size
+        if full:
+            self._pop(False)
+            self.dropped += 1
+        i = (self._head + self._count) % size
+        self._slots[i][0:n] = payload
+        self._lengths[i] = n
+        self._count += 1
+        self._work.set()
+        return not full
+
+    def disconnect(self):
+        self._session.close(True)
+
+    def _pop(self, acked: bool = True):
+        """ Remove the oldest payload, acknowledged or dropped. """
+        if self._mark > 0:
+            self._mark -= 1
+            if self._mark == 0:
+                self.mark_acked = acked
+        self._head = (self._head + 1) % len(self._slots)
+        self._count -= 1
+        if self._sent > 0:
+            self._sent -= 1
+        if self._resend > 0:
+            self._resend -= 1
+
+    def _connect(self) -> bool:
+        try:
+            self._session.connect()
+        except OSError as e:
+            print(f"Exception in mqtt connect: {e}")
+            return False
+        #   the payloads in flight are sent again, with the same packet ids
+        self._resend = self._sent
+        self._sent = 0
+        self._ping_sent = None
+        self._last_io = utime.ticks_ms()
+        return True
+
+    def _send(self):
+        size = len(self._slots)
+        while self._sent < self._count and (self._qos == 0 or self._sent < self._window):
+            i = (self._head + self._sent) % size
+            dup = self._sent < self._resend
+            if self._qos > 0 and not dup:
+                self._pid = self._pid % 0xFFFF + 1
+                self._pids[i] = self._pid
+            self._session.publish(self._topic, self._views[i][:self._lengths[i]], self._qos, self._pids[i], dup)
+            self._last_io = utime.ticks_ms()
+            if self._qos == 0:
+                self._pop()
+            else:
+                if self._sent == 0:
+                    self._last_ack = self._last_io
+                self._sent += 1
+
+    def _receive(self) -> bool:
+        """ Read the packets of the broker; True if any was read. """
+        session = self._session
+        received = False
+        while True:
+            packet_type = session.read_packet()
+            if packet_type == 0:
+                return received
+            received = True
+            if packet_type == PUBACK:
+                #   the broker acknowledges the QoS 1 messages in the order they were sent
+                if self._sent > 0 and session.acked_pid == self._pids[self._head]:
+                    self._pop()
+                    self._last_ack = utime.ticks_ms()
+            elif packet_type == PINGRESP:
+                self._ping_sent = None
+
+    def _check(self):
+        now = utime.ticks_ms()
+        if self._sent > 0 and utime.ticks_diff(now, self._last_ack) > self._ack_timeout_ms:
+            raise OSError("no PUBACK from the broker")
+        if self._ping_sent is not None:
+            if utime.ticks_diff(now, self._ping_sent) > self._ack_timeout_ms:
+                raise OSError("no PINGRESP from the broker")
+        elif utime.ticks_diff(now, self._last_io) >= self._ping_ms:
+            self._session.ping()
+            self._ping_sent = now
+            self._last_io = now
+
+    async def run(self, nic, liveness: Liveness, backoff_max_ms: int = 8000, poll_ms: int = 20):
+        """ The mqtt task; while messages are in flight, the acknowledgements are read every poll_ms. """
+        backoff_ms: int = 500
+        while True:
+            liveness.alive("mqtt")
+            if not nic.isconnected():
+                self._session.close()
+                await asyncio.sleep_ms(500)
+                continue
+
+            if not self._session.connected:
+                if not self._connect():
+                    await asyncio.sleep_ms(backoff_ms)
+                    backoff_ms = min(backoff_ms * 2, backoff_max_ms)
+                    continue
+
+            try:
+                self._send()
+                if self._receive():
+                    #   the broker answers: the session works, not only its CONNECT
+                    backoff_ms = 500
+                self._check()
+            except OSError as e:
+                print(f"Exception in mqtt session: {e}")
+                self._session.close()
+                #   a broker that accepts the session and then drops it is not reconnected at once
+                await asyncio.sleep_ms(backoff_ms)
+                backoff_ms = min(backoff_ms * 2, backoff_max_ms)
+                continue
+
+            #   sleep until a payload is queued or the next ping, checking in every second
+            if self._sent > 0 or self._ping_sent is not None:
+                delay = poll_ms
+            else:
+                delay = self._ping_ms - utime.ticks_diff(utime.ticks_ms(), self._last_io)
+            self._work.clear()
+            try:
+                await asyncio.wait_for_ms(self._work.wait(), max(0, min(delay, 1000)))
+            except asyncio.TimeoutError:
+                pass
+
+
+async def sampling_task(bme, interval_ms: int, on_sample, liveness: Liveness, retry_ms: int = 500):
+    """ Sample bme every interval_ms and call on_sample(counter, values), with values
+    as returned by bme.poll_measurement(True), None if the sensor could not be read,
+    or if the measurement was not done by its deadline: the measurement is then
+    retried after retry_ms, and the task is not alive. """
+    counter: int = 0
+    next_sample = utime.ticks_ms()
+    while True:
+        try:
+            #   the other tasks run while the sensor converts
+            await asyncio.sleep_ms(bme.start_measurement())
+            #   bounded: poll_measurement raises OSError past the deadline of the measurement
+            values = bme.poll_measurement(True)
+            while values is None:
+                await asyncio.sleep_ms(5)
+                values = bme.poll_measurement(True)
+        except OSError as e:
+            print(f"Exception in sensor reading: {e}")
+            values = None
+
+        on_sample(counter, values)
+
+        if values is None:
+            next_sample = utime.ticks_add(utime.ticks_ms(), retry_ms)
+        else:
+            liveness.alive("sampling")
+            counter = counter + 1
+            next_sample = utime.ticks_add(next_sample, interval_ms)
+            if utime.ticks_diff(next_sample, utime.ticks_ms()) < 0:
+                #   the step took longer than the interval: do not try to catch up
+                next_sample = utime.ticks_add(utime.ticks_ms(), interval_ms)
+
+        await asyncio.sleep_ms(max(0, utime.ticks_diff(next_sample, utime.ticks_ms())))
+
+
+async def backlog_task(backlog, link: MqttLink, batch, publish, period_ms: int = 1000, batch_ms: int = 50):
+    """ Upload the samples of backlog (sens_backlog.py) in batches written by batch (a
+    SamplePayload) and handed to publish(payload), which queues it in the outbox of link
+    before returning, while link is connected: a batch is written once the outbox is
+    empty, and its samples are dropped from backlog once it is acknowledged. A batch
+    dropped from the outbox (full) leaves its samples in backlog, for the next one. """
+    while True:
+        if len(backlog) > 0 and link.connected and link.queued == 0:
+            #   the free heap is not known on CPython
+            payload, n = batch.fill_batch(backlog, gc.mem_free() if hasattr(gc, "mem_free") else 0)
+            dropped = backlog.dropped
+            publish(payload)
+            if link.mark():
+                #   waits across reconnections: the batch is then sent again
+                while link.marked:
+                    await asyncio.sleep_ms(batch_ms)
+                if link.mark_acked:
+                    #   the oldest samples dropped by the full ring meanwhile were in the batch
+                    backlog.drop(max(0, n - (backlog.dropped - dropped)))
+            await asyncio.sleep_ms(batch_ms)
+        else:
+            await asyncio.sleep_ms(period_ms)
+
+
+async def pump_task(pub_stack, work, liveness: Liveness, period_ms: int = 1000):
+    """ Pump pub_stack when it reports it is due; work is an asyncio.Event set when
+    a message is dopified, e.g. queued, so that it is pumped at once. """
+    while True:
+        liveness.alive("pump")
+        delay = pub_stack.next_pump_ms()
+        if delay == 0:
+            pub_stack.pump()
+            await asyncio.sleep_ms(0)
+            continue
+
+        if delay < 0 or delay > period_ms:
+            delay = period_ms
+        work.clear()
+        try:
+            await asyncio.wait_for_ms(work.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def wifi_task(nic, ssid: str, pwd: str, liveness: Liveness, period_ms: int = 1000,
+                    timeout_ms: int = 60000):
+    """ Reconnect nic when the connection is lost; the task is not alive once
+    the reconnection takes longer than timeout_ms. """
+    lost = None
+    while True:
+        if nic.isconnected():
+            lost = None
+        elif lost is None:
+            lost = utime.ticks_ms()
+            print("WiFi connection lost, reconnecting")
+            try:
+                nic.disconnect()
+                nic.connect(ssid, pwd)
+            except OSError as e:
+                print(f"Exception in WiFi connect: {e}")
+
+        if lost is None or utime.ticks_diff(utime.ticks_ms(), lost) <= timeout_ms:
+            liveness.alive("wifi")
+        await asyncio.sleep_ms(period_ms)
+
+
+async def wdt_task(wdt, liveness: Liveness, period_ms: int):
+    """ Feed wdt every period_ms as long as every task is alive. """
+    reported = None
+    while True:
+        stale = liveness.stale()
+        if stale is None:
+            wdt.feed()
+        elif stale != reported:
+            print(f"task {stale} is not alive: the WDT is no longer fed")
+        reported = stale
+        await asyncio.sleep_ms(period_ms)
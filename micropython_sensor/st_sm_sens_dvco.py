@@ -5,18 +5,23 @@
 # changes 22/05/2023  
 # change sampling and pump interval based on how many iterations were done so far
 
-from machine import Pin, SoftI2C, I2C, WDT
+from machine import Pin, SoftI2C, I2C, WDT, reset_cause, DEEPSLEEP_RESET
 import usocket as socket
 import ssl
 import sys
 import network     
 import utime 
 import gc
-from umqtt.simple import MQTTClient
+from sens_mqtt import MqttSession
+import uasyncio as asyncio
 from bme680i2c import *
+from sens_backlog import SampleBacklog
+from sens_duty import DutyCycle
+from sens_payload import SamplePayload
+from sens_runtime import set_gc_threshold, Liveness, MqttLink, sampling_task, backlog_task, pump_task, wifi_task, wdt_task
 
 import json
-from dvco_stub.pub_stack_stub import PubStackStub
+from dvco_stub.registry import create_pub_stack
 
 # The following 5 globals will be changed based on contents of transport file
 g_wifi_ssid: str = "SSID"
@@ -25,132 +30,61 @@ g_broker_hostname: str  = ""
 g_broker_port: int = 1883
 g_broker_topic_root = "sens_dvco/"
 
-g_broker_topic: str = ""
+g_broker_topic: bytes = b""          #   encoded once, when the client id is known
 g_broker_keepalive: int =60
-g_mqtt_connected: bool = False
-g_mqtt_client = None
+g_mqtt_link: MqttLink = None       #   created when the client id is known
 g_mqtt_client_id: str = "XYZ"       #   this is calculated later based on MAC address
+g_payload = SamplePayload()         #   the payload of the current sample
+g_mqtt_payload_size: int = 256      #   size of a payload in the outbox of g_mqtt_link
+g_batch: SamplePayload = None       #   the payload of a batch of the backlog, sized once the pub stack is known
+g_backlog_file: str = "backlog"     #   flash mirror of the backlog (backlog.<n> files), None to keep it in RAM only
 g_broker_qos: int = 1
 
-g_min_delay: int = 100                   # common dividend of g_sample_interval and loop_interval
 g_sample_interval: int = 2000            #   controls sample and sending frequency
-g_sample_delay = int(g_sample_interval/g_min_delay) # e.g. 20
+g_pub_copy: bool = False            #   dopify a copy of the payload buffer (queue mode)
 
 g_wdt_timeout: int = 20000          #   controls WDT timeout
 
+g_deep_sleep: bool = False          #   duty-cycled deep-sleep mode, for battery deployments (see sens_duty.py)
+g_batch_samples: int = 8            #   deep-sleep mode: samples published together
+g_battery_mah: int = 2000           #   deep-sleep mode: battery capacity, for the battery life estimate
+g_upload_timeout: int = 30000       #   deep-sleep mode: longest upload, the samples left are published by the next one
+
 
 g_transport_file="transport.json"
 g_product_file= "product.json"
 
 
-def disconnect():
-    global g_mqtt_client
-    global g_mqtt_connected
-
-    if g_mqtt_client == None:
-        return
-    try:
-        if g_mqtt_connected == True:
-            g_mqtt_client.disconnect()
-    except Exception as e:
-        print(f"Exception in mqtt disconnect: {e}")
-
-    #   no matter what - kill it
-    g_mqtt_client = None     
-    g_mqtt_connected = False   
-
-def connect():
-    global g_mqtt_connected
-    global g_mqtt_client
-    global g_broker_hostname
-    global g_broker_port
-    global g_broker_keepalive
-
-    while g_mqtt_connected == False:
-        try:
-            g_mqtt_client = MQTTClient(g_mqtt_client_id, g_broker_hostname, g_broker_port, None, None, g_broker_keepalive)
-            res = g_mqtt_client.connect()
-            if res==0:
-                g_mqtt_connected = True
-            else:
-                g_mqtt_client = None
-                utime.sleep_ms(500)
-        except Exception as e:
-            print(f"Exception in mqtt connect: {e}")
-            g_mqtt_connected = False
-            utime.sleep_ms(500)
-
-def publish(payload):
-    global g_mqtt_client
-    global g_broker_topic
-    #   try to send an infinite number of times
-    #   after a while the WTC will stop it
-    while True:
-        connect()
-        try:
-            g_mqtt_client.publish(g_broker_topic.encode('UTF-8'),payload.encode("UTF-8"),qos=g_broker_qos)
-            break
-        except Exception as e:
-            print(f"Exception in mqtt publish: {e}")
-            disconnect()
-
-
-def dop_loop_step(pub_stack, counter: int):
-    #   here you can sample sensors etc. to form
+def dop_loop_step(pub_stack, counter: int, values):
+    #   here you can use the sensor values etc. to form
     #   the payload to be sent
-
-    err: int = 1
-    while err==1:
-        #   NOTE:
-        #   in case the sampling is not valid
-        #   then the function will enter an infinite loop, causing the WDT to go off
-        #   thus rebooting everything
-        
-        payload = {
-            "payload_number": str(counter),
-            "mem": str(gc.mem_free())
-            }
-
-        try:
-            r_temperature = bme.temperature 
-            r_humidity = bme.humidity
-            r_pressure = bme.pressure
-            r_gas = bme.gas
-
-            temperature = f"{str(round(r_temperature, 2))} C"   
-            humidity = f"{str(round(r_humidity, 2))} %"
-            pressure = f"{str(round(r_pressure, 2))} hPa"
-            gas = f"{str(round(r_gas/1000, 2))} KOhms"
-
-            
-            payload["temp"] = temperature
-            payload["hum"] = humidity
-            payload["press"] = pressure
-            payload["voc"] = gas
-            payload["err"] = "0"
-            
-            err=0
-
-        except OSError as e:
-            payload["err"] = 1
-            utime.sleep_ms(500)
-            err=1
-
-        payload_str = json.dumps(payload)
-        print(payload_str)    
-        #publish(payload)
-        res = pub_stack.dopify(payload_str)
+    #   values is the result of bme.poll_measurement(True), None if the sensor could not be read
+
+    #   the payload is written in place, in a buffer allocated once: see sens_payload.py
+    payload = g_payload.fill(counter, gc.mem_free(), values, len(g_backlog))
+    sys.stdout.write(payload)
+    sys.stdout.write("\n")
+    if values is not None and not g_mqtt_link.connected:
+        #   kept in the backlog, dopified in batches once the broker is reached again
+        g_backlog.append(counter, values)
+        return
+    #   queued messages stay in the pub stack until it is pumped: they get their own copy
+    res = pub_stack.dopify(bytes(payload) if g_pub_copy else payload)
 
 
 def mac2Str(mac): 
     return ''.join([f"{b:02X}" for b in mac])
 
 
-print('You can ctrl-c now')
-utime.sleep_ms(5000)
-print('Too late')
+if reset_cause() != DEEPSLEEP_RESET:
+    print('You can ctrl-c now')
+    utime.sleep_ms(5000)
+    print('Too late')
+
 
 
+#   the samples taken while the broker cannot be reached, with those left before a reboot
+g_backlog = SampleBacklog(256, g_backlog_file)
 
 #   start the wdt
 g_main_wdt = WDT(timeout = g_wdt_timeout)
@@ -190,6 +124,41 @@ print("I2C device found " + str(devices[0]))
 bme = BME680_I2C(i2c=i2c,address=devices[0])
 
 
+if g_deep_sleep:
+    #   duty-cycled mode: a sample per wake-up, kept in RTC memory, and WiFi started every
+    #   g_batch_samples samples to publish them; the board deep-sleeps in between
+    duty = DutyCycle(g_sample_interval, g_batch_samples, battery_mah=g_battery_mah)
+    duty.measure(bme)
+    if duty.due:
+        nic = duty.wifi_up(g_wifi_ssid, g_wifi_pwd, g_wdt_timeout // 2, g_main_wdt)
+        if nic is not None:
+            g_mqtt_client_id = mac2Str(nic.config('mac'))
+            g_broker_topic = (g_broker_topic_root + g_mqtt_client_id).encode('UTF-8')
+            session = MqttSession(g_mqtt_client_id, g_broker_hostname, g_broker_port, g_broker_keepalive,
+                                  g_wdt_timeout // 8)
+            with open(g_product_file) as conf:
+                dvco_conf = json.loads(conf.read())
+            err, pub_stack = create_pub_stack(dvco_conf)
+            if err.isError():
+                print(err)
+            else:
+                #   the batches are dopified, then published by the callback, waiting for their PUBACK
+                pub_stack.restore_state(duty.pub_state)
+                pub_stack.set_pub_callback(lambda payload, userdata: duty.send(payload))
+                g_batch = SamplePayload(g_mqtt_payload_size - pub_stack.overhead())
+
+                def dopify_batch(payload):
+                    pub_stack.dopify(bytes(payload))
+                    pub_stack.flush(g_wdt_timeout // 4)
+                    if len(pub_stack.take_pending()) > 0:
+                        raise OSError("batch not published by the pub stack")
+
+                duty.upload(session, g_broker_topic, g_batch, dopify_batch, wdt=g_main_wdt,
+                            timeout_ms=g_upload_timeout)
+                duty.pub_state = pub_stack.save_state()
+    duty.sleep()
+
+
 #   initialize wifi phy layer
 nic = network.WLAN(network.STA_IF) 
 nic.active(True) 
@@ -218,13 +187,26 @@ print()
 print(nic.ifconfig())
 
 
+#   get the MAC ADDRESS and use it as the mqtt client id and for the topic label
+mac = nic.config('mac')
+g_mqtt_client_id = mac2Str(mac)
+g_broker_topic = (g_broker_topic_root + g_mqtt_client_id).encode('UTF-8')
+
+#   the MQTT session, kept up by the mqtt task: a blocking socket operation lasts at most
+#   1/8 of the WDT timeout, so that a connection attempt (connect, CONNECT, CONNACK) ends
+#   before the WDT fires
+g_mqtt_link = MqttLink(MqttSession(g_mqtt_client_id, g_broker_hostname, g_broker_port, g_broker_keepalive,
+                                   g_wdt_timeout // 8),
+                       g_broker_topic, g_broker_qos, payload_size=g_mqtt_payload_size,
+                       ack_timeout_ms=g_wdt_timeout // 4)
+
+
 ###########################
 # DVCO
 ###########################
 
-def publish_callback(payload: str, userdata):
-    print(payload)
-    publish(payload)
+def publish_callback(payload: bytes, userdata):
+    g_mqtt_link.publish(payload)
 
 with open(g_product_file) as conf:
     try:
@@ -232,44 +214,55 @@ with open(g_product_file) as conf:
     except Exception: 
         print("error in reading product file")
 
-pub_stack = PubStackStub()
-pub_stack.init(dvco_conf)
+#   the implementation is selected by the pub_stack key of the product file
+err, pub_stack = create_pub_stack(dvco_conf)
+if err.isError():
+    print(err)
+    sys.exit()
 pub_stack.set_pub_callback(publish_callback)
+#   a batch and the bytes the pub stack adds to it fit in a payload of the outbox
+g_batch = SamplePayload(g_mqtt_payload_size - pub_stack.overhead())
+g_pub_copy = dvco_conf.get("queue", 0) == 1
 
 
 
-loop_interval = dvco_conf['loop_interval']
-pump_delay = int(loop_interval/g_min_delay) # pump every pump_delay iterations
-
-dvco_counter = 0
-sample_counter = 0
-
-#   main logic loop
-while True:
-    if not nic.isconnected():
-        break
-    #   get the MAC ADDRESS and use it as the mqtt client id and for the topic label
-    mac = nic.config('mac')
-    g_mqtt_client_id = mac2Str(mac)
-    g_broker_topic = g_broker_topic_root + g_mqtt_client_id
-
-    
-    if dvco_counter % pump_delay == 0:    
-        pub_stack.pump()
-        dvco_counter = 0
+#   set when a message is dopified, so that pump_task pumps the stack at once
+g_pump_work = asyncio.Event()
 
+def on_sample(counter: int, values):
     #   dop_loop_step holds the main logic of the program
     #   for instance, dop_loop_step can integrate with sensors etc.
-    if sample_counter % g_sample_delay == 0:
-        dop_loop_step(pub_stack, counter)
-        counter = counter + 1
-        sample_counter = 0
-
-    
-    dvco_counter += 1
-    sample_counter += 1
-    utime.sleep_ms(g_min_delay)
-    g_main_wdt.feed()
-    gc.collect()
+    dop_loop_step(pub_stack, counter, values)
+    g_pump_work.set()
+
+def on_batch(payload):
+    #   a batch of the backlog goes through the pub stack as the samples do, pumped at once:
+    #   it is in the outbox of g_mqtt_link when backlog_task waits for its PUBACK
+    pub_stack.dopify(bytes(payload) if g_pub_copy else payload)
+    pub_stack.pump()
+
+
+async def main():
+    #   the samples allocate little: collect the heap by threshold, not at every sample
+    set_gc_threshold()
+
+    #   a task silent for longer than its limit stops the WDT feeding, thus rebooting everything:
+    #   the sampling task is silent while the sensor cannot be read
+    liveness = Liveness()
+    liveness.register("sampling", g_wdt_timeout)
+    liveness.register("pump", g_wdt_timeout // 2)
+    liveness.register("mqtt", g_wdt_timeout // 2)
+    liveness.register("wifi", g_wdt_timeout // 2)
+
+    asyncio.create_task(sampling_task(bme, g_sample_interval, on_sample, liveness))
+    asyncio.create_task(pump_task(pub_stack, g_pump_work, liveness))
+    asyncio.create_task(g_mqtt_link.run(nic, liveness))
+    asyncio.create_task(backlog_task(g_backlog, g_mqtt_link, g_batch, on_batch))
+    asyncio.create_task(wifi_task(nic, g_wifi_ssid, g_wifi_pwd, liveness))
+    await wdt_task(g_main_wdt, liveness, g_wdt_timeout // 4)
+
+
+#   main logic: the tasks of sens_runtime.py
+asyncio.run(main())
     
 
@@ -26,6 +26,7 @@ SOFTWARE.
 import sys
 import fcntl
 import threading
+import time
 import weakref
 
 CO2METER_CO2 = 0x50
@@ -33,6 +34,8 @@ CO2METER_TEMP = 0x42
 CO2METER_HUM = 0x44
 HIDIOCSFEATURE_9 = 0xC0094806
 
+_FIELD_NAMES = {CO2METER_CO2: 'co2', CO2METER_TEMP: 'temperature', CO2METER_HUM: 'humidity'}
+
 def _co2_worker(weak_self):
     while True:
         self = weak_self()
@@ -57,6 +60,11 @@ class CO2Meter:
     def __init__(self, device="/dev/hidraw0", callback=None):
         self._device = device
         self._callback = callback
+        self._values = {}
+        #   per operation (monotonic ns, wall clock ns) capture time
+        self._timestamps = {}
+        #   estimate of wall clock - monotonic clock, in ns
+        self._clock_offset_ns = None
         self._file = open(device, "a+b", 0)
 
         if sys.version_info >= (3,):
@@ -74,6 +82,8 @@ class CO2Meter:
     def _read_data(self):
         try:
             result = self._file.read(8)
+            mono_ns = time.monotonic_ns()
+            wall_ns = time.time_ns()
             if sys.version_info >= (3,):
                 data = list(result)
             else:
@@ -87,6 +97,8 @@ class CO2Meter:
                 operation = decrypted[0]
                 val = decrypted[1] << 8 | decrypted[2]
                 self._values[operation] = val
+                self._timestamps[operation] = (mono_ns, wall_ns)
+                self._update_clock_offset(wall_ns - mono_ns)
                 if self._callback is not None:
                     if operation == CO2METER_CO2:
                         self._callback(sensor=operation, value=val)
@@ -131,6 +143,38 @@ class CO2Meter:
         return " ".join("%02X" % e for e in data)
 
 
+    def _update_clock_offset(self, offset_ns):
+        # exponentially weighted (1/8), so that a wall clock step
+        # (e.g. an NTP correction) is followed without jitter
+        if self._clock_offset_ns is None:
+            self._clock_offset_ns = offset_ns
+        else:
+            self._clock_offset_ns += (offset_ns - self._clock_offset_ns) >> 3
+
+
+    @property
+    def clock_offset_ns(self):
+        return self._clock_offset_ns
+
+
+    @property
+    def device(self):
+        return self._device
+
+
+    @property
+    def running(self):
+        return self._running
+
+
+    def close(self):
+        self._running = False
+        try:
+            self._file.close()
+        except Exception:
+            pass
+
+
     def get_co2(self):
         if not self._running:
             raise IOError("worker thread couldn't read data")
@@ -160,6 +204,18 @@ class CO2Meter:
         return result
 
 
+    def get_timestamps(self):
+        """Capture times of the values returned by get_data, as integer ns"""
+        timestamps = dict(self._timestamps)
+        result = {'ts_ns': {}, 'mono_ns': {}, 'clock_offset_ns': self._clock_offset_ns}
+        for operation, name in _FIELD_NAMES.items():
+            if operation in timestamps:
+                mono_ns, wall_ns = timestamps[operation]
+                result['ts_ns'][name] = wall_ns
+                result['mono_ns'][name] = mono_ns
+        return result
+
+
     def get_data(self):
         result = {}
         result.update(self.get_co2())
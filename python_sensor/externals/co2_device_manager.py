@@ -0,0 +1,173 @@
+"""
+Hot-plug discovery of CO2 meters on the hidraw subsystem.
+
+The manager scans the sysfs hidraw class directory for devices whose HID id
+matches the meter vendor/product ids, attaches a CO2Meter to every new device
+and detaches the meters whose device vanished or whose worker thread stopped.
+Rescans are rate limited, so that the manager can be polled from a sampling
+loop without busy-looping on the filesystem.
+"""
+
+import os
+import threading
+import time
+
+from python_sensor.externals.CO2Meter import CO2Meter
+
+CO2METER_VENDOR_ID = 0x04d9
+CO2METER_PRODUCT_ID = 0xa052
+
+HIDRAW_SYSFS_ROOT = "/sys/class/hidraw"
+HIDRAW_DEV_ROOT = "/dev"
+
+
+def _read_hid_id(uevent_path: str):
+    """Return the (vendor_id, product_id) tuple found in a hid uevent file,
+    None if the file cannot be read or does not declare a HID_ID."""
+    try:
+        with open(uevent_path, "r") as f:
+            for line in f:
+                if line.startswith("HID_ID="):
+                    #   HID_ID=0003:000004D9:0000A052 (bus:vendor:product)
+                    fields = line.strip().split("=", 1)[1].split(":")
+                    return int(fields[1], 16), int(fields[2], 16)
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+class CO2DeviceManager:
+
+    def __init__(self,
+                 vendor_id: int = CO2METER_VENDOR_ID,
+                 product_id: int = CO2METER_PRODUCT_ID,
+                 sysfs_root: str = HIDRAW_SYSFS_ROOT,
+                 dev_root: str = HIDRAW_DEV_ROOT,
+                 rescan_interval: float = 5.0,
+                 meter_factory=CO2Meter):
+        self._vendor_id = vendor_id
+        self._product_id = product_id
+        self._sysfs_root = sysfs_root
+        self._dev_root = dev_root
+        #   minimum number of seconds between two sysfs scans
+        self._rescan_interval = max(0.0, rescan_interval)
+        self._meter_factory = meter_factory
+
+        self._meters: dict = {}         #   hidraw node name -> meter
+        self._current = None            #   meter that served the last get_data
+        self._last_scan: float = None
+        self._lock = threading.Lock()
+
+
+    @property
+    def devices(self) -> list:
+        """ Device paths of the attached meters. """
+        with self._lock:
+            return [m.device for m in self._meters.values()]
+
+
+    def scan(self) -> dict:
+        """ Return the matching hidraw nodes as a {name: device path} dict. """
+        found: dict = {}
+        try:
+            names = sorted(os.listdir(self._sysfs_root))
+        except OSError:
+            return found
+
+        for name in names:
+            hid_id = _read_hid_id(os.path.join(self._sysfs_root, name, "device", "uevent"))
+            if hid_id == (self._vendor_id, self._product_id):
+                found[name] = os.path.join(self._dev_root, name)
+        return found
+
+
+    def rescan(self, force: bool = False) -> tuple:
+        """ Attach new devices and detach vanished or failed ones.
+
+        The sysfs tree is scanned at most once every rescan_interval seconds,
+        unless force is True. Returns the (attached, detached) lists of
+        device paths.
+        """
+        with self._lock:
+            detached: list = self._reap()
+
+            now = time.monotonic()
+            if not force and self._last_scan is not None and \
+                    (now - self._last_scan) < self._rescan_interval:
+                return [], detached
+            self._last_scan = now
+
+            found = self.scan()
+            for name in list(self._meters.keys()):
+                if name not in found:
+                    detached.append(self._detach(name))
+
+            attached: list = []
+            for name, path in found.items():
+                if name in self._meters:
+                    continue
+                try:
+                    self._meters[name] = self._meter_factory(path)
+                    attached.append(path)
+                except Exception as e:
+                    #   the node may still be owned by root while udev applies the rules:
+                    #   it will be retried at the next scan
+                    print(f"CO2 meter {path} cannot be attached: {e}")
+
+        for path in attached:
+            print(f"CO2 meter attached: {path}")
+        for path in detached:
+            print(f"CO2 meter detached: {path}")
+        return attached, detached
+
+
+    def get_data(self) -> dict:
+        """ Return the data of the first running meter, an empty dict if
+        no meter is currently attached. """
+        self.rescan()
+        with self._lock:
+            for name in sorted(self._meters.keys()):
+                meter = self._meters[name]
+                try:
+                    data = meter.get_data()
+                except IOError:
+                    continue
+                self._current = meter
+                return data
+        self._current = None
+        return {}
+
+
+    def get_timestamps(self) -> dict:
+        """ Capture times of the values returned by the last get_data. """
+        meter = self._current
+        if meter is None:
+            return {'ts_ns': {}, 'mono_ns': {}, 'clock_offset_ns': None}
+        return meter.get_timestamps()
+
+
+    @property
+    def clock_offset_ns(self) -> int:
+        meter = self._current
+        return None if meter is None else meter.clock_offset_ns
+
+
+    def close(self):
+        with self._lock:
+            for name in list(self._meters.keys()):
+                self._detach(name)
+
+
+    def _reap(self) -> list:
+        """ Detach the meters whose worker stopped reading. Lock must be held. """
+        return [self._detach(name) for name, meter in list(self._meters.items())
+                if not meter.running]
+
+
+    def _detach(self, name: str) -> str:
+        """ Lock must be held. """
+        meter = self._meters.pop(name)
+        if meter is self._current:
+            self._current = None
+        meter.close()
+        return meter.device
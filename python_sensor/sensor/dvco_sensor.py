@@ -10,7 +10,6 @@
 #   Changed logic of callback method
 
 import argparse
-import datetime
 import json
 import os
 import signal
@@ -18,17 +17,23 @@ import time
 from threading import Event, Thread, Lock
 
 from python_sensor.externals.CO2Meter import *
+from python_sensor.externals.co2_device_manager import *
 from common.python.utils import DopUtils
-from common.python.error import DopError
+from common.python.error import DopError, DopConstError, DOP_OK
 from common.python.threads import DopStopEvent
-from mqtt_output import MqttClient
+from common.python.supervisor import DopSupervisor
+from common.python.error_stats import global_error_stats, write_snapshot
+from mqtt_output import MqttClientPool, MQTT_SCHEMA
+from sensor_config import CO2_SCHEMA, PROG_SCHEMA
+from spill_file import spill_messages, load_spilled, replace_spilled
 
-from dvco_stub.pub_stack_stub import PubStackStub
+from dvco_stub.pub_stack_host import PubStackHost
 
-#   usage: sensor.py -c configFile.yaml -p product.json
+#   usage: sensor.py -c configFile.yaml -p product.json [product2.json ...]
 
 global_stop_event: DopStopEvent
 global_print_lock: Lock
+global_supervisor: DopSupervisor
 
 
 def get_args(argl = None):
@@ -39,8 +44,9 @@ def get_args(argl = None):
         help = "The configuration file for the main program.", 
         required = True)
     
-    parser.add_argument("-p", "--product",
-        help = "The product configuration file for the DVCO stack.")
+    parser.add_argument("-p", "--product", nargs = "+", required = True,
+        help = "The product configuration file(s) for the DVCO stack: \
+                                one pub stack is created for every product.")
     
     return parser.parse_args()
 
@@ -83,20 +89,23 @@ def synced_print(msg: str):
     
 
 
-def publish(payload: str, userdata) -> DopError:
+PUB_FAILURE = DopConstError(2, "pub failure")
+
+
+def publish(payload: bytes, userdata, topic: str = None) -> DopError:
     """The synchronization of the access to this method is responsibility of
     the calling context"""
     publisher_userdata: PublisherUserdata = userdata
     output_provider = publisher_userdata.output_provider
     
-    err = output_provider.write(payload)
+    err = output_provider.write(payload, topic)
 
     if err.isError():
         print(f"pub failure")
-        return DopError(2, "pub failure")
+        return PUB_FAILURE
     else:
         print(f"pub ok")
-    return DopError()
+    return DOP_OK
 
     """
     # A logic that retries to publish the message can be implemented here e.g.
@@ -116,86 +125,194 @@ def publish(payload: str, userdata) -> DopError:
     
 
 
-def publish_callback(payload: str, userdata) -> DopError:
-    """Synchronization required in the calling context, i.e. dvco stack"""
+def publish_callback(payload: bytes, topic: str, userdata) -> DopError:
+    """Output of the pub stack host: the output provider is a pool of
+    connections that synchronizes the access to each of them"""
     print(payload)
-    return publish(payload, userdata)
+    return publish(payload, userdata, topic)
 
 
 
-def thread_dvco(configuration: dict, pub_stack, verbose):
-    loop_interval = configuration['loop_interval']
-    
+def publish_batch_callback(payloads: list, topic: str, userdata) -> list:
+    """Output of the pub stack host, see publish_callback"""
+    publisher_userdata: PublisherUserdata = userdata
+    output_provider = publisher_userdata.output_provider
+
+    errors = output_provider.write_many(payloads, topic)
+
+    failures: int = len([err for err in errors if err.isError()])
+    print(f"pub batch: {len(payloads) - failures} ok, {failures} failures")
+    return [PUB_FAILURE if err.isError() else DOP_OK for err in errors]
+
+
+
+def thread_dvco(pub_host: PubStackHost, loop_interval: int, verbose):
+    #   the pub stacks report when they need to be pumped (pending messages or
+    #   their loop_interval schedule): the thread sleeps until the first of
+    #   them is due, or until the stop event is set. The wait is bounded by
+    #   loop_interval (ms), since a stack may have nothing scheduled at all
+    #   (e.g. in queue mode, where its workers pump): the thread still beats
     while True:   
         if global_stop_event.is_exiting():
             break 
         
-        pub_stack.pump()
-
-        time.sleep(loop_interval/1000)
+        if pub_host.wait_pump(loop_interval):
+            pub_host.pump()
+        global_supervisor.beat('dvco')
         
 
     
 
-def thread_co2(configuration: dict, pub_stack, userdata, verbose):
-    run: int = int(configuration['run'])
+def report_status(status: dict, pub_host: PubStackHost = None, stats_file: str = None):
+    msg = {"hrMsg":"workers status",
+        "workers": status
+    }
+    if pub_host is not None:
+        msg["products"] = pub_host.stats()
+    errors = global_error_stats.snapshot()
+    msg["errors"] = errors
+    synced_print(json.dumps(msg))
+
+    #   the error accounting is also exported to a file, for the monitoring tools
+    if stats_file is not None:
+        err = write_snapshot(errors, stats_file)
+        if err.isError():
+            synced_print(err)
+
+
+def report_startup(start: float):
+    msg = {"hrMsg":"startup metrics",
+        "startup_ms": round((time.perf_counter() - start) * 1000, 3),
+        "config_load": DopUtils.config_load_stats()
+    }
+    synced_print(json.dumps(msg))
+
+
+def replay_spilled(output_provider, spill_file: str):
+    """the messages saved by the previous shutdown are published first"""
+    if spill_file is None:
+        return
+    err, messages = load_spilled(spill_file)
+    if err.isError():
+        synced_print(err)
+        #   the corrupt lines (404) are dropped when the file is replaced below
+        if err.code != 404:
+            return
+    elif len(messages) == 0:
+        return
+
+    #   the messages that fail again are kept in the spill file, for the next start
+    failed: list = []
+    for payload, topic in messages:
+        if output_provider.write(payload, topic).isError():
+            failed.append((payload, topic))
+    err = replace_spilled(spill_file, failed)
+    if err.isError():
+        synced_print(err)
+    msg = {"hrMsg":"spilled messages replayed",
+        "replayed": len(messages) - len(failed),
+        "failed": len(failed)
+    }
+    synced_print(json.dumps(msg))
+
+
+def shutdown(output_provider, drain_timeout: int, spill_file: str, pub_host: PubStackHost):
+    """ordered shutdown, once the workers have stopped sampling: flush the queues
+    of the pub stacks, wait
+    for the acknowledgement of the messages in flight until the drain deadline,
+    then save the messages left to the spill file (dropped if there is none)"""
+    deadline: float = time.monotonic() + drain_timeout
+    in_flight: int = output_provider.outstanding()
+    flushed: int = 0
+    if output_provider.connected:
+        flushed = pub_host.flush(drain_timeout * 1000)
+    output_provider.wait_outstanding(max(0, deadline - time.monotonic()))
+    pending: list = output_provider.take_outstanding()
+    unacked: int = len(pending)
+    pending.extend(pub_host.take_pending())
+    spilled: int = 0
+    if spill_file is not None and len(pending) > 0:
+        err = spill_messages(spill_file, pending)
+        if err.isError():
+            synced_print(err)
+        else:
+            spilled = len(pending)
+
+    msg = {"hrMsg":"shutdown",
+        "drained": in_flight + flushed - unacked,
+        "spilled": spilled,
+        "dropped": len(pending) - spilled
+    }
+    synced_print(json.dumps(msg))
+
+
+def create_co2_sensor(configuration):
+    """driver=auto discovers the meter on the hidraw subsystem and
+    re-attaches it if the USB device re-enumerates"""
+    if configuration.driver != 'auto':
+        return CO2Meter(configuration.driver)
+
+    return CO2DeviceManager(vendor_id=configuration.vendor_id, product_id=configuration.product_id,
+                            sysfs_root=configuration.sysfs_root, rescan_interval=configuration.rescan)
+
 
-    if run!=1:
+def thread_co2(configuration, pub_host: PubStackHost, userdata, verbose):
+    if not configuration.run:
         return
 
-    co2_driver = configuration['driver']
-    sleep: int     = int(configuration['sleep'])
+    sleep: int     = configuration.sleep
 
-    sensor = CO2Meter(co2_driver)
+    sensor = create_co2_sensor(configuration)
 
     counter:int = 0
 
-    while True:   
-        if global_stop_event.is_exiting():
-            break
-        #d = {}
-        d = sensor.get_data()
-        d['now'] = str(datetime.datetime.now())
-        d['payload_number'] = f"{counter}"
-        counter = counter +1
+    #   closed on the way out, also when the supervisor restarts the worker:
+    #   the restart opens the device again
+    try:
+        while True:   
+            if global_stop_event.is_exiting():
+                break
+            #d = {}
+            d = sensor.get_data()
+            if len(d) > 0:
+                global_supervisor.beat('co2')
+            d.update(sensor.get_timestamps())
+            d['payload_number'] = f"{counter}"
+            counter = counter +1
         
-        #   dopify
-        payload: str = str(d)
+            #   dopify
+            payload: str = str(d)
         
-        if verbose:
-            msg = {"hrMsg":"TRACE unencrypted payload",
-                "payload": payload
-            }   
-            synced_print(json.dumps(msg))
+            if verbose:
+                msg = {"hrMsg":"TRACE unencrypted payload",
+                    "payload": payload
+                }   
+                synced_print(json.dumps(msg))
 
 
-        res = pub_stack.dopify(payload.encode("UTF-8"))
-        err = res[0]
-        dopified_mess = res[1] 
-        #synced_print(dopified_mess.decode("UTF-8"))
+            #   the same reading is dopified by the pub stack of every product
+            res = pub_host.dopify_all(payload.encode("UTF-8"))
 
-        global_stop_event.wait(sleep)
+            global_stop_event.wait(sleep)
+    finally:
+        sensor.close()
 
 
 def main(args) -> DopError:
+    startup_start = time.perf_counter()
 
     #   Parse arguments
     config_file = args.config 
-    product_file = args.product 
+    product_files = args.product 
 
 
     if not os.path.exists(config_file):
         return DopError(101,"Configuration file does not exist")
 
-    if not os.path.exists(product_file):
-        return DopError(101,"Configuration file does not exist")  
-
-    #   prog default
-    verbose: bool = False
+    for product_file in product_files:
+        if not os.path.exists(product_file):
+            return DopError(101,"Configuration file does not exist")  
 
-    #   co2 driver default/init
-    co2_driver: str = ""
-    co2_sleep: int = 5
     
     userdata: PublisherUserdata = None
 
@@ -206,43 +323,37 @@ def main(args) -> DopError:
     if err.isError():
         return err
 
-    #   CO2
-    co2_c = conf['co2']
-    err, co2_conf = DopUtils.config_to_dict(co2_c['configuration'])
+    #   the sections are compiled once: a bad configuration fails here
+    err, co2_conf = CO2_SCHEMA.compile(conf['co2']['configuration'])
     if err.isError():
         return err
 
-
-    #   mandatory args
-    if 'driver' in co2_conf:
-        co2_driver = co2_conf['driver']
-    else:
-        return DopError(10,'Missing arg: co2: driver') 
-
-    if 'sleep' in co2_conf:
-        co2_sleep = int(co2_conf['sleep'])
-
-    #   PROG
-    prog_c = conf['prog']
-    err, prog_conf = DopUtils.config_to_dict(prog_c['configuration'])
+    err, prog_conf = PROG_SCHEMA.compile(conf['prog']['configuration'])
     if err.isError():
-        return err 
+        return err
 
-    
-    if 'v' in prog_conf:
-        verbose = (prog_conf['v'] == '1')
+    verbose: bool = prog_conf.verbose
+    co2_driver: str = co2_conf.driver
+    co2_sleep: int = co2_conf.sleep
+    #   supervisor: backoff bounds and status report interval, in seconds
+    backoff_min: int = prog_conf.backoff_min
+    backoff_max: int = prog_conf.backoff_max
+    report_interval: int = prog_conf.report
+    #   error accounting snapshot, written at every report
+    stats_file: str = prog_conf.stats
+    #   shutdown
+    drain_timeout: int = prog_conf.drain
+    spill_file: str = prog_conf.spill
 
     #   MQTT OUTPUT CLIENT
 
-    mqtt_c = conf['mqtt']
-    mqtt_conf = mqtt_c['configuration']
-    err, mqtt_conf_dict = DopUtils.config_to_dict(mqtt_conf)
+    err, mqtt_conf = MQTT_SCHEMA.compile(conf['mqtt']['configuration'])
+    if err.isError():
+        return err
 
-    mqtt_client = MqttClient()
+    #   one pool of connections shared by all the products
+    mqtt_client = MqttClientPool()
 
-    tv, host = DopUtils.config_get_string(mqtt_conf_dict, ['h'], None)
-    tv, port = DopUtils.config_get_int(mqtt_conf_dict, ['p'], 1883)
-    tv, topic = DopUtils.config_get_string(mqtt_conf_dict, ['t'], None)
     prov_err = mqtt_client.init(mqtt_conf)
     if prov_err.isError():
         return prov_err
@@ -251,20 +362,33 @@ def main(args) -> DopError:
     prov_err = mqtt_client.open()
     if prov_err.isError():
         return prov_err
+    replay_spilled(mqtt_client, spill_file)
 
     # ========================================================
     #   Publisher Configuration file
     # ========================================================
 
-    dvco_conf = {}
-    with open(product_file) as conf:
-        try:
-            dvco_conf = json.loads(conf.read())
-        except Exception: 
-            return DopError(2, "Error in loading JSON configuration file.")
-    
-    if 'loop_interval' not in dvco_conf:
-        return DopError(11,"Missing product arg: loop_interval")
+    #   one pub stack per product, keyed by the product_id of the product
+    #   file (default: the file name without extension)
+    pub_host = PubStackHost()
+    loop_interval: int = -1
+    for product_file in product_files:
+        dvco_conf = {}
+        with open(product_file) as conf:
+            try:
+                dvco_conf = json.loads(conf.read())
+            except Exception: 
+                return DopError(2, "Error in loading JSON configuration file.")
+        
+        if 'loop_interval' not in dvco_conf:
+            return DopError(11,"Missing product arg: loop_interval")
+        if loop_interval < 0 or dvco_conf['loop_interval'] < loop_interval:
+            loop_interval = dvco_conf['loop_interval']
+
+        product_id = dvco_conf.get('product_id', os.path.splitext(os.path.basename(product_file))[0])
+        err = pub_host.add_product(product_id, dvco_conf)
+        if err.isError():
+            return err
 
 
     # Userdata 
@@ -277,36 +401,39 @@ def main(args) -> DopError:
 
 
     if verbose:
-        print(f'Broker host       : {host}')
-        print(f'Broker port       : {port}')
-        print(f'Bbroker topic     : {topic}') 
+        print(f'Broker host       : {mqtt_conf.host}')
+        print(f'Broker port       : {mqtt_conf.port}')
+        print(f'Broker topic      : {mqtt_conf.topic}') 
 
         print(f'CO2 driver        : {co2_driver}')
         print(f'CO2 sleep         : {co2_sleep}')
+        print(f'Products          : {pub_host.product_ids()}')
 
     
 
-    # Pub stack
-    pub_stack = PubStackStub()
-    pub_stack.init(dvco_conf)
-    pub_stack.attach_stop_event(global_stop_event)
-    pub_stack.set_pub_userdata(userdata)
-    pub_stack.set_pub_callback(publish_callback)
+    # Pub stacks
+    #   the implementation of each stack is selected by the pub_stack key of its product file
+    pub_host.attach_stop_event(global_stop_event)
+    pub_host.set_output(publish_callback, publish_batch_callback, userdata)
 
     # ====================================================================================
     # Main Program
     # ====================================================================================
 
-    dvco_t = Thread(target = thread_dvco, args=(dvco_conf, pub_stack, verbose))
-    dvco_t.start()
-
-    co2_t = Thread(target=thread_co2, args=(co2_conf, pub_stack, userdata, verbose))
-    co2_t.start()
+    global global_supervisor
+    global_supervisor = DopSupervisor(global_stop_event, backoff_min, backoff_max)
+    global_supervisor.add_worker('dvco', thread_dvco, (pub_host, loop_interval, verbose))
+    global_supervisor.add_worker('co2', thread_co2, (co2_conf, pub_host, userdata, verbose))
+    global_supervisor.start()
+    report_startup(startup_start)
 
     time.sleep(1)
     
-    dvco_t.join()
-    co2_t.join()
+    global_supervisor.join(report_interval,
+                           lambda status: report_status(status, pub_host, stats_file))
+
+    #   the stop event is set and the workers have ended
+    shutdown(mqtt_client, drain_timeout, spill_file, pub_host)
 
     prov_err = mqtt_client.close()
     return prov_err
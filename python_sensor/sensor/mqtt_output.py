@@ -19,9 +19,30 @@ import uuid
 from inspect import currentframe, getframeinfo
 import traceback
 
-from common.python.error import DopError
-from common.python.utils import DopUtils 
+from common.python.error import DopError, DOP_OK, dop_error
+from common.python.error_stats import global_error_stats
 from common.python.threads import DopStopEvent
+from common.python.config_schema import ConfigSchema, ConfigField
+
+
+#   connstring example
+#   host=10.170.30.66;port=1883;topic=test_topic;retrycount=10;keepalive=60;qos=1;timeout=10;prefix=grz_;
+#   h=10.170.30.66;p=1883;t=test_topic;rc=10;ka=60;q=1;tout=10;prf=grz_;
+#   maxorphaned (mo) bounds the messages kept from the reconnections, to be spilled on shutdown
+MQTT_SCHEMA = ConfigSchema("mqtt", [
+    ConfigField("host", ['host','h'], required = True),
+    ConfigField("topic", ['topic','t'], required = True),
+    ConfigField("bind_address", ['bindaddress','ba'], default = ""),
+    ConfigField("port", ['port','p'], int, 1883, min_value = 1, max_value = 65535),
+    ConfigField("retry_count", ['retrycount','rc'], int, 10, min_value = 0),
+    ConfigField("keepalive", ['keepalive','ka'], int, 60, min_value = 0),
+    ConfigField("qos", ['qos','q'], int, 1, min_value = 0, max_value = 2),
+    ConfigField("timeout", ['timeout','tout'], int, 20, min_value = 0),
+    ConfigField("prefix", ['prefix','prf']),
+    ConfigField("pool", ['pool','ps'], int, 1, min_value = 1),
+    ConfigField("max_orphaned", ['maxorphaned','mo'], int, 1000, min_value = 0),
+])
+
 
 class MqttClient: 
     
@@ -47,49 +68,37 @@ class MqttClient:
         self._connection_event.clear()
         self._published_event: Event = Event()
 
-        self._userdata = None
-
-
-    def init(self,connstring: str) -> DopError:
-       
-        #   connstring example
-        #   host=10.170.30.66;port=1883;topic=test_topic;retrycount=10;keepalive=60;qos=1;timeout=10;prefix=grz_;
-        #   h=10.170.30.66;p=1883;t=test_topic;rc=10;ka=60;q=1;tout=10;prf=grz_;
-        tupleConfig = DopUtils.config_to_dict(connstring)
-        if tupleConfig[0].isError():
-            return tupleConfig[0]
-
-        #   mandatory parameters
-        has_host = False
-        has_topic = False
-        
-        d_config: dict = tupleConfig[1]
-        has_host, self._host = DopUtils.config_get_string(d_config, ['host','h'], None)
-        has_topic, self._topic = DopUtils.config_get_string(d_config, ['topic','t'], None)
+        #   messages handed to paho and not yet acknowledged (PUBACK, or sent for qos 0),
+        #   kept to be saved on shutdown: mid -> (payload, topic)
+        self._inflight: dict = {}
+        self._acked_early: set = set()      #   mids acknowledged before publish returned
+        self._orphaned: list = []           #   in flight on a previous paho client, never to be acknowledged
+        self._max_orphaned: int = 1000      #   the oldest orphaned messages are dropped beyond
+        self._inflight_lock = threading.Lock()
 
-        wfc, self._bind_address = DopUtils.config_get_string(d_config,['bindaddress','ba'],"")
-        wfc, self._port = DopUtils.config_get_int(d_config,['port','p'],1883)
-        wfc, self._max_retries = DopUtils.config_get_int(d_config,['retrycount','rc'],10)
-        wfc, self._keepalive = DopUtils.config_get_int(d_config,['keepalive','ka'],60)
-        wfc, self._qos = DopUtils.config_get_int(d_config,['qos','q'],1)
-        wfc, self._timeout = DopUtils.config_get_int(d_config,['timeout','tout'],20)
+        self._userdata = None
 
-            
-        wfc, prefix = DopUtils.config_get_string(d_config, ['prefix','prf'], None)
 
-        self._client_id = self.generate_client_id(prefix)
-            
-        if (has_host and has_topic) == False:
-            err = DopError(1,"Configuration missing mandatory parameter(s).")
-            return err
+    def init(self, config, pool_index: int = None) -> DopError:
+        """ config is the connection string, or the configuration already
+        compiled with MQTT_SCHEMA (see MqttClientPool); pool_index is the index
+        of the connection in its pool, part of the client id """
+        if isinstance(config, str):
+            err, config = MQTT_SCHEMA.compile(config)
+            if err.isError():
+                return err
 
-        if (self._qos < 0) or (self._qos>2):
-            self._qos = 1
-            print("invalid qos, using default")
+        self._host = config.host
+        self._topic = config.topic
+        self._bind_address = config.bind_address
+        self._port = config.port
+        self._max_retries = config.retry_count
+        self._keepalive = config.keepalive
+        self._qos = config.qos
+        self._timeout = config.timeout
+        self._max_orphaned = config.max_orphaned
 
-        if self._timeout < 0:
-            self._timeout = 20
-            print("invalid timeout, using default")
+        self._client_id = self.generate_client_id(config.prefix, pool_index)
 
         self._configured = True 
 
@@ -120,6 +129,7 @@ class MqttClient:
         if rc != 0:
             #   failure connecting
             err = DopError(100,"Could not connect to the broker.")
+            global_error_stats.count(err, "mqtt.connection")
             print(err)
             if self.stopEvent.is_exiting() == False:
                 if self._max_retries > self._retries_count:
@@ -135,6 +145,7 @@ class MqttClient:
         self._connection_event.clear()
         if rc != 0:
             err = DopError(103,"Unexpected disconnection.")
+            global_error_stats.count(err, "mqtt.connection")
             print(err)
 
         if self.stopEvent.is_exiting() == False:
@@ -143,27 +154,30 @@ class MqttClient:
             self.open()
 
     @staticmethod
-    def wait_for_event_status(timeout: int, event: Event, status: bool) -> bool:
+    def wait_for_event_status(timeout: int, event: Event, status: bool,
+                              stop_event: DopStopEvent = None) -> bool:
         """
         waits on event for status
-        if timeout expires, the method returns False, True otherwise
+        if timeout expires, or stop_event is set, the method returns False, True otherwise
         NOTE:       this static method could be moved to a shared/common module
         """
-        elapsed: int = 0
+        deadline: float = time.monotonic() + timeout
         while event.is_set() != status:
-            time.sleep(1)
-            elapsed += 1
-            if elapsed >= timeout:
+            if stop_event is not None and stop_event.is_exiting():
+                return False
+            if time.monotonic() >= deadline:
                 return False
+            time.sleep(0.1)
         return True
 
 
     @staticmethod
-    def generate_client_id(prefix: str) -> str:
+    def generate_client_id(prefix: str, pool_index: int = None) -> str:
         """
             this has to generate a unique id for the host.process.thread
             as on the same host there might be several processes using the provider
             and within the same process there might be several thread using the provider
+            the connections of a pool are created by the same thread: their index tells them apart
         """
         host_id: int = uuid.getnode()
         proc_id: int = os.getpid()
@@ -174,12 +188,49 @@ class MqttClient:
             strkey: str = str(host_id) + str(proc_id) + str(thrd_id)
         else:
             strkey: str = prefix + str(host_id) + str(proc_id) + str(thrd_id)
+        if pool_index is not None:
+            strkey += "." + str(pool_index)
 
         client_id: str = hashlib.md5(strkey.encode()).hexdigest()
         return client_id
 
-    def on_publish(self, client, userdata, result):  # create function for callback
-        pass
+    def on_publish(self, client, userdata, mid):  # create function for callback
+        with self._inflight_lock:
+            if self._inflight.pop(mid, None) is None:
+                self._acked_early.add(mid)
+
+    def _track(self, mid: int, payload, topic: str):
+        with self._inflight_lock:
+            if mid in self._acked_early:
+                self._acked_early.discard(mid)
+            else:
+                self._inflight[mid] = (payload, topic)
+
+    @property
+    def connected(self) -> bool:
+        return self._connection_event.is_set()
+
+    def outstanding(self) -> int:
+        """ Number of messages published and not yet acknowledged. """
+        return len(self._inflight) + len(self._orphaned)
+
+    def wait_outstanding(self, timeout: float) -> bool:
+        """ Wait up to timeout seconds for the outstanding messages to be
+        acknowledged, return True if none is left. """
+        deadline: float = time.monotonic() + timeout
+        while len(self._inflight) > 0:
+            if not self.connected or time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def take_outstanding(self) -> list:
+        """ Remove and return the messages not acknowledged, as (payload, topic). """
+        with self._inflight_lock:
+            outstanding = self._orphaned + list(self._inflight.values())
+            self._inflight = {}
+            self._orphaned = []
+        return outstanding
 
     def _open(self) -> DopError:
         try: 
@@ -192,20 +243,35 @@ class MqttClient:
                     f"{getframeinfo(currentframe()).lineno} | {type(e)} | {traceback.format_exc()}", file = sys.stderr)
             sys.stderr.flush()
 
-            return DopError(99,"An exception occurred while connecting to the broker.")
+            return global_error_stats.count(
+                DopError(99,"An exception occurred while connecting to the broker."), "mqtt.connect")
         
-        if self.wait_for_event_status(self._timeout, self._connection_event, True) == False:
+        if self.wait_for_event_status(self._timeout, self._connection_event, True, self.stopEvent) == False:
             err: DopError = DopError(101,"Cannot connect to broker: timeout expired.")
             print(err)
-            return err
+            return global_error_stats.count(err, "mqtt.connect")
 
-        return DopError()       
+        return global_error_stats.count(DOP_OK, "mqtt.connect")       
 
     def open(self) -> DopError:
         if not self._configured:
             return DopError(2, "Provider cannot open: it is not yet configured.")
             
-        self._output_client = mqtt.Client()
+        #   the messages in flight on the previous client cannot be acknowledged any more:
+        #   they are kept for the spill file, up to max_orphaned, the oldest dropped first
+        with self._inflight_lock:
+            self._orphaned.extend(self._inflight.values())
+            self._inflight = {}
+            self._acked_early = set()
+            dropped: int = len(self._orphaned) - self._max_orphaned
+            if dropped > 0:
+                del self._orphaned[:dropped]
+        if dropped > 0:
+            err = DopError(104, f"{dropped} orphaned messages dropped.")
+            global_error_stats.count(err, "mqtt.orphaned")
+            print(err)
+
+        self._output_client = mqtt.Client(client_id=self._client_id)
         self._output_client.on_publish = self.on_publish
         self._output_client.on_connect = self.on_connect
         self._output_client.on_disconnect = self.on_disconnect
@@ -239,22 +305,159 @@ class MqttClient:
         
         return err
 
-    def write(self, msg: str) -> DopError:
+    @staticmethod
+    def _as_payload(msg):
+        """
+        paho accepts str, bytes and bytearray payloads: a memoryview is passed
+        as the object it exposes when it spans all of it, otherwise it is copied
+        (a bytearray must not be modified by the caller until it is published)
+        """
+        if isinstance(msg, memoryview):
+            obj = msg.obj
+            if isinstance(obj, (bytes, bytearray)) and msg.nbytes == len(obj):
+                return obj
+            return msg.tobytes()
+        return msg
+
+    def write(self, msg, topic: str = None) -> DopError:
+        """ msg can be str, bytes, bytearray or memoryview; topic overrides the configured topic """
         try:
+            payload = self._as_payload(msg)
             err, res = self._output_client.publish(
-                self._topic, msg, qos = self._qos)
+                self._topic if topic is None else topic, payload, qos = self._qos)
 
             if err != 0:
-                return DopError(201, "An error occurred while publishing a message.")
+                return global_error_stats.count(dop_error(201), "mqtt.publish")
+            self._track(res, payload, topic)
         except Exception as e:
             print(f"{int(time.time())} | {getframeinfo(currentframe()).filename} | "\
                     f"{getframeinfo(currentframe()).lineno} | {type(e)} | {traceback.format_exc()}", file = sys.stderr)
             sys.stderr.flush()
 
-            return DopError(202, "An exception occurred while publishing a message.")
+            return global_error_stats.count(dop_error(202), "mqtt.publish")
 		
-        return DopError(0, "Event published")
+        return global_error_stats.count(DOP_OK, "mqtt.publish")
+
+
+    def write_many(self, msgs: list, topic: str = None) -> list:
+        """ Publish a batch of messages, return the list of per-message results. """
+        results: list = []
+        publish = self._output_client.publish
+        publish_topic = self._topic if topic is None else topic
+        for msg in msgs:
+            try:
+                payload = self._as_payload(msg)
+                err, res = publish(publish_topic, payload, qos = self._qos)
+                if err != 0:
+                    results.append(dop_error(201))
+                    continue
+                self._track(res, payload, topic)
+            except Exception as e:
+                print(f"{int(time.time())} | {getframeinfo(currentframe()).filename} | "\
+                        f"{getframeinfo(currentframe()).lineno} | {type(e)} | {traceback.format_exc()}", file = sys.stderr)
+                sys.stderr.flush()
+                results.append(dop_error(202))
+                continue
+            results.append(DOP_OK)
+
+        count = global_error_stats.count
+        for err in results:
+            count(err, "mqtt.publish")
+        return results
    
    
     def set_userdata(self,userdata):
-        self._userdata = userdata
\ No newline at end of file
+        self._userdata = userdata
+
+
+
+class MqttClientPool:
+    """
+    Pool of MqttClient connections to the same broker, shared by several
+    publishers (e.g. the pub stacks of several data products).
+
+    The size of the pool is set by the pool (or ps) key of the connection string
+    (default 1). Writes are spread round robin over the connections; every
+    connection is guarded by its own lock, as MqttClient.write is not thread-safe.
+    """
+
+    def __init__(self):
+        self._clients: list = []
+        self._locks: list = []
+        self._next: int = 0
+        self._next_lock = threading.Lock()
+
+    def init(self, config) -> DopError:
+        """ config is the connection string or its compiled MQTT_SCHEMA configuration """
+        if isinstance(config, str):
+            err, config = MQTT_SCHEMA.compile(config)
+            if err.isError():
+                return err
+
+        for i in range(config.pool):
+            client = MqttClient()
+            err = client.init(config, i)
+            if err.isError():
+                return err
+            self._clients.append(client)
+            self._locks.append(threading.Lock())
+        return DopError()
+
+    @property
+    def size(self) -> int:
+        return len(self._clients)
+
+    def attach_stop_event(self, stop_event: DopStopEvent):
+        for client in self._clients:
+            client.attach_stop_event(stop_event)
+
+    def open(self) -> DopError:
+        for client in self._clients:
+            err = client.open()
+            if err.isError():
+                return err
+        return DopError()
+
+    def close(self) -> DopError:
+        err = DopError()
+        for client in self._clients:
+            close_err = client.close()
+            if close_err.isError():
+                err = close_err
+        return err
+
+    def _acquire(self) -> int:
+        with self._next_lock:
+            index = self._next
+            self._next = (self._next + 1) % len(self._clients)
+        return index
+
+    @property
+    def connected(self) -> bool:
+        return any(client.connected for client in self._clients)
+
+    def outstanding(self) -> int:
+        return sum(client.outstanding() for client in self._clients)
+
+    def wait_outstanding(self, timeout: float) -> bool:
+        deadline: float = time.monotonic() + timeout
+        done: bool = True
+        for client in self._clients:
+            done = client.wait_outstanding(max(0, deadline - time.monotonic())) and done
+        return done
+
+    def take_outstanding(self) -> list:
+        outstanding: list = []
+        for client in self._clients:
+            outstanding.extend(client.take_outstanding())
+        return outstanding
+
+    def write(self, msg, topic: str = None) -> DopError:
+        index = self._acquire()
+        with self._locks[index]:
+            return self._clients[index].write(msg, topic)
+
+    def write_many(self, msgs: list, topic: str = None) -> list:
+        index = self._acquire()
+        with self._locks[index]:
+            return self._clients[index].write_many(msgs, topic)
@@ -11,23 +11,29 @@
 #   add indication of how to use new mqtt output client (not a dynamically loaded provider)
 
 import argparse
-import datetime 
+import json
 import os
 import signal
 import time
 from threading import Event, Thread, Lock
 
 from python_sensor.externals.CO2Meter import *
+from python_sensor.externals.co2_device_manager import *
 from common.python.utils import DopUtils
 from common.python.error import DopError
 from common.python.threads import DopStopEvent
-from mqtt_output import MqttClient
+from common.python.supervisor import DopSupervisor
+from common.python.error_stats import global_error_stats, write_snapshot
+from mqtt_output import MqttClient, MQTT_SCHEMA
+from sensor_config import CO2_SCHEMA, PROG_SCHEMA
+from spill_file import spill_messages, load_spilled, replace_spilled
 
 #   usage: sensor.py -c configFile.yaml
 
 # GLOBAL VARIABLES
 global_stop_event: DopStopEvent
 global_print_lock: Lock
+global_supervisor: DopSupervisor
 
 def get_args(argl = None):
     
@@ -110,34 +116,126 @@ def publish(payload: str, userdata) -> DopError:
 
 
 
-def thread_co2(configuration: dict, userdata: PublisherUserdata, verbose):
-    run: int = int(configuration['run'])
-    if run!=1:
+def report_status(status: dict, stats_file: str = None):
+    msg = {"hrMsg":"workers status",
+        "workers": status
+    }
+    errors = global_error_stats.snapshot()
+    msg["errors"] = errors
+    synced_print(json.dumps(msg))
+
+    #   the error accounting is also exported to a file, for the monitoring tools
+    if stats_file is not None:
+        err = write_snapshot(errors, stats_file)
+        if err.isError():
+            synced_print(err)
+
+
+def report_startup(start: float):
+    msg = {"hrMsg":"startup metrics",
+        "startup_ms": round((time.perf_counter() - start) * 1000, 3),
+        "config_load": DopUtils.config_load_stats()
+    }
+    synced_print(json.dumps(msg))
+
+
+def replay_spilled(output_provider, spill_file: str):
+    """the messages saved by the previous shutdown are published first"""
+    if spill_file is None:
+        return
+    err, messages = load_spilled(spill_file)
+    if err.isError():
+        synced_print(err)
+        #   the corrupt lines (404) are dropped when the file is replaced below
+        if err.code != 404:
+            return
+    elif len(messages) == 0:
+        return
+
+    #   the messages that fail again are kept in the spill file, for the next start
+    failed: list = []
+    for payload, topic in messages:
+        if output_provider.write(payload, topic).isError():
+            failed.append((payload, topic))
+    err = replace_spilled(spill_file, failed)
+    if err.isError():
+        synced_print(err)
+    msg = {"hrMsg":"spilled messages replayed",
+        "replayed": len(messages) - len(failed),
+        "failed": len(failed)
+    }
+    synced_print(json.dumps(msg))
+
+
+def shutdown(output_provider, drain_timeout: int, spill_file: str):
+    """ordered shutdown, once the workers have stopped sampling: wait
+    for the acknowledgement of the messages in flight until the drain deadline,
+    then save the messages left to the spill file (dropped if there is none)"""
+    deadline: float = time.monotonic() + drain_timeout
+    in_flight: int = output_provider.outstanding()
+    output_provider.wait_outstanding(max(0, deadline - time.monotonic()))
+    pending: list = output_provider.take_outstanding()
+    unacked: int = len(pending)
+    spilled: int = 0
+    if spill_file is not None and len(pending) > 0:
+        err = spill_messages(spill_file, pending)
+        if err.isError():
+            synced_print(err)
+        else:
+            spilled = len(pending)
+
+    msg = {"hrMsg":"shutdown",
+        "drained": in_flight - unacked,
+        "spilled": spilled,
+        "dropped": len(pending) - spilled
+    }
+    synced_print(json.dumps(msg))
+
+
+def create_co2_sensor(configuration):
+    """driver=auto discovers the meter on the hidraw subsystem and
+    re-attaches it if the USB device re-enumerates"""
+    if configuration.driver != 'auto':
+        return CO2Meter(configuration.driver)
+
+    return CO2DeviceManager(vendor_id=configuration.vendor_id, product_id=configuration.product_id,
+                            sysfs_root=configuration.sysfs_root, rescan_interval=configuration.rescan)
+
+
+def thread_co2(configuration, userdata: PublisherUserdata, verbose):
+    if not configuration.run:
         return
 
-    co2_driver = configuration['driver']
-    sleep: int     = int(configuration['sleep'])
+    sleep: int     = configuration.sleep
 
-    sensor = CO2Meter(co2_driver)
+    sensor = create_co2_sensor(configuration)
 
-    while True:   
-        if global_stop_event.is_exiting():
-            break
-        #d = {}
-        d = sensor.get_data()
-        d['now']=str(datetime.datetime.now())
+    #   closed on the way out, also when the supervisor restarts the worker:
+    #   the restart opens the device again
+    try:
+        while True:   
+            if global_stop_event.is_exiting():
+                break
+            #d = {}
+            d = sensor.get_data()
+            if len(d) > 0:
+                global_supervisor.beat('co2')
+            d.update(sensor.get_timestamps())
 
-        #   send to broker
-        payload: str = str(d)
-        synced_print(payload)
+            #   send to broker
+            payload: str = str(d)
+            synced_print(payload)
 
-        err = publish(payload, userdata)
+            err = publish(payload, userdata)
 
-        global_stop_event.wait(sleep)
+            global_stop_event.wait(sleep)
+    finally:
+        sensor.close()
 
 
 
 def main(args) -> DopError:
+    startup_start = time.perf_counter()
 
     #   Parse arguments
     config_file = args.config 
@@ -147,12 +245,6 @@ def main(args) -> DopError:
         return DopError(101,"Configuration file does not exist")
 
 
-    #   prog default
-    verbose: bool = False
-
-    #   co2 driver default/init
-    co2_driver: str = ""
-    co2_sleep: int = 5
     
     userdata: PublisherUserdata = None
 
@@ -163,41 +255,36 @@ def main(args) -> DopError:
     if err.isError():
         return err
 
-    #   CO2
-    co2_c = conf['co2']
-    err, co2_conf = DopUtils.config_to_dict(co2_c['configuration'])
+    #   the sections are compiled once: a bad configuration fails here
+    err, co2_conf = CO2_SCHEMA.compile(conf['co2']['configuration'])
     if err.isError():
         return err
 
-    #   mandatory args
-    if 'driver' in co2_conf:
-        co2_driver = co2_conf['driver']
-    else:
-        return DopError(10,'Missing arg: co2: driver') 
-
-    if 'sleep' in co2_conf:
-        co2_sleep = int(co2_conf['sleep'])
-
-    #   PROG
-    prog_c = conf['prog']
-    err, prog_conf = DopUtils.config_to_dict(prog_c['configuration'])
+    err, prog_conf = PROG_SCHEMA.compile(conf['prog']['configuration'])
     if err.isError():
         return err
-    
-    if 'v' in prog_conf:
-        verbose = (prog_conf['v'] == '1')
+
+    verbose: bool = prog_conf.verbose
+    co2_driver: str = co2_conf.driver
+    co2_sleep: int = co2_conf.sleep
+    #   supervisor: backoff bounds and status report interval, in seconds
+    backoff_min: int = prog_conf.backoff_min
+    backoff_max: int = prog_conf.backoff_max
+    report_interval: int = prog_conf.report
+    #   error accounting snapshot, written at every report
+    stats_file: str = prog_conf.stats
+    #   shutdown
+    drain_timeout: int = prog_conf.drain
+    spill_file: str = prog_conf.spill
 
     #   MQTT OUTPUT CLIENT
 
-    mqtt_c = conf['mqtt']
-    mqtt_conf = mqtt_c['configuration']
-    err, mqtt_conf_dict = DopUtils.config_to_dict(mqtt_conf)
+    err, mqtt_conf = MQTT_SCHEMA.compile(conf['mqtt']['configuration'])
+    if err.isError():
+        return err
 
     mqtt_client = MqttClient()
     
-    tv, host = DopUtils.config_get_string(mqtt_conf_dict, ['h'], None)
-    tv, port = DopUtils.config_get_int(mqtt_conf_dict, ['p'], 1883)
-    tv, topic = DopUtils.config_get_string(mqtt_conf_dict, ['t'], None)
     prov_err = mqtt_client.init(mqtt_conf)
     if prov_err.isError():
         return prov_err
@@ -206,6 +293,7 @@ def main(args) -> DopError:
     prov_err = mqtt_client.open()
     if prov_err.isError():
         return prov_err
+    replay_spilled(mqtt_client, spill_file)
 
     # Userdata 
     userdata = PublisherUserdata()
@@ -213,9 +301,9 @@ def main(args) -> DopError:
 
 
     if verbose:
-        print(f'Broker host       : {host}')
-        print(f'Broker port       : {port}')
-        print(f'Broker topic     : {topic}') 
+        print(f'Broker host       : {mqtt_conf.host}')
+        print(f'Broker port       : {mqtt_conf.port}')
+        print(f'Broker topic      : {mqtt_conf.topic}') 
 
         print(f'CO2 driver        : {co2_driver}')
         print(f'CO2 sleep         : {co2_sleep}')
@@ -225,11 +313,18 @@ def main(args) -> DopError:
     # Main Program
     # ====================================================================================
 
-    co2_t = Thread(target=thread_co2, args=(co2_conf, userdata, verbose))
-    co2_t.start()
+    global global_supervisor
+    global_supervisor = DopSupervisor(global_stop_event, backoff_min, backoff_max)
+    global_supervisor.add_worker('co2', thread_co2, (co2_conf, userdata, verbose))
+    global_supervisor.start()
+    report_startup(startup_start)
     time.sleep(1)
     
-    co2_t.join()
+    global_supervisor.join(report_interval,
+                           lambda status: report_status(status, stats_file))
+
+    #   the stop event is set and the workers have ended
+    shutdown(mqtt_client, drain_timeout, spill_file)
 
     prov_err = mqtt_client.close()
     return prov_err
@@ -0,0 +1,37 @@
+"""
+Schemas of the co2 and prog sections of the sensors' configuration file
+(the mqtt section is described by MQTT_SCHEMA of mqtt_output)
+"""
+
+from common.python.config_schema import ConfigSchema, ConfigField
+from python_sensor.externals.co2_device_manager import CO2METER_VENDOR_ID, CO2METER_PRODUCT_ID, \
+    HIDRAW_SYSFS_ROOT
+
+
+#   run=1;driver=/dev/co2mini1;sleep=5;
+#   run=1;driver=auto;vid=04d9;pid=a052;sysfs=/sys/class/hidraw;rescan=5;sleep=5;
+CO2_SCHEMA = ConfigSchema("co2", [
+    ConfigField("run", ['run'], bool, True),
+    ConfigField("driver", ['driver'], required = True),
+    ConfigField("sleep", ['sleep'], int, 5, min_value = 0),
+    #   driver=auto only
+    ConfigField("vendor_id", ['vid'], 'hex', CO2METER_VENDOR_ID),
+    ConfigField("product_id", ['pid'], 'hex', CO2METER_PRODUCT_ID),
+    ConfigField("sysfs_root", ['sysfs'], default = HIDRAW_SYSFS_ROOT),
+    ConfigField("rescan", ['rescan'], int, 5, min_value = 0),
+])
+
+#   v=1;bmin=1;bmax=60;report=60;stats=/var/tmp/co2_sensor_errors.json;drain=10;spill=/var/tmp/co2_sensor_spill.jsonl;
+PROG_SCHEMA = ConfigSchema("prog", [
+    ConfigField("verbose", ['v'], bool, False),
+    #   restart backoff of the supervised workers, in seconds: 0 would restart a failing worker in a hot loop
+    ConfigField("backoff_min", ['bmin'], int, 1, min_value = 1),
+    ConfigField("backoff_max", ['bmax'], int, 60, min_value = 1),
+    ConfigField("report", ['report'], int, 0, min_value = 0),
+    ConfigField("stats", ['stats']),
+    #   shutdown: drain deadline in seconds, file of the messages not published by then
+    ConfigField("drain", ['drain'], int, 10, min_value = 0),
+    ConfigField("spill", ['spill']),
+], [
+    (lambda config: config.backoff_max >= config.backoff_min, "bmax must not be less than bmin"),
+])
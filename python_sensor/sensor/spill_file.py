@@ -0,0 +1,79 @@
+"""
+Messages saved to disk on shutdown, when they cannot be published before
+the drain deadline, and published again at the next start. The file is
+only replaced once they are replayed, with the messages that failed again.
+
+The file has a JSON line per message: {"topic": topic or null, "payload": base64}
+"""
+
+import base64
+import json
+import os
+
+from common.python.error import DopError
+
+from typing import Tuple
+
+
+def spill_messages(path: str, messages: list) -> DopError:
+    """ Append messages, a list of (payload, topic), to the spill file. """
+    try:
+        with open(path, "a") as f:
+            for payload, topic in messages:
+                if isinstance(payload, str):
+                    payload = payload.encode("UTF-8")
+                f.write(json.dumps({'topic': topic,
+                                    'payload': base64.b64encode(bytes(payload)).decode("ascii")}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError as e:
+        return DopError(401, f"Cannot write the spill file {path}: {e}")
+    return DopError()
+
+
+def load_spilled(path: str) -> Tuple[DopError, list]:
+    """ Read the messages of the spill file, as (payload, topic); the file is
+    left in place, see replace_spilled(). The corrupt lines are skipped with
+    error 404, the valid messages being returned all the same. """
+    if not os.path.exists(path):
+        return DopError(), []
+
+    messages: list = []
+    corrupt: int = 0
+    try:
+        with open(path) as f:
+            for line in f:
+                if len(line.strip()) == 0:
+                    continue
+                #   e.g. the last line, truncated by a crash while it was written
+                try:
+                    item = json.loads(line)
+                    messages.append((base64.b64decode(item['payload'], validate=True), item['topic']))
+                except (ValueError, KeyError, TypeError):
+                    corrupt += 1
+    except (OSError, UnicodeDecodeError) as e:
+        return DopError(402, f"Cannot read the spill file {path}: {e}"), []
+    if corrupt > 0:
+        return DopError(404, f"{corrupt} corrupt lines skipped in the spill file {path}"), messages
+    return DopError(), messages
+
+
+def replace_spilled(path: str, messages: list) -> DopError:
+    """ Replace the content of the spill file with messages, e.g. the ones
+    that could not be replayed; remove the file if there is none. """
+    try:
+        if len(messages) == 0:
+            if os.path.exists(path):
+                os.remove(path)
+            return DopError()
+
+        tmp_path: str = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        err = spill_messages(tmp_path, messages)
+        if err.isError():
+            return err
+        os.replace(tmp_path, path)
+    except OSError as e:
+        return DopError(403, f"Cannot replace the spill file {path}: {e}")
+    return DopError()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+#   the tests import the packages of the repository root (common, dvco_stub)
+#   and the modules of the sensor programs, which are flat
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "micropython_sensor"), os.path.join(ROOT, "python_sensor", "sensor")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,147 @@
+"""
+Fake I2C bus with a BME680, to run micropython_sensor/bme680i2c.py on the host.
+
+FakeBME680I2C implements the machine.I2C methods used by the driver
+(readfrom_mem_into, writeto_mem, writeto) over a 256 byte register map and
+counts the transactions and the bytes transferred. The chip id, the
+calibration coefficients and the heater registers are preset; a write of
+CTRL_MEAS with the forced mode bits set "completes" a measurement at once,
+setting new_data in MEAS_STATUS and the raw ADC values given by
+set_raw() in the data registers. Other calibration registers can be given
+as a {register: bytes} dict, written over the preset ones.
+
+The register writes are also checked: a write with a length that is not a
+sequence of (register, value) pairs raises ValueError.
+"""
+
+import os
+import struct
+import sys
+
+#   the driver is not a package: import it from its folder (on micropython, that
+#   has no os.path, the folder has to be in MICROPYPATH)
+if hasattr(os, 'path'):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    "micropython_sensor"))
+
+ADDRESS = 0x77
+
+REG_CHIPID = 0xD0
+REG_SOFTRESET = 0xE0
+REG_CTRL_MEAS = 0x74
+REG_MEAS_STATUS = 0x1D
+
+#   calibration coefficients, in the order of the struct format of _read_calibration
+#   (pad bytes included), values in the range of those read from real sensors
+CALIBRATION = (26140, 3, 0, 36185, -10346, 88, 0, 6917, -148, 33, 30, 0, -2853, -2672,
+               30, 0, 63, 0x2A3C, 0, 45, 20, 120, -100, 26000, -10000, -30, 18)
+
+#   raw ADC vectors: (temperature, pressure, humidity, gas, gas range), 20 bit temperature
+#   and pressure, 16 bit humidity, 10 bit gas. They are synthetic, not captured from a
+#   sensor: chosen to give readings within the sensor range with CALIBRATION
+RAW_VECTORS = (
+    (0x7E000, 0x53000, 0x5A00, 0x2A3, 4),
+    (0x7A120, 0x54800, 0x6400, 0x1F4, 5),
+    (0x83D60, 0x51000, 0x4E20, 0x3E8, 3),
+    (0x75300, 0x56000, 0x7530, 0x0C8, 7),
+    (0x88B80, 0x52000, 0x3A98, 0x320, 2),
+    (0x61A80, 0x55000, 0x8000, 0x200, 6),
+)
+
+#   calibration registers laid out as in the register map of the datasheet, decoded
+#   by the test independently from the driver: H1 and H2 share 0xE2 with distinct
+#   nibbles, and range_sw_err (high nibble of 0x04) is negative
+REFERENCE_CALIBRATION = {
+    0x8A: struct.pack('<hb', 26250, 3),                         #   par_t2, par_t3
+    0x8E: struct.pack('<Hhb', 36432, -10305, 88),               #   par_p1 to par_p3
+    0x94: struct.pack('<hhbb', 6877, -140, 37, 30),             #   par_p4, par_p5, par_p7, par_p6
+    0x9C: struct.pack('<hhB', -2621, -2527, 30),                #   par_p8 to par_p10
+    0xE1: bytes((0x3F, 0x37, 0x3E)) +                           #   par_h2, par_h1
+          struct.pack('<bbbBbHhbb', 0, 45, 20, 120, -100,       #   par_h3 to par_h7
+                      26157, -11250, -34, 18),                  #   par_t1, par_gh2, par_gh1, par_gh3
+    0x04: bytes((0xE3,)),                                       #   range_sw_err
+}
+
+
+class FakeBME680I2C:
+
+    def __init__(self, address: int = ADDRESS, calibration: dict = None):
+        self.address = address
+        self.calibration = calibration or {}
+        self.regs = bytearray(256)
+        self.transactions = 0
+        self.bytes = 0
+        self.writes = {}        #   register -> number of writes
+        self.measurements = 0
+        self.stalled = False    #   True: the measurements never complete
+        self._reset()
+        self.set_raw(*RAW_VECTORS[0])
+
+    def _reset(self):
+        self.regs[REG_CHIPID] = 0x61
+        packed = b'\x00' + struct.pack('<hbBHhbBhhbbHhhBBBHbbbBbHhbb', *CALIBRATION) + b'\x00\x00'
+        self.regs[0x89:0x89 + 25] = packed[:25]
+        self.regs[0xE1:0xE1 + 16] = packed[25:]
+        self.regs[0x00] = 0x32      #   res_heat_val
+        self.regs[0x02] = 0x16      #   res_heat_range
+        self.regs[0x04] = 0x10      #   range_sw_err
+        for register, values in self.calibration.items():
+            self.regs[register:register + len(values)] = values
+        for register in (0x71, 0x72, 0x74, 0x75):
+            self.regs[register] = 0
+
+    def set_raw(self, temperature: int, pressure: int, humidity: int, gas: int, gas_range: int):
+        """ Raw ADC values reported by the next measurements. """
+        data = bytearray(15)
+        data[2:5] = (pressure << 4).to_bytes(3, 'big')
+        data[5:8] = (temperature << 4).to_bytes(3, 'big')
+        data[8:10] = humidity.to_bytes(2, 'big')
+        data[13:15] = ((gas << 6) | 0x30 | gas_range).to_bytes(2, 'big')
+        self.regs[REG_MEAS_STATUS + 1:REG_MEAS_STATUS + 15] = data[1:]
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.writes = {}
+        self.measurements = 0
+
+    def _check(self, address: int):
+        if address != self.address:
+            raise OSError(19)   #   ENODEV, as machine.I2C
+
+    def _set(self, register: int, value: int):
+        self.writes[register] = self.writes.get(register, 0) + 1
+        if register == REG_SOFTRESET and value == 0xB6:
+            self._reset()
+            return
+        self.regs[register] = value
+        if register == REG_CTRL_MEAS and value & 0x03 == 0x01 and not self.stalled:
+            self.measurements += 1
+            self.regs[REG_MEAS_STATUS] = 0x80
+            self.regs[register] = value & 0xFC     #   back to sleep mode
+
+    def readfrom_mem_into(self, address: int, register: int, buf):
+        self._check(address)
+        self.transactions += 1
+        self.bytes += 1 + len(buf)
+        buf[:] = self.regs[register:register + len(buf)]
+        if register == REG_MEAS_STATUS:
+            self.regs[REG_MEAS_STATUS] = 0
+
+    def writeto_mem(self, address: int, register: int, buf):
+        self._check(address)
+        if len(buf) != 1:
+            raise ValueError("BME680 writes are (register, value) pairs")
+        self.transactions += 1
+        self.bytes += 1 + len(buf)
+        self._set(register, buf[0])
+
+    def writeto(self, address: int, buf):
+        self._check(address)
+        if len(buf) == 0 or len(buf) % 2 != 0:
+            raise ValueError("BME680 writes are (register, value) pairs")
+        self.transactions += 1
+        self.bytes += len(buf)
+        for i in range(0, len(buf), 2):
+            self._set(buf[i], buf[i + 1])
+        return len(buf)
@@ -0,0 +1,122 @@
+"""
+Upload of the backlog: the samples of a batch leave the backlog once its PUBACK is read
+"""
+
+from sens_backlog import SampleBacklog
+from sens_mqtt import PUBACK
+from sens_payload import SamplePayload
+from sens_runtime import asyncio, Liveness, MqttLink, backlog_task
+
+VALUES = (2012, 48250, 101325, 52000)
+
+
+class FakeSession:
+    """ MqttSession that acknowledges the QoS 1 messages once ack is set. """
+
+    keepalive = 60
+
+    def __init__(self):
+        self.connected = False
+        self.acked_pid = 0
+        self.ack = False
+        self.published = 0
+        self._pids = []
+
+    def connect(self):
+        self.connected = True
+        return False
+
+    def close(self, disconnect=False):
+        self.connected = False
+
+    def publish(self, topic, payload, qos, pid, dup=False):
+        self.published += 1
+        self._pids.append(pid)
+
+    def ping(self):
+        pass
+
+    def read_packet(self):
+        if not self.ack or not self._pids:
+            return 0
+        self.acked_pid = self._pids.pop(0)
+        return PUBACK
+
+
+class FakeNic:
+
+    def isconnected(self):
+        return True
+
+
+def make_backlog(n: int) -> SampleBacklog:
+    backlog = SampleBacklog(16)
+    for counter in range(n):
+        backlog.append(counter, VALUES)
+    return backlog
+
+
+def test_batch_dropped_after_puback():
+    session = FakeSession()
+    link = MqttLink(session, b"sens/test", 1)
+    backlog = make_backlog(12)
+    lengths = []
+
+    async def scenario():
+        liveness = Liveness()
+        liveness.register("mqtt", 10000)
+        mqtt = asyncio.create_task(link.run(FakeNic(), liveness, poll_ms=5))
+        uploader = asyncio.create_task(backlog_task(backlog, link, SamplePayload(256), link.publish,
+                                                    period_ms=10, batch_ms=5))
+        await asyncio.sleep_ms(100)
+        lengths.append((session.published, len(backlog)))
+        session.ack = True
+        await asyncio.sleep_ms(200)
+        lengths.append((session.published, len(backlog)))
+        uploader.cancel()
+        mqtt.cancel()
+
+    asyncio.run(scenario())
+    #   the first batch is published, its samples kept until it is acknowledged
+    assert lengths[0] == (1, 12)
+    assert lengths[1][0] > 1
+    assert lengths[1][1] == 0
+
+
+def test_mark_acked():
+    session = FakeSession()
+    link = MqttLink(session, b"sens/test", 1)
+    link.publish(b"sample")
+    link.publish(b"batch")
+    assert link.mark()
+    link.publish(b"sample")
+    session.connect()
+    session.ack = True
+    link._send()
+    link._receive()
+    assert not link.marked
+    assert link.mark_acked
+
+
+def test_mark_dropped_from_full_outbox():
+    link = MqttLink(FakeSession(), b"sens/test", 1, outbox_size=2)
+    assert not link.mark()
+    link.publish(b"batch")
+    assert link.mark()
+    link.publish(b"sample")
+    assert link.marked
+    link.publish(b"sample")
+    assert not link.marked
+    assert not link.mark_acked
+
+
+def test_batch_fits_in_outbox_once_sealed():
+    from dvco_stub.pub_stack_envelope import PubStackEnvelope, ENVELOPE_OVERHEAD
+    #   the largest values of a record of the backlog
+    backlog = SampleBacklog(16)
+    for counter in range(8):
+        backlog.append(0xFFFFFFFF - counter, (-32768, 0xFFFFFFFF, 0xFFFFFFFF, 0xFFFFFFFF))
+    assert PubStackEnvelope().overhead() == ENVELOPE_OVERHEAD
+    payload, n = SamplePayload(256 - ENVELOPE_OVERHEAD).fill_batch(backlog, 0xFFFFFFFF)
+    assert n > 0
+    assert len(payload) + ENVELOPE_OVERHEAD <= 256
@@ -0,0 +1,173 @@
+"""
+Integer compensation of the BME680 driver of micropython_sensor: agreement
+with the 32 bit reference code of Bosch and with the float compensation,
+reference vectors, and intermediate values within the small int range of
+micropython (30 bits) and the machine ints of viper (32 bits).
+"""
+
+import pytest
+
+from tests.fake_bme680 import FakeBME680I2C, RAW_VECTORS, REFERENCE_CALIBRATION
+import bme680i2c
+
+SMALL_INT = 1 << 30
+
+
+class SmallInt(int):
+    """ An int whose arithmetic fails beyond the micropython small int range. """
+
+    LIMIT = SMALL_INT
+
+    def _wrap(value, cls=None):
+        if isinstance(value, bool) or not isinstance(value, int):
+            return value
+        cls = cls or SmallInt
+        if not -cls.LIMIT <= value < cls.LIMIT:
+            raise OverflowError(f"{value} beyond {cls.LIMIT.bit_length()} bits")
+        return cls(value)
+
+    def _operator(name):
+        method = getattr(int, name)
+        return lambda self, other: SmallInt._wrap(method(self, other), type(self))
+
+    for name in ("__add__", "__radd__", "__sub__", "__rsub__", "__mul__", "__rmul__",
+                 "__floordiv__", "__rfloordiv__", "__mod__", "__rmod__",
+                 "__lshift__", "__rlshift__", "__rshift__", "__rrshift__",
+                 "__and__", "__rand__", "__or__", "__ror__"):
+        locals()[name] = _operator(name)
+    __neg__ = lambda self: SmallInt._wrap(-int(self), type(self))
+    del name
+
+
+class Int32(SmallInt):
+    """ The machine int of viper, that wraps silently beyond 32 bits. """
+
+    LIMIT = 1 << 31
+
+
+def reference_pressure(adc_pres, t_fine, p):
+    """ The 32 bit reference code of Bosch, on unbounded ints. """
+    var1 = (t_fine >> 1) - 64000
+    var2 = ((((var1 >> 2) * (var1 >> 2)) >> 11) * p[5]) >> 2
+    var2 = var2 + ((var1 * p[4]) << 1)
+    var2 = (var2 >> 2) + (p[3] << 16)
+    var1 = (((((var1 >> 2) * (var1 >> 2)) >> 13) * (p[2] << 5)) >> 3) + ((p[1] * var1) >> 1)
+    var1 = var1 >> 18
+    var1 = ((32768 + var1) * p[0]) >> 15
+    calc_pres = ((1048576 - adc_pres) - (var2 >> 12)) * 3125
+    if calc_pres >= 0x40000000:
+        calc_pres = (calc_pres // var1) << 1
+    else:
+        calc_pres = (calc_pres << 1) // var1
+    var1 = (p[8] * (((calc_pres >> 3) * (calc_pres >> 3)) >> 13)) >> 12
+    var2 = ((calc_pres >> 2) * p[7]) >> 13
+    var3 = ((calc_pres >> 8) * (calc_pres >> 8) * (calc_pres >> 8) * p[9]) >> 17
+    return calc_pres + ((var1 + var2 + var3 + (p[6] << 7)) >> 4)
+
+
+def reference_gas(adc_gas, gas_range, sw_err):
+    var1 = ((1340 + (5 * sw_err)) * int(bme680i2c._LOOKUP_TABLE_1[gas_range])) >> 16
+    var2 = ((adc_gas << 15) - 16777216) + var1
+    var3 = (int(bme680i2c._LOOKUP_TABLE_2[gas_range]) * var1) >> 9
+    return (var3 + (var2 >> 1)) // var2
+
+
+@pytest.fixture(scope="module")
+def bme():
+    return bme680i2c.BME680_I2C(FakeBME680I2C(), refresh_rate=1000)
+
+
+def t_fine(bme, adc_temp: int) -> int:
+    t = bme._temp_calibration_int
+    return bme680i2c._t_fine_fixed(adc_temp, t[0], t[1], t[2])
+
+
+#   adc_temp from about -40 to 85 C with the calibration of the fake sensor
+TEMPERATURES = range(0x50000, 0x9A000, 0x2000)
+#   adc_pres from about 1100 to 300 hPa
+PRESSURES = range(0x30000, 0x80000, 0x4000)
+
+
+def test_t_fine_stays_within_32_bits(bme):
+    t = tuple(Int32(c) for c in bme._temp_calibration_int)
+    for adc_temp in TEMPERATURES:
+        bme680i2c._t_fine_fixed(Int32(adc_temp), *t)
+
+
+def test_pressure_agrees_with_the_reference(bme):
+    p = bme._pressure_calibration_int
+    for adc_temp in TEMPERATURES:
+        fine = t_fine(bme, adc_temp)
+        for adc_pres in PRESSURES:
+            expected = reference_pressure(adc_pres, fine, p)
+            assert bme680i2c._pressure_fixed(adc_pres, fine, p) == expected, (adc_temp, adc_pres)
+
+
+def test_pressure_stays_within_30_bits(bme):
+    p = tuple(SmallInt(c) for c in bme._pressure_calibration_int)
+    for adc_temp in TEMPERATURES:
+        fine = SmallInt(t_fine(bme, adc_temp))
+        for adc_pres in PRESSURES:
+            bme680i2c._pressure_fixed(SmallInt(adc_pres), fine, p)
+
+
+@pytest.mark.parametrize("gas_range", range(16))
+def test_gas_agrees_with_the_reference(gas_range):
+    for sw_err in (-8, 0, 7, 15):
+        for adc_gas in range(0, 1024, 31):
+            expected = reference_gas(adc_gas, gas_range, sw_err)
+            assert abs(bme680i2c._gas_fixed(adc_gas, gas_range, sw_err) - expected) <= 1 + (expected >> 17)
+
+
+@pytest.mark.parametrize("gas_range", range(16))
+def test_gas_stays_within_30_bits(gas_range):
+    for sw_err in (-8, 0, 15):
+        for adc_gas in (0, 1, 512, 1023):
+            bme680i2c._gas_fixed(SmallInt(adc_gas), SmallInt(gas_range), SmallInt(sw_err))
+
+
+def test_humidity_stays_within_30_bits(bme):
+    h = tuple(SmallInt(c) for c in bme._humidity_calibration_int)
+    for adc_temp in TEMPERATURES:
+        fine = SmallInt(t_fine(bme, adc_temp))
+        for adc_hum in range(0x2000, 0x9000, 0x800):
+            bme680i2c._humidity_fixed(SmallInt(adc_hum), fine, h)
+
+
+@pytest.mark.parametrize("raw", RAW_VECTORS)
+def test_fixed_agrees_with_float(raw):
+    i2c = FakeBME680I2C()
+    i2c.set_raw(*raw)
+    bme = bme680i2c.BME680_I2C(i2c, refresh_rate=1000)
+    temperature, humidity, pressure, gas = bme.read_all()
+    fixed = bme.read_all_fixed()
+    assert abs(fixed[0] / 100 - temperature) <= 0.02
+    assert abs(fixed[1] / 1000 - humidity) <= 0.05
+    assert abs(fixed[2] / 100 - pressure) <= 0.1
+    assert abs(fixed[3] - gas) <= gas * 0.001
+
+
+#   readings of REFERENCE_CALIBRATION (temperature in 1/100 C, humidity in 1/1000 RH %,
+#   pressure in Pa, gas resistance in ohms) given by the integer code of the Bosch
+#   BME68x API (calc_temperature, calc_humidity, calc_pressure, calc_gas_resistance_low)
+#   compiled with 32 bit ints: independent from the driver, its calibration included
+REFERENCE_VECTORS = (
+    ((0x7E5E0, 0x52B80, 0x6610, 0x2A3, 4), (3101, 54058, 103817, 444967)),
+    ((0x71A40, 0x4E200, 0x5208, 0x1B0, 9), (1470, 22906, 104299, 16625)),
+)
+
+
+@pytest.mark.parametrize("raw, expected", REFERENCE_VECTORS)
+def test_reference_vector(raw, expected):
+    i2c = FakeBME680I2C(calibration=REFERENCE_CALIBRATION)
+    i2c.set_raw(*raw)
+    bme = bme680i2c.BME680_I2C(i2c, refresh_rate=1000)
+    fixed = bme.read_all_fixed()
+    assert fixed[:3] == expected[:3]
+    assert abs(fixed[3] - expected[3]) <= 1 + (expected[3] >> 17)
+
+    temperature, humidity, pressure, gas = bme.read_all()
+    assert abs(temperature * 100 - expected[0]) <= 1
+    assert abs(humidity * 1000 - expected[1]) <= 50
+    assert abs(pressure * 100 - expected[2]) <= 10
+    assert abs(gas - expected[3]) <= expected[3] * 0.001
@@ -0,0 +1,102 @@
+"""
+I2C traffic and measurement polling of the BME680 driver of micropython_sensor,
+on the fake bus of fake_bme680.py. The figures are reported by
+benchmarks/bench_bme680_i2c.py.
+"""
+
+import time
+
+import pytest
+
+from tests.fake_bme680 import FakeBME680I2C, REG_CTRL_MEAS
+import bme680i2c
+
+REG_CTRL_GAS = 0x71
+REG_CTRL_HUM = 0x72
+REG_CONFIG = 0x75
+CONFIG_REGISTERS = (REG_CTRL_GAS, REG_CTRL_HUM, REG_CONFIG)
+
+
+@pytest.fixture
+def i2c():
+    return FakeBME680I2C()
+
+
+@pytest.fixture
+def bme(i2c):
+    #   refresh_rate high enough for the refresh time not to be slept
+    bme = bme680i2c.BME680_I2C(i2c, refresh_rate=1000)
+    i2c.reset_counters()
+    return bme
+
+
+def test_first_reading_writes_the_configuration_in_one_burst(i2c, bme):
+    bme.read_all()
+    #   one burst write (configuration and trigger), one read of status and data
+    assert i2c.transactions == 2
+    assert i2c.writes == {REG_CONFIG: 1, REG_CTRL_HUM: 1, REG_CTRL_GAS: 1, REG_CTRL_MEAS: 1}
+    assert i2c.measurements == 1
+
+
+def test_unchanged_configuration_is_not_rewritten(i2c, bme):
+    bme.read_all()
+    i2c.reset_counters()
+    bme.read_all()
+    assert i2c.transactions == 2
+    assert i2c.bytes == 18
+    assert i2c.writes == {REG_CTRL_MEAS: 1}
+
+
+def test_properties_take_a_measurement_each(i2c, bme):
+    bme.read_all()
+    i2c.reset_counters()
+    bme.temperature, bme.humidity, bme.pressure, bme.gas
+    assert i2c.transactions == 8
+    assert i2c.measurements == 4
+    assert not any(register in i2c.writes for register in CONFIG_REGISTERS)
+
+
+def test_only_the_changed_register_is_rewritten(i2c, bme):
+    bme.read_all()
+    i2c.reset_counters()
+    bme.filter_size = 7
+    bme.read_all()
+    assert i2c.transactions == 2
+    assert i2c.writes == {REG_CONFIG: 1, REG_CTRL_MEAS: 1}
+
+
+def test_read_buffers_are_reused(i2c, bme):
+    bme.read_all()
+    buffers = dict(bme._buffers)
+    bme.read_all()
+    bme.read_all_fixed()
+    assert all(bme._buffers[length] is buf for length, buf in buffers.items())
+
+
+def test_soft_reset_writes_the_configuration_again(i2c, bme):
+    bme.read_all()
+    bme.soft_reset()
+    assert i2c.regs[REG_CONFIG] == 0
+    i2c.reset_counters()
+    bme.read_all()
+    assert i2c.transactions == 2
+    assert all(i2c.writes.get(register) == 1 for register in CONFIG_REGISTERS)
+    assert i2c.regs[REG_CONFIG] == bme._filter << 2
+
+
+def test_poll_returns_the_values_once_done(i2c, bme):
+    assert bme.start_measurement() > 0
+    values = bme.poll_measurement(True)
+    assert values == bme.read_all_fixed()
+
+
+def test_stalled_measurement_fails_past_its_deadline(i2c, bme, monkeypatch):
+    monkeypatch.setattr(bme, "_measurement_ms", lambda: 5)
+    i2c.stalled = True
+    bme.start_measurement()
+    assert bme.poll_measurement(True) is None
+    time.sleep(0.02)
+    with pytest.raises(OSError):
+        bme.poll_measurement(True)
+    with pytest.raises(OSError):
+        bme.read_all_fixed()
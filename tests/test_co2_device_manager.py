@@ -0,0 +1,147 @@
+"""
+Hot-plug discovery of CO2DeviceManager on a fake sysfs hidraw tree
+"""
+
+import os
+
+import pytest
+
+from python_sensor.externals.co2_device_manager import CO2DeviceManager, CO2METER_VENDOR_ID, \
+    CO2METER_PRODUCT_ID
+
+
+class FakeMeter:
+    """ CO2Meter without a device: its values are those of the fixture. """
+
+    def __init__(self, device: str):
+        self.device = device
+        self.running = True
+        self.closed = False
+        self.failing = False
+
+    def get_data(self) -> dict:
+        if self.failing:
+            raise IOError("read failed")
+        return {'co2': 600, 'temperature': 21.5}
+
+    def get_timestamps(self) -> dict:
+        return {'ts_ns': {'co2': 1}, 'mono_ns': {'co2': 1}, 'clock_offset_ns': 0}
+
+    @property
+    def clock_offset_ns(self) -> int:
+        return 0
+
+    def close(self):
+        self.closed = True
+        self.running = False
+
+
+def plug(sysfs, name: str, vendor_id: int = CO2METER_VENDOR_ID, product_id: int = CO2METER_PRODUCT_ID):
+    device = sysfs / name / "device"
+    device.mkdir(parents=True)
+    (device / "uevent").write_text(f"DRIVER=hid-generic\nHID_ID=0003:{vendor_id:08X}:{product_id:08X}\n"
+                                   f"HID_NAME=Holtek USB-zyTemp\n")
+
+
+def unplug(sysfs, name: str):
+    device = sysfs / name / "device"
+    os.remove(device / "uevent")
+    os.rmdir(device)
+    os.rmdir(sysfs / name)
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    root = tmp_path / "hidraw"
+    root.mkdir()
+    return root
+
+
+@pytest.fixture
+def manager(sysfs):
+    meters = []
+
+    def factory(device: str):
+        meters.append(FakeMeter(device))
+        return meters[-1]
+
+    manager = CO2DeviceManager(sysfs_root=str(sysfs), dev_root="/dev", rescan_interval=0,
+                               meter_factory=factory)
+    manager.meters = meters
+    return manager
+
+
+def test_no_device(manager):
+    assert manager.rescan() == ([], [])
+    assert manager.get_data() == {}
+    assert manager.get_timestamps()['clock_offset_ns'] is None
+
+
+def test_missing_sysfs(tmp_path):
+    manager = CO2DeviceManager(sysfs_root=str(tmp_path / "none"), meter_factory=FakeMeter)
+    assert manager.scan() == {}
+
+
+def test_plug_unplug_replug(sysfs, manager):
+    plug(sysfs, "hidraw2")
+    assert manager.rescan() == (["/dev/hidraw2"], [])
+    assert manager.devices == ["/dev/hidraw2"]
+    assert manager.get_data()['co2'] == 600
+    assert manager.clock_offset_ns == 0
+
+    unplug(sysfs, "hidraw2")
+    assert manager.rescan() == ([], ["/dev/hidraw2"])
+    assert manager.meters[0].closed
+    assert manager.devices == []
+    assert manager.get_data() == {}
+
+    #   the kernel may give it another node
+    plug(sysfs, "hidraw3")
+    assert manager.rescan() == (["/dev/hidraw3"], [])
+    assert len(manager.meters) == 2
+    assert manager.get_data()['co2'] == 600
+
+
+def test_other_devices_ignored(sysfs, manager):
+    plug(sysfs, "hidraw0", vendor_id=0x046d)
+    plug(sysfs, "hidraw1", product_id=0xc52b)
+    (sysfs / "hidraw4" / "device").mkdir(parents=True)
+    (sysfs / "hidraw4" / "device" / "uevent").write_text("DRIVER=hid-generic\n")
+    assert manager.scan() == {}
+    plug(sysfs, "hidraw5")
+    assert manager.scan() == {"hidraw5": "/dev/hidraw5"}
+
+
+def test_stopped_meter_reaped_and_reattached(sysfs, manager):
+    plug(sysfs, "hidraw2")
+    manager.rescan()
+    manager.meters[0].running = False
+    #   detached as stopped, attached again as still plugged
+    assert manager.rescan() == (["/dev/hidraw2"], ["/dev/hidraw2"])
+    assert manager.meters[0].closed
+    assert len(manager.meters) == 2
+
+
+def test_failing_meter_skipped(sysfs, manager):
+    plug(sysfs, "hidraw2")
+    plug(sysfs, "hidraw3")
+    manager.rescan()
+    manager.meters[0].failing = True
+    assert manager.get_data()['co2'] == 600
+    assert manager._current is manager.meters[1]
+
+
+def test_rescan_rate_limited(sysfs):
+    manager = CO2DeviceManager(sysfs_root=str(sysfs), rescan_interval=3600, meter_factory=FakeMeter)
+    assert manager.rescan() == ([], [])
+    plug(sysfs, "hidraw2")
+    assert manager.rescan() == ([], [])
+    assert manager.rescan(force=True) == (["/dev/hidraw2"], [])
+
+
+def test_close(sysfs, manager):
+    plug(sysfs, "hidraw2")
+    manager.rescan()
+    manager.close()
+    assert manager.devices == []
+    assert manager.meters[0].closed
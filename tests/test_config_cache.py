@@ -0,0 +1,120 @@
+"""
+YAML configuration files parsed once, then loaded from the marshal cache
+"""
+
+import importlib
+import os
+
+import pytest
+import yaml
+
+import common.python.utils as utils
+
+CONF = """
+co2:
+  configuration: 'run=1;driver=auto;'
+prog:
+  configuration: 'v=1;bmin=1;bmax=60;'
+"""
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(utils, "_config_cache_dir", str(cache_dir))
+    return cache_dir
+
+
+@pytest.fixture
+def confile(tmp_path):
+    path = tmp_path / "sensors.yaml"
+    path.write_text(CONF)
+    return str(path)
+
+
+def load(confile: str) -> tuple:
+    err, conf = utils.DopUtils.parse_yaml_configuration(confile)
+    assert not err.isError()
+    return conf, utils.DopUtils.config_load_stats()['source']
+
+
+def test_cached(cache, confile):
+    conf, source = load(confile)
+    assert source == utils._YamlLoader.__name__
+    assert conf['prog']['configuration'] == 'v=1;bmin=1;bmax=60;'
+    assert load(confile) == (conf, "cache")
+    #   private to the user
+    assert os.stat(cache).st_mode & 0o077 == 0
+
+
+def test_edited_file_invalidates(cache, confile):
+    load(confile)
+    with open(confile, "w") as f:
+        f.write(CONF.replace("bmax=60", "bmax=120"))
+    conf, source = load(confile)
+    assert source != "cache"
+    assert conf['prog']['configuration'] == 'v=1;bmin=1;bmax=120;'
+    assert load(confile) == (conf, "cache")
+
+
+def test_same_size_edit_invalidates(cache, confile):
+    load(confile)
+    st = os.stat(confile)
+    with open(confile, "w") as f:
+        f.write(CONF.replace("bmax=60", "bmax=90"))
+    #   a later modification time, the size being the same
+    os.utime(confile, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+    conf, source = load(confile)
+    assert source != "cache"
+    assert conf['prog']['configuration'] == 'v=1;bmin=1;bmax=90;'
+
+
+@pytest.mark.parametrize("data", [b"", b"garbage", b"\xe9\x00", b"i\x05\x00\x00\x00"])
+def test_corrupt_cache_file(cache, confile, data):
+    conf, source = load(confile)
+    names = os.listdir(cache)
+    assert len(names) == 1
+    with open(cache / names[0], "wb") as f:
+        f.write(data)
+    assert load(confile) == (conf, utils._YamlLoader.__name__)
+    #   cached again
+    assert load(confile) == (conf, "cache")
+
+
+def test_cache_disabled(confile, monkeypatch):
+    monkeypatch.setattr(utils, "_config_cache_dir", "")
+    conf, source = load(confile)
+    assert load(confile)[1] != "cache"
+
+
+def test_shared_cache_folder_ignored(cache, confile):
+    load(confile)
+    os.chmod(cache, 0o777)
+    assert load(confile)[1] != "cache"
+
+
+def test_invalid_yaml(cache, tmp_path):
+    path = tmp_path / "bad.yaml"
+    path.write_text("prog:\n  configuration: [unclosed\n")
+    err, conf = utils.DopUtils.parse_yaml_configuration(str(path))
+    assert err.code == 103
+    assert conf == {}
+    assert utils.DopUtils.parse_yaml_configuration(str(tmp_path / "none.yaml"))[0].code == 101
+
+
+@pytest.fixture
+def without_libyaml(monkeypatch):
+    monkeypatch.delattr(yaml, "CSafeLoader", raising=False)
+    importlib.reload(utils)
+    yield
+    monkeypatch.undo()
+    importlib.reload(utils)
+
+
+def test_without_libyaml(without_libyaml, tmp_path, confile, monkeypatch):
+    assert utils._YamlLoader is yaml.SafeLoader
+    monkeypatch.setattr(utils, "_config_cache_dir", str(tmp_path / "cache"))
+    conf, source = load(confile)
+    assert source == "SafeLoader"
+    assert conf['co2']['configuration'] == 'run=1;driver=auto;'
+    assert load(confile) == (conf, "cache")
@@ -0,0 +1,82 @@
+"""
+Configuration schemas: typed values, aliases, bounds and errors naming the bad item
+"""
+
+import pytest
+
+from common.python.config_schema import ConfigSchema, ConfigField
+from python_sensor.sensor.sensor_config import PROG_SCHEMA
+
+
+def test_prog_backoff_defaults():
+    err, config = PROG_SCHEMA.compile("v=1;")
+    assert not err.isError()
+    assert (config.backoff_min, config.backoff_max) == (1, 60)
+
+
+def test_prog_backoff_min_not_zero():
+    err, config = PROG_SCHEMA.compile("bmin=0;bmax=60;")
+    assert err.code == 7
+    assert "'bmin'" in err.msg
+    assert config is None
+
+
+def test_prog_backoff_max_not_below_min():
+    err, config = PROG_SCHEMA.compile("bmin=10;bmax=5;")
+    assert err.code == 8
+    assert "bmax" in err.msg
+    assert config is None
+    err, config = PROG_SCHEMA.compile("bmin=5;bmax=5;")
+    assert not err.isError()
+
+
+SCHEMA = ConfigSchema("test", [
+    ConfigField("host", ['host', 'h'], required = True),
+    ConfigField("port", ['port', 'p'], int, 1883, min_value = 1, max_value = 65535),
+    ConfigField("run", ['run'], bool, True),
+    ConfigField("vendor_id", ['vid'], 'hex', 0x04d9),
+])
+
+
+def test_types_and_defaults():
+    err, config = SCHEMA.compile("host=broker;p=8883;run=false;vid=a052;")
+    assert not err.isError()
+    assert config == ("broker", 8883, False, 0xa052)
+    assert (config.host, config.port, config.run, config.vendor_id) == ("broker", 8883, False, 0xa052)
+    err, config = SCHEMA.compile(" h = broker ")
+    assert (config.host, config.port, config.run, config.vendor_id) == ("broker", 1883, True, 0x04d9)
+
+
+def test_frozen():
+    err, config = SCHEMA.compile("host=broker")
+    with pytest.raises(AttributeError):
+        config.port = 1
+
+
+def test_aliases():
+    assert SCHEMA.compile("host=broker;port=1")[1] == SCHEMA.compile("h=broker;p=1")[1]
+
+
+@pytest.mark.parametrize("connstring, code, position, key", [
+    ("host=broker;p=0", 7, 13, "'p'"),
+    ("host=broker;p=65536", 7, 13, "'p'"),
+    ("host=broker;p=x", 7, 13, "'p'"),
+    ("host=broker;run=2", 7, 13, "'run'"),
+    ("host=broker;vid=xyz", 7, 13, "'vid'"),
+    ("host=broker; nope=1", 6, 14, "'nope'"),
+    ("host=broker;h=other", 6, 13, "'h'"),
+    ("host=broker;port", 5, 13, "'port'"),
+])
+def test_errors_name_key_and_position(connstring, code, position, key):
+    err, config = SCHEMA.compile(connstring)
+    assert config is None
+    assert err.code == code
+    assert err.msg.startswith("test: ")
+    assert key in err.msg
+    assert err.msg.endswith(f"at position {position}")
+
+
+def test_missing_required():
+    err, config = SCHEMA.compile("p=1")
+    assert err.code == 10
+    assert "host" in err.msg
@@ -0,0 +1,57 @@
+"""
+DopError, and the shared immutable results DopConstError and DOP_OK
+"""
+
+import pytest
+
+from common.python.error import DopError, DopConstError, DOP_OK, dop_error
+
+
+def test_dop_error():
+    err = DopError(5, "bad")
+    assert err.isError() and err.isRecoverable()
+    err.rip()
+    assert not err.isRecoverable()
+    err.perr = DopError(6, "cause")
+    assert err.to_dict() == {'code': 5, 'msg': "bad", 'per': {'code': 6, 'msg': "cause", 'per': ''}}
+    assert not DopError().isError()
+
+
+@pytest.mark.parametrize("err", [DOP_OK, dop_error(301)])
+def test_const_error_immutable(err):
+    code, msg = err.code, err.msg
+    with pytest.raises(AttributeError):
+        err.rip()
+    with pytest.raises(AttributeError):
+        err.perr = DopError(1, "cause")
+    with pytest.raises(AttributeError):
+        err.code = 1
+    with pytest.raises(AttributeError):
+        err._code = 1
+    with pytest.raises(AttributeError):
+        err._recoverable = False
+    assert (err.code, err.msg, err.perr) == (code, msg, None)
+    assert err.isRecoverable()
+
+
+@pytest.mark.parametrize("err", [DopError(), DOP_OK])
+def test_slots(err):
+    with pytest.raises(AttributeError):
+        err.extra = 1
+    assert not hasattr(err, '__dict__')
+
+
+def test_dop_ok():
+    assert DOP_OK.code == 0 and DOP_OK.msg == ""
+    assert not DOP_OK.isError()
+    assert isinstance(DOP_OK, DopError)
+
+
+def test_dop_error_preallocated():
+    assert dop_error(301) is dop_error(301)
+    assert isinstance(dop_error(301), DopConstError)
+    err = dop_error(999, "other")
+    assert (err.code, err.msg) == (999, "other")
+    assert err is not dop_error(999, "other")
+    #   a new result can be chained and flagged
+    err.rip()
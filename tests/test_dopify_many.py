@@ -0,0 +1,61 @@
+"""
+dopify_many() against the same messages dopified one by one
+"""
+
+import pytest
+
+from common.python.error import DopError, DOP_OK
+from dvco_stub.pub_stack_stub import PubStackStub
+
+MESSAGES = [b"m%d" % i for i in range(10)]
+
+
+def make_stack(conf: dict) -> tuple:
+    stack = PubStackStub()
+    stack.init(conf)
+    published = []
+    stack.set_pub_callback(lambda payload, userdata: published.append(payload))
+    return stack, published
+
+
+@pytest.mark.parametrize("conf", [{}, {"queue": 1, "batch_size": 3}])
+def test_same_as_dopify(conf):
+    single, single_published = make_stack(conf)
+    single_results = [single.dopify(mess) for mess in MESSAGES]
+    single.pump()
+
+    many, many_published = make_stack(conf)
+    many_results = many.dopify_many(MESSAGES)
+    many.pump()
+
+    assert many_published == single_published == MESSAGES
+    assert [(err.code, mess) for err, mess in many_results] == \
+           [(err.code, mess) for err, mess in single_results]
+
+
+def test_error_part_way():
+    stack = PubStackStub()
+    stack.init({})
+    failed = DopError(100, "publish failed")
+    stack.set_pub_batch_callback(lambda batch, userdata: [failed if mess == b"m4" else DOP_OK for mess in batch])
+    results = stack.dopify_many(MESSAGES)
+    assert [err.code for err, mess in results] == [0, 0, 0, 0, 100, 0, 0, 0, 0, 0]
+    assert [mess for err, mess in results] == MESSAGES
+
+
+def test_callback_error_part_way():
+    stack, published = make_stack({})
+    failed = DopError(100, "publish failed")
+    stack.set_pub_callback(lambda payload, userdata: failed if payload == b"m7" else None)
+    results = stack.dopify_many(MESSAGES)
+    assert [err.code for err, mess in results] == [0] * 7 + [100, 0, 0]
+    #   as dopify() reports it
+    assert [stack.dopify(mess)[0].code for mess in MESSAGES] == [0] * 7 + [100, 0, 0]
+
+
+def test_queue_full_part_way():
+    stack, published = make_stack({"queue": 1, "queue_size": 6})
+    results = stack.dopify_many(MESSAGES)
+    assert [err.code for err, mess in results] == [0] * 6 + [301] * 4
+    stack.pump()
+    assert published == MESSAGES[:6]
@@ -0,0 +1,87 @@
+"""
+DopErrorStats: DopError results counted by origin and code, merged across threads
+"""
+
+import json
+import threading
+
+from common.python.error import DopError, DOP_OK
+from common.python.error_stats import DopErrorStats, write_snapshot
+
+
+def test_count_by_origin_and_code():
+    stats = DopErrorStats()
+    err = DopError(201, "publish failed")
+    assert stats.count(err, "mqtt.publish") is err
+    stats.count(DOP_OK, "mqtt.publish")
+    stats.count(DOP_OK, "mqtt.publish")
+    stats.count(DopError(101, "timeout"), "mqtt.connect")
+    assert stats.totals() == {"mqtt.publish": {201: 1, 0: 2}, "mqtt.connect": {101: 1}}
+
+
+def test_chained_errors():
+    stats = DopErrorStats()
+    err = DopError(99, "connect failed")
+    err.perr = DopError(101, "timeout")
+    stats.count(err, "mqtt.connect")
+    assert stats.totals() == {"mqtt.connect": {99: 1, 101: 1}}
+
+
+def test_threads_merged():
+    stats = DopErrorStats()
+
+    def worker():
+        for i in range(1000):
+            stats.count(DOP_OK, "pub_stack.queue")
+
+    threads = [threading.Thread(target=worker) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.count(DOP_OK, "pub_stack.queue")
+    assert stats.totals() == {"pub_stack.queue": {0: 4001}}
+
+
+def test_snapshot_intervals():
+    stats = DopErrorStats()
+    stats.count(DOP_OK, "mqtt.publish")
+    stats.count(DopError(201), "mqtt.publish")
+    first = stats.snapshot()["origins"]["mqtt.publish"]
+    assert (first["total"], first["errors"], first["interval_total"], first["interval_errors"]) == (2, 1, 2, 1)
+    assert first["codes"] == {"0": 1, "201": 1}
+    assert first["error_ratio"] == 0.5
+
+    #   the interval counts restart at every snapshot: the totals do not
+    stats.count(DOP_OK, "mqtt.publish")
+    second = stats.snapshot()["origins"]["mqtt.publish"]
+    assert (second["total"], second["errors"], second["interval_total"], second["interval_errors"]) == (3, 1, 1, 0)
+    assert second["error_ratio"] == 0
+    json.dumps(stats.snapshot())
+
+
+def test_write_snapshot(tmp_path):
+    stats = DopErrorStats()
+    stats.count(DopError(201), "mqtt.publish")
+    path = str(tmp_path / "errors.json")
+    assert not write_snapshot(stats.snapshot(), path).isError()
+    with open(path) as f:
+        assert json.load(f)["origins"]["mqtt.publish"]["errors"] == 1
+    assert write_snapshot(stats.snapshot(), str(tmp_path / "none" / "errors.json")).code == 4
+
+
+def test_reset():
+    stats = DopErrorStats()
+    stats.count(DopError(201), "mqtt.publish")
+    stats.snapshot()
+    #   the counters of another thread are cleared too
+    thread = threading.Thread(target=stats.count, args=(DOP_OK, "pub_stack.queue"))
+    thread.start()
+    thread.join()
+
+    stats.reset()
+    assert stats.totals() == {}
+    assert stats.snapshot()["origins"] == {}
+    stats.count(DOP_OK, "mqtt.publish")
+    origin = stats.snapshot()["origins"]["mqtt.publish"]
+    assert (origin["total"], origin["interval_total"], origin["errors"]) == (1, 1, 0)
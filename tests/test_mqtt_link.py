@@ -0,0 +1,102 @@
+"""
+Reconnections of MqttLink: a session lost after its CONNECT goes through the backoff
+"""
+
+from sens_mqtt import PUBACK
+from sens_runtime import asyncio, Liveness, MqttLink
+
+
+class DroppingSession:
+    """ MqttSession whose broker accepts the CONNECT, then drops the socket at the first
+    publish; once answering is set, it acknowledges the messages instead. """
+
+    keepalive = 60
+
+    def __init__(self):
+        self.connected = False
+        self.connects = 0
+        self.answering = False
+        self.acked_pid = 0
+        self._pids = []
+
+    def connect(self):
+        self.connected = True
+        self.connects += 1
+        return False
+
+    def close(self, disconnect=False):
+        self.connected = False
+
+    def publish(self, topic, payload, qos, pid, dup=False):
+        if not self.answering:
+            raise OSError("connection reset")
+        self._pids.append(pid)
+
+    def ping(self):
+        pass
+
+    def read_packet(self):
+        if not self._pids:
+            return 0
+        self.acked_pid = self._pids.pop(0)
+        return PUBACK
+
+
+class FakeNic:
+
+    def isconnected(self):
+        return True
+
+
+def run_link(session: DroppingSession, link: MqttLink, steps):
+    async def scenario():
+        liveness = Liveness()
+        liveness.register("mqtt", 10000)
+        task = asyncio.create_task(link.run(FakeNic(), liveness, backoff_max_ms=200, poll_ms=5))
+        for step in steps:
+            await step()
+        task.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_dropped_session_backs_off():
+    session = DroppingSession()
+    link = MqttLink(session, b"sens/test", 1)
+    link.publish(b"sample")
+    connects = []
+
+    async def wait():
+        await asyncio.sleep_ms(300)
+        connects.append(session.connects)
+
+    run_link(session, link, [wait])
+    #   500 ms before the second attempt
+    assert connects == [1]
+
+
+def test_backoff_reset_once_the_broker_answers():
+    session = DroppingSession()
+    link = MqttLink(session, b"sens/test", 1)
+    link.publish(b"sample")
+    connects = []
+
+    async def fail():
+        #   attempts at 0, 500, 700 and 900 ms: the backoff reaches backoff_max_ms
+        await asyncio.sleep_ms(1000)
+        connects.append(session.connects)
+
+    async def answer():
+        session.answering = True
+        await asyncio.sleep_ms(300)
+        connects.append(link.queued)
+        session.answering = False
+        link.publish(b"sample")
+        await asyncio.sleep_ms(300)
+        connects.append(session.connects)
+
+    run_link(session, link, [fail, answer])
+    assert connects[0] == 4
+    assert connects[1] == 0
+    #   dropped again: the next attempt comes after 500 ms, not backoff_max_ms
+    assert connects[2] == 5
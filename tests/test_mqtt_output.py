@@ -0,0 +1,24 @@
+"""
+Connections of MqttClientPool: every one has its own client id on its paho client
+"""
+
+import pytest
+
+pytest.importorskip("paho.mqtt.client")
+
+from common.python.error import DOP_OK
+from python_sensor.sensor.mqtt_output import MqttClient, MqttClientPool
+
+CONNSTRING = "host=127.0.0.1;port=1883;topic=test;prefix=test_;pool=2"
+
+
+def test_pool_client_ids(monkeypatch):
+    #   no broker: the paho clients are created, not connected
+    monkeypatch.setattr(MqttClient, "_open", lambda self: DOP_OK)
+    pool = MqttClientPool()
+    assert not pool.init(CONNSTRING).isError()
+    assert not pool.open().isError()
+
+    ids = [client._output_client._client_id for client in pool._clients]
+    assert ids[0] != ids[1]
+    assert ids == [client._client_id.encode() for client in pool._clients]
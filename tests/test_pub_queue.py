@@ -0,0 +1,118 @@
+"""
+PubQueue, and the queue mode of PubStackStub
+"""
+
+import threading
+
+from common.python.error import DopError, DOP_OK
+from dvco_stub.pub_queue import PubQueue
+from dvco_stub.pub_stack_stub import PubStackStub
+
+
+def test_queue_fifo():
+    queue = PubQueue()
+    for i in range(5):
+        assert queue.put(b"m%d" % i)
+    assert len(queue) == 5
+    assert queue.take(2) == [b"m0", b"m1"]
+    assert queue.take() == [b"m2", b"m3", b"m4"]
+    assert queue.take() == []
+
+
+def test_queue_bound():
+    queue = PubQueue(3)
+    assert [queue.put(b"m%d" % i) for i in range(5)] == [True, True, True, False, False]
+    assert queue.put_many([b"x", b"y"]) == 0
+    assert queue.take(1) == [b"m0"]
+    assert queue.put_many([b"x", b"y"]) == 1
+    assert queue.take() == [b"m1", b"m2", b"x"]
+    stats = queue.stats()
+    assert (stats['depth'], stats['enqueued'], stats['drained'], stats['dropped']) == (0, 4, 4, 5)
+
+
+def make_stack(**conf) -> tuple:
+    stack = PubStackStub()
+    stack.init(dict(queue=1, **conf))
+    published = []
+    stack.set_pub_callback(lambda payload, userdata: published.append(payload))
+    return stack, published
+
+
+def test_stub_queue_pump():
+    stack, published = make_stack(batch_size=2)
+    assert stack.next_pump_ms() == -1
+    for i in range(5):
+        err, mess = stack.dopify(b"m%d" % i)
+        assert not err.isError()
+    #   queued, handed to the callback by pump()
+    assert published == []
+    assert stack.next_pump_ms() == 0
+    stack.pump()
+    assert published == [b"m%d" % i for i in range(5)]
+    assert stack.next_pump_ms() == -1
+    assert stack.stats()['drained'] == 5
+
+
+def test_stub_queue_full():
+    stack, published = make_stack(queue_size=2)
+    assert [stack.dopify(b"m%d" % i)[0].code for i in range(3)] == [0, 0, 301]
+    stack.pump()
+    assert published == [b"m0", b"m1"]
+    assert stack.stats()['dropped'] == 1
+
+
+def test_stub_failed_callback():
+    stack, published = make_stack()
+    stack.set_pub_batch_callback(lambda batch, userdata: [DOP_OK if m == b"ok" else DopError(100, "publish failed")
+                                                          for m in batch])
+    stack.dopify(b"ok")
+    stack.dopify(b"ko")
+    stack.pump()
+    assert stack.stats()['failed'] == 1
+
+
+def test_stub_flush_and_take_pending():
+    stack, published = make_stack()
+    for i in range(3):
+        stack.dopify(b"m%d" % i)
+    #   no time left: nothing is handed
+    assert stack.flush(0) == 0
+    assert stack.flush(1000) == 3
+    assert published == [b"m0", b"m1", b"m2"]
+
+    stack.dopify(b"m3")
+    stack.dopify(b"m4")
+    assert stack.take_pending() == [b"m3", b"m4"]
+    assert stack.take_pending() == []
+    stack.pump()
+    assert published == [b"m0", b"m1", b"m2"]
+
+
+def test_stub_without_queue():
+    stack = PubStackStub()
+    stack.init({})
+    published = []
+    stack.set_pub_callback(lambda payload, userdata: published.append(payload))
+    stack.dopify(b"m0")
+    assert published == [b"m0"]
+    assert stack.flush(1000) == 0
+    assert stack.take_pending() == []
+
+
+def test_stub_queue_workers():
+    stack, published = make_stack(workers=1)
+    done = threading.Event()
+
+    def callback(payload, userdata):
+        published.append(payload)
+        if len(published) == 3:
+            done.set()
+
+    stack.set_pub_callback(callback)
+    for i in range(3):
+        stack.dopify(b"m%d" % i)
+    assert done.wait(5)
+    assert published == [b"m0", b"m1", b"m2"]
+    #   drained by the worker, not by pump()
+    assert stack.next_pump_ms() == -1
+    stack._stop_event.stop()
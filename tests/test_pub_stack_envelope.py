@@ -0,0 +1,112 @@
+"""
+ChaCha20 against the RFC 8439 vectors, and the envelopes of PubStackEnvelope
+"""
+
+import pytest
+
+from dvco_stub.chacha20 import ChaCha20
+from dvco_stub.pub_stack_envelope import PubStackEnvelope, ENVELOPE_OVERHEAD
+
+KEY = bytes(range(32))
+
+#   RFC 8439, 2.3.2: block function, counter 1
+BLOCK_NONCE = bytes.fromhex("000000090000004a00000000")
+BLOCK = bytes.fromhex(
+    "10f1e7e4d13b5915500fdd1fa32071c4c7d1f4c733c068030422aa9ac3d46c4e"
+    "d2826446079faa0914c2d705d98b02a2b5129cd1de164eb9cbd083e8a2503c4e")
+
+#   RFC 8439, 2.4.2: encryption, initial counter 1
+STREAM_NONCE = bytes.fromhex("000000000000004a00000000")
+PLAINTEXT = (b"Ladies and Gentlemen of the class of '99: If I could offer you only one tip "
+             b"for the future, sunscreen would be it.")
+CIPHERTEXT = bytes.fromhex(
+    "6e2e359a2568f98041ba0728dd0d6981e97e7aec1d4360c20a27afccfd9fae0b"
+    "f91b65c5524733ab8f593dabcd62b3571639d624e65152ab8f530c359f0861d8"
+    "07ca0dbf500d6a6156a38e088a22b65e52bc514d16ccf806818ce91ab7793736"
+    "5af90bbf74a35be6b40b8eedf2785e42874d")
+
+
+def test_chacha20_block():
+    out = bytearray(64)
+    ChaCha20(KEY).block(BLOCK_NONCE, 1, out)
+    assert bytes(out) == BLOCK
+
+
+def test_chacha20_stream():
+    out = bytearray(len(PLAINTEXT))
+    ChaCha20(KEY).xor_into(STREAM_NONCE, PLAINTEXT, out, counter=1)
+    assert bytes(out) == CIPHERTEXT
+    clear = bytearray(len(CIPHERTEXT))
+    ChaCha20(KEY).xor_into(STREAM_NONCE, CIPHERTEXT, clear, counter=1)
+    assert bytes(clear) == PLAINTEXT
+
+
+def test_chacha20_offset():
+    out = bytearray(4 + len(PLAINTEXT))
+    ChaCha20(KEY).xor_into(STREAM_NONCE, PLAINTEXT, out, 4, 1)
+    assert bytes(out[4:]) == CIPHERTEXT
+
+
+def test_chacha20_key_size():
+    with pytest.raises(ValueError):
+        ChaCha20(bytes(16))
+
+
+@pytest.fixture
+def stack():
+    stack = PubStackEnvelope()
+    assert not stack.init({"product_key": "secret", "product_id": "co2"}).isError()
+    return stack
+
+
+@pytest.mark.parametrize("message", [b"", b"x", PLAINTEXT, bytes(range(256)) * 3])
+def test_seal_unseal(stack, message):
+    envelope = stack.seal(message)
+    assert len(envelope) - len(message) == stack.overhead() == ENVELOPE_OVERHEAD
+    #   a short message may appear by chance in the random nonce and ciphertext
+    if len(message) >= 8:
+        assert message not in envelope
+    err, clear = stack.unseal(envelope)
+    assert not err.isError()
+    assert clear == message
+
+
+def test_seal_memoryview(stack):
+    err, clear = stack.unseal(stack.seal(memoryview(bytearray(PLAINTEXT))))
+    assert clear == PLAINTEXT
+
+
+def test_nonces_differ(stack):
+    assert stack.seal(PLAINTEXT) != stack.seal(PLAINTEXT)
+
+
+@pytest.mark.parametrize("position", [1, 5, 17, 40, -16, -1])
+def test_tampered_envelope(stack, position):
+    #   epoch, nonce, ciphertext and tag bytes
+    envelope = bytearray(stack.seal(PLAINTEXT))
+    envelope[position] ^= 0x01
+    err, clear = stack.unseal(bytes(envelope))
+    assert err.code == 312
+    assert clear == b""
+
+
+def test_bad_envelope(stack):
+    envelope = bytearray(stack.seal(PLAINTEXT))
+    assert stack.unseal(bytes(envelope[:ENVELOPE_OVERHEAD - 1]))[0].code == 310
+    envelope[0] ^= 0xFF
+    assert stack.unseal(bytes(envelope))[0].code == 311
+
+
+def test_other_product_key(stack):
+    other = PubStackEnvelope()
+    other.init({"product_key": "other", "product_id": "co2"})
+    assert other.unseal(stack.seal(PLAINTEXT))[0].code == 312
+
+
+def test_dopify_publishes_envelope(stack):
+    published = []
+    stack.set_pub_callback(lambda payload, userdata: published.append(bytes(payload)))
+    err, envelope = stack.dopify(PLAINTEXT)
+    assert not err.isError()
+    assert published == [envelope]
+    assert stack.unseal(published[0])[1] == PLAINTEXT
@@ -0,0 +1,91 @@
+"""
+PubStackHost: the messages of every product on its topic, with its own metrics
+"""
+
+import pytest
+
+from common.python.error import DopError, DOP_OK
+from dvco_stub.pub_stack_host import PubStackHost
+
+
+@pytest.fixture
+def host():
+    host = PubStackHost()
+    assert not host.add_product("co2", {"topic": "dop/co2"}).isError()
+    assert not host.add_product("temp", {"topic": "dop/temp", "queue": 1}).isError()
+    host.published = []
+
+    def output(payload, topic, userdata):
+        host.published.append((bytes(payload), topic))
+        return DopError(100, "publish failed") if payload == b"ko" else DOP_OK
+
+    host.set_output(output)
+    return host
+
+
+def test_routing(host):
+    host.dopify("co2", b"c0")
+    host.dopify("temp", b"t0")
+    #   the queued product is published when pumped
+    assert host.published == [(b"c0", "dop/co2")]
+    assert host.next_pump_ms() == 0
+    host.pump()
+    assert host.published == [(b"c0", "dop/co2"), (b"t0", "dop/temp")]
+
+
+def test_dopify_all(host):
+    results = host.dopify_all(b"m")
+    assert sorted(results.keys()) == ["co2", "temp"]
+    host.pump()
+    assert sorted(host.published) == [(b"m", "dop/co2"), (b"m", "dop/temp")]
+
+
+def test_metrics_per_product(host):
+    host.dopify("co2", b"c00")
+    host.dopify("co2", b"ko")
+    host.dopify("temp", b"t0")
+    host.pump()
+    stats = host.stats()
+    assert (stats["co2"]["published"], stats["co2"]["failed"], stats["co2"]["bytes"]) == (1, 1, 3)
+    assert (stats["temp"]["published"], stats["temp"]["failed"], stats["temp"]["bytes"]) == (1, 0, 2)
+    #   the metrics of the stack are apart from those of the host
+    assert stats["co2"]["stack"] == {}
+    assert stats["temp"]["stack"]["drained"] == 1
+    assert stats["temp"]["topic"] == "dop/temp"
+
+
+def test_batch_output(host):
+    batches = []
+
+    def output_batch(payloads, topic, userdata):
+        batches.append((list(payloads), topic))
+        return [DOP_OK] * len(payloads)
+
+    host.set_output(None, output_batch)
+    host.pub_stack("temp").dopify_many([b"t0", b"t1"])
+    host.pump()
+    assert batches == [([b"t0", b"t1"], "dop/temp")]
+    assert host.stats()["temp"]["published"] == 2
+
+
+def test_unknown_product(host):
+    err, mess = host.dopify("nope", b"m")
+    assert err.code == 17
+    assert "nope" in err.msg
+    assert host.pub_stack("nope") is None
+    assert host.published == []
+
+
+def test_duplicated_and_invalid_product(host):
+    assert host.add_product("co2", {}).code == 16
+    assert host.add_product("other", {"pub_stack": "nope"}).code == 14
+    assert host.product_ids() == ["co2", "temp"]
+
+
+def test_shutdown(host):
+    host.dopify("temp", b"t0")
+    host.dopify("temp", b"t1")
+    assert host.take_pending() == [(b"t0", "dop/temp"), (b"t1", "dop/temp")]
+    host.dopify("temp", b"t2")
+    assert host.flush(1000) == 1
+    assert host.published == [(b"t2", "dop/temp")]
@@ -0,0 +1,78 @@
+"""
+Pub stacks selected by name through the registry
+"""
+
+import sys
+
+import pytest
+
+from dvco_stub import registry
+from dvco_stub.pub_stack_envelope import PubStackEnvelope
+from dvco_stub.pub_stack_stub import PubStackStub
+
+CUSTOM_STACK = '''
+from dvco_stub.pub_stack_stub import PubStackStub
+
+
+class PubStackCustom(PubStackStub):
+
+    def init(self, pub_conf: dict):
+        super().init(pub_conf)
+        self.custom = pub_conf.get("custom")
+'''
+
+
+@pytest.fixture
+def pub_stacks(monkeypatch):
+    #   the registrations of a test do not outlive it
+    monkeypatch.setattr(registry, "_pub_stacks", dict(registry._pub_stacks))
+
+
+def test_default_stack():
+    err, stack = registry.create_pub_stack({})
+    assert not err.isError()
+    assert type(stack) is PubStackStub
+
+
+def test_named_stack():
+    err, stack = registry.create_pub_stack({"pub_stack": "envelope", "product_key": "secret"})
+    assert not err.isError()
+    assert isinstance(stack, PubStackEnvelope)
+
+
+def test_unknown_stack():
+    err, stack = registry.create_pub_stack({"pub_stack": "nope"})
+    assert err.code == 14
+    assert "nope" in err.msg
+    assert stack is None
+
+
+def test_init_error():
+    #   the envelope stack requires product_key
+    err, stack = registry.create_pub_stack({"pub_stack": "envelope"})
+    assert err.code == 12
+    assert stack is None
+
+
+def test_register_stack(pub_stacks, tmp_path, monkeypatch):
+    (tmp_path / "custom_pub_stack.py").write_text(CUSTOM_STACK)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    registry.register_pub_stack("custom", "custom_pub_stack", "PubStackCustom")
+    assert "custom" in registry.pub_stack_names()
+    #   imported only once selected
+    assert "custom_pub_stack" not in sys.modules
+
+    err, stack = registry.create_pub_stack({"pub_stack": "custom", "custom": 7})
+    assert not err.isError()
+    assert type(stack).__name__ == "PubStackCustom"
+    assert stack.custom == 7
+    monkeypatch.delitem(sys.modules, "custom_pub_stack")
+
+
+def test_register_missing_module(pub_stacks):
+    registry.register_pub_stack("missing", "no_such_module", "PubStackMissing")
+    err, stack = registry.create_pub_stack({"pub_stack": "missing"})
+    assert err.code == 15
+    assert stack is None
+    registry.register_pub_stack("no_class", "dvco_stub.pub_stack_stub", "PubStackMissing")
+    assert registry.load_pub_stack("no_class")[0].code == 15
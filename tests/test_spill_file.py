@@ -0,0 +1,156 @@
+"""
+Spill file: messages saved on shutdown and replayed at the next start
+"""
+
+import os
+from threading import Lock
+
+import pytest
+
+from common.python.error import DopError, DOP_OK
+from python_sensor.sensor.spill_file import spill_messages, load_spilled, replace_spilled
+
+MESSAGES = [(b"m0", "dop/a"), (b"\x00\xff", None), (b"m2", "dop/b")]
+
+
+@pytest.fixture
+def spill_file(tmp_path):
+    return str(tmp_path / "spill.jsonl")
+
+
+def test_round_trip(spill_file):
+    assert load_spilled(spill_file)[1] == []
+    assert not spill_messages(spill_file, MESSAGES[:2]).isError()
+    #   appended, e.g. by a second shutdown before a replay
+    assert not spill_messages(spill_file, [(memoryview(b"m2"), "dop/b")]).isError()
+    err, messages = load_spilled(spill_file)
+    assert not err.isError()
+    assert messages == MESSAGES
+
+
+def test_str_payload(spill_file):
+    spill_messages(spill_file, [("température", None)])
+    assert load_spilled(spill_file)[1] == [("température".encode("UTF-8"), None)]
+
+
+def test_cannot_write(tmp_path):
+    assert spill_messages(str(tmp_path / "none" / "spill.jsonl"), MESSAGES).code == 401
+
+
+@pytest.mark.parametrize("line", [
+    '{"topic": "dop/c", "payl',                 #   truncated
+    '{"topic": "dop/c"}',                       #   no payload
+    '{"topic": "dop/c", "payload": "m$%"}',     #   not base64
+    '[1, 2]',
+])
+def test_corrupt_line_skipped(spill_file, line):
+    spill_messages(spill_file, MESSAGES[:1])
+    with open(spill_file, "a") as f:
+        f.write(line + "\n")
+    spill_messages(spill_file, MESSAGES[2:])
+    err, messages = load_spilled(spill_file)
+    assert err.code == 404
+    assert messages == [MESSAGES[0], MESSAGES[2]]
+
+
+def test_unreadable_file(spill_file):
+    with open(spill_file, "wb") as f:
+        f.write(b"\xff\xfe\x00\n")
+    err, messages = load_spilled(spill_file)
+    assert (err.code, messages) == (402, [])
+
+
+def test_replace(spill_file):
+    spill_messages(spill_file, MESSAGES)
+    assert not replace_spilled(spill_file, MESSAGES[1:2]).isError()
+    assert load_spilled(spill_file)[1] == MESSAGES[1:2]
+    assert not replace_spilled(spill_file, []).isError()
+    assert not os.path.exists(spill_file)
+    #   nothing to remove
+    assert not replace_spilled(spill_file, []).isError()
+
+
+class FakeOutput:
+    """ Output provider of the sensor programs: the messages written are
+    published unless their payload is in failing; take_outstanding() gives
+    those left unacknowledged. """
+
+    def __init__(self, unacked: list = None, failing: tuple = ()):
+        self.published: list = []
+        self.unacked: list = unacked or []
+        self.failing = failing
+
+    def write(self, payload, topic) -> DopError:
+        if payload in self.failing:
+            return DopError(201, "publish failed")
+        self.published.append((payload, topic))
+        return DOP_OK
+
+    def outstanding(self) -> int:
+        return len(self.unacked) + 2
+
+    def wait_outstanding(self, timeout: float):
+        pass
+
+    def take_outstanding(self) -> list:
+        unacked, self.unacked = self.unacked, []
+        return unacked
+
+
+@pytest.fixture
+def sensor(monkeypatch):
+    pytest.importorskip("paho.mqtt.client")
+    import sensor
+    monkeypatch.setattr(sensor, "global_print_lock", Lock(), raising=False)
+    return sensor
+
+
+def test_shutdown_then_replay(sensor, spill_file, capsys):
+    sensor.shutdown(FakeOutput(unacked=list(MESSAGES)), 0, spill_file)
+    assert '"drained": 2, "spilled": 3, "dropped": 0' in capsys.readouterr().out
+
+    output = FakeOutput()
+    sensor.replay_spilled(output, spill_file)
+    assert output.published == MESSAGES
+    #   removed once replayed
+    assert not os.path.exists(spill_file)
+    assert '"replayed": 3, "failed": 0' in capsys.readouterr().out
+
+
+def test_shutdown_without_spill_file(sensor, capsys):
+    sensor.shutdown(FakeOutput(unacked=list(MESSAGES)), 0, None)
+    assert '"spilled": 0, "dropped": 3' in capsys.readouterr().out
+
+
+def test_replay_keeps_failed(sensor, spill_file):
+    spill_messages(spill_file, MESSAGES)
+    output = FakeOutput(failing=(b"m2",))
+    sensor.replay_spilled(output, spill_file)
+    assert output.published == MESSAGES[:2]
+    assert load_spilled(spill_file)[1] == MESSAGES[2:]
+
+    #   tried again at the following start
+    output = FakeOutput()
+    sensor.replay_spilled(output, spill_file)
+    assert output.published == MESSAGES[2:]
+    assert not os.path.exists(spill_file)
+
+
+def test_replay_truncated(sensor, spill_file, capsys):
+    spill_messages(spill_file, MESSAGES)
+    with open(spill_file, "a") as f:
+        f.write('{"topic": "dop/c", "pay')
+    output = FakeOutput()
+    sensor.replay_spilled(output, spill_file)
+    assert output.published == MESSAGES
+    assert not os.path.exists(spill_file)
+    assert '"code": 404' in capsys.readouterr().out
+
+
+def test_replay_unreadable_left_in_place(sensor, spill_file):
+    with open(spill_file, "wb") as f:
+        f.write(b"\xff\xfe\x00\n")
+    output = FakeOutput()
+    sensor.replay_spilled(output, spill_file)
+    assert output.published == []
+    assert os.path.exists(spill_file)
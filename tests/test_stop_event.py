@@ -0,0 +1,82 @@
+"""
+Behaviour of the DopStopEvent implementations: wait(timeout) must behave as
+threading.Event.wait. The timings are reported by benchmarks/bench_stop_event.py.
+"""
+
+import threading
+import time
+
+import pytest
+
+import common.python.dop_stop_event as dop_stop_event
+import common.python.dop_stop_event_mpy as dop_stop_event_mpy
+
+TIMEOUT = 0.2
+
+
+@pytest.fixture(params=[dop_stop_event.DopStopEvent, dop_stop_event_mpy.DopStopEvent],
+                ids=["threading", "mpy"])
+def event(request):
+    return request.param()
+
+
+def stop_later(event, delay: float) -> threading.Thread:
+    thread = threading.Timer(delay, event.stop)
+    thread.start()
+    return thread
+
+
+def test_wait_times_out(event):
+    start = time.monotonic()
+    assert event.wait(TIMEOUT) is False
+    assert time.monotonic() - start >= TIMEOUT * 0.9
+    assert not event.is_exiting()
+
+
+def test_stop_wakes_up_timed_wait(event):
+    stopper = stop_later(event, TIMEOUT / 2)
+    start = time.monotonic()
+    assert event.wait(TIMEOUT * 10) is True
+    assert time.monotonic() - start < TIMEOUT * 5
+    stopper.join()
+
+
+def test_stop_wakes_up_untimed_wait(event):
+    stopper = stop_later(event, TIMEOUT / 2)
+    assert event.wait(None) is True
+    stopper.join()
+
+
+def test_wait_on_stopped_event_returns_at_once(event):
+    event.stop()
+    start = time.monotonic()
+    assert event.wait(TIMEOUT) is True
+    assert time.monotonic() - start < TIMEOUT / 2
+    assert event.is_exiting()
+
+
+def test_listeners_are_called_on_stop(event):
+    calls = []
+    event.add_listener(lambda: calls.append("before"))
+    event.stop()
+    event.add_listener(lambda: calls.append("after"))
+    assert calls == ["before", "after"]
+
+
+def test_stop_wakes_up_every_waiter(event):
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(event.wait(TIMEOUT * 10)))
+               for _ in range(4)]
+    for waiter in waiters:
+        waiter.start()
+    time.sleep(TIMEOUT / 2)
+    event.stop()
+    for waiter in waiters:
+        waiter.join()
+    assert results == [True] * 4
+
+
+def test_mpy_timed_out_waiter_is_released():
+    event = dop_stop_event_mpy.DopStopEvent()
+    assert event.wait(0.05) is False
+    assert event._waiters == []
@@ -0,0 +1,90 @@
+"""
+Restart policy of DopSupervisor: backoff, reset after a healthy run, stop
+"""
+
+import threading
+import time
+
+from common.python.dop_stop_event import DopStopEvent
+from common.python.supervisor import DopSupervisor
+
+
+class RecordingStopEvent(DopStopEvent):
+    """ Backoff waits return at once; the event is set at the waits-th one. """
+
+    def __init__(self, waits: int):
+        super().__init__()
+        self.waits = waits
+        self.delays: list = []
+
+    def wait(self, timeout: float = None) -> bool:
+        self.delays.append(timeout)
+        if len(self.delays) >= self.waits:
+            self.stop()
+        return self.is_exiting()
+
+
+def failing(calls: list):
+    calls.append(time.monotonic())
+    raise RuntimeError(f"failure {len(calls)}")
+
+
+def test_backoff_doubles_up_to_max():
+    stop_event = RecordingStopEvent(6)
+    supervisor = DopSupervisor(stop_event, min_backoff=1, max_backoff=8)
+    calls = []
+    worker = supervisor.add_worker("w", failing, (calls,))
+    supervisor.start()
+    supervisor.join()
+    assert stop_event.delays == [1, 2, 4, 8, 8, 8]
+    assert len(calls) == 6
+    #   the last wait is interrupted by the stop: no restart
+    assert worker.restarts == 5
+    assert supervisor.status()["w"]["last_error"] == "RuntimeError: failure 6"
+
+
+def test_backoff_reset_after_healthy_run():
+    stop_event = RecordingStopEvent(5)
+    supervisor = DopSupervisor(stop_event, min_backoff=1, max_backoff=60)
+    calls = []
+
+    def worker_target():
+        calls.append(1)
+        #   the third run produces a good reading before failing
+        if len(calls) == 3:
+            supervisor.beat("w")
+        raise RuntimeError("failure")
+
+    supervisor.add_worker("w", worker_target)
+    supervisor.start()
+    supervisor.join()
+    assert stop_event.delays == [1, 2, 1, 2, 4]
+
+
+def test_done_worker_not_restarted():
+    stop_event = RecordingStopEvent(1)
+    supervisor = DopSupervisor(stop_event)
+    calls = []
+    worker = supervisor.add_worker("w", calls.append, (1,))
+    supervisor.start()
+    supervisor.join()
+    assert calls == [1]
+    assert stop_event.delays == []
+    assert worker.restarts == 0
+    assert not worker.is_alive()
+
+
+def test_stop_during_backoff():
+    stop_event = DopStopEvent()
+    supervisor = DopSupervisor(stop_event, min_backoff=30)
+    calls = []
+    worker = supervisor.add_worker("w", failing, (calls,))
+    start = time.monotonic()
+    supervisor.start()
+    threading.Timer(0.1, stop_event.stop).start()
+    supervisor.join()
+    #   the 30 s backoff is cut short
+    assert time.monotonic() - start < 5
+    assert len(calls) == 1
+    assert worker.restarts == 0
+    assert not worker.is_alive()